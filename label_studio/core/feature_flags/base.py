@@ -1,8 +1,12 @@
 import logging
+import time
+from threading import local
 
 import ldclient
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from django.core.signals import request_finished
+from django.dispatch import receiver
 from ldclient.config import Config, HTTPConfig
 from ldclient.feature_store import CacheConfig
 from ldclient.integrations import Files, Redis
@@ -79,6 +83,78 @@ def _get_user_repr(user):
     return user_data
 
 
+class FlagScope:
+    """Flag values of one request or RQ job with counters of flag checks and real evaluations"""
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.values = {}
+        self.calls = 0
+        self.evaluations = 0
+
+
+_scope = local()
+# values for the anonymous (system) user shared by the whole process: {key: (expires_at, value)}
+_anonymous_values = {}
+
+
+def _current_job_id():
+    # rq keeps the running jobs in a stack, get_current_job() would fetch the job from redis on every call
+    try:
+        from rq.job import _job_stack
+    except ImportError:
+        return None
+    # job scopes are told from request scopes by the string owner in drop_flag_scope
+    return getattr(_job_stack.top, 'id', None)
+
+
+def get_flag_scope():
+    """Flag cache of the current request or RQ job, None outside of them"""
+    request = get_current_request()
+    owner = request if request is not None else _current_job_id()
+    if owner is None:
+        return None
+    scope = getattr(_scope, 'current', None)
+    if scope is None or scope.owner != owner:
+        scope = _scope.current = FlagScope(owner)
+    return scope
+
+
+@receiver(request_finished)
+def drop_flag_scope(sender, **kwargs):
+    scope = getattr(_scope, 'current', None)
+    if scope is not None and not isinstance(scope.owner, str):
+        logger.debug(
+            f'Feature flags checked {scope.calls} times with {scope.evaluations} evaluations in {scope.owner}'
+        )
+        del _scope.current
+
+
+def _variation(feature_flag, user, system_default):
+    """Flag value from the request/job scope, the process cache for the anonymous user or the client"""
+    anonymous = bool(user.is_anonymous)
+    key = (feature_flag, None if anonymous else user.pk, system_default)
+    scope = get_flag_scope()
+    if scope is not None:
+        scope.calls += 1
+        if key in scope.values:
+            return scope.values[key]
+
+    cached = _anonymous_values.get(key) if anonymous else None
+    if cached and cached[0] > time.monotonic():
+        value = cached[1]
+    else:
+        value = client.variation(feature_flag, _get_user_repr(user), system_default)
+        if scope is not None:
+            scope.evaluations += 1
+        if anonymous and settings.FEATURE_FLAGS_CACHE_TTL > 0:
+            _anonymous_values[key] = (time.monotonic() + settings.FEATURE_FLAGS_CACHE_TTL, value)
+
+    if scope is not None:
+        scope.values[key] = value
+    return value
+
+
 def flag_set(feature_flag, user=None, override_system_default=None):
     """Use this method to check whether this flag is set ON to the current user, to split the logic on backend
     For example,
@@ -107,7 +183,6 @@ def flag_set(feature_flag, user=None, override_system_default=None):
         if request and getattr(request, 'user', None) and request.user.is_authenticated:
             user = request.user
 
-    user_dict = _get_user_repr(user)
     env_value = get_bool_env(feature_flag, default=None)
     if env_value is not None:
         return env_value
@@ -115,7 +190,7 @@ def flag_set(feature_flag, user=None, override_system_default=None):
         system_default = override_system_default
     else:
         system_default = settings.FEATURE_FLAGS_DEFAULT_VALUE
-    return client.variation(feature_flag, user_dict, system_default)
+    return _variation(feature_flag, user, system_default)
 
 
 def all_flags(user):
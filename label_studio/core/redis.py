@@ -58,10 +58,10 @@ def redis_hget(key1, key2):
     return _redis.hget(key1, key2)
 
 
-def redis_set(key, value, ttl=None):
+def redis_set(key, value, ttl=None, nx=False):
     if not redis_healthcheck():
         return
-    return _redis.set(key, value, ex=ttl)
+    return _redis.set(key, value, ex=ttl, nx=nx)
 
 
 def redis_hset(key1, key2, value):
@@ -76,6 +76,38 @@ def redis_delete(key):
     return _redis.delete(key)
 
 
+def redis_hincrby(key, counters):
+    """Increment several integer fields of a hash in one round trip"""
+    if not redis_healthcheck():
+        return
+    pipeline = _redis.pipeline(transaction=False)
+    for field, amount in counters.items():
+        pipeline.hincrby(key, field, amount)
+    return pipeline.execute()
+
+
+def redis_hgetall(key):
+    if not redis_healthcheck():
+        return {}
+    return _redis.hgetall(key)
+
+
+def redis_rpush(key, *values):
+    if not redis_healthcheck():
+        return
+    return _redis.rpush(key, *values)
+
+
+def redis_pop_all(key):
+    """Read and remove all items of a list atomically"""
+    if not redis_healthcheck():
+        return []
+    pipeline = _redis.pipeline()
+    pipeline.lrange(key, 0, -1)
+    pipeline.delete(key)
+    return pipeline.execute()[0]
+
+
 def start_job_async_or_sync(job, *args, in_seconds=0, **kwargs):
     """
     Start job async with redis or sync if redis is not connected
@@ -472,6 +472,35 @@ os.makedirs(EXPORT_DIR, exist_ok=True)
 # dir for delayed export
 DELAYED_EXPORT_DIR = 'export'
 os.makedirs(os.path.join(BASE_DATA_DIR, MEDIA_ROOT, DELAYED_EXPORT_DIR), exist_ok=True)
+# snapshot exports are split into shards of that many tasks, shards run as separate jobs and are resumable
+EXPORT_SHARD_SIZE = int(get_env('EXPORT_SHARD_SIZE', 10000))
+# delta exports start this many seconds before the watermark of their base export, so changes of transactions
+# running while the base export was taken are not lost, it should exceed the longest transaction
+EXPORT_DELTA_WATERMARK_MARGIN = int(get_env('EXPORT_DELTA_WATERMARK_MARGIN', 600))
+
+# project dataframe snapshots for the visualization api
+VISUALIZATION_CACHE_ENABLED = get_bool_env('VISUALIZATION_CACHE_ENABLED', True)
+VISUALIZATION_CACHE_DIR = get_env('VISUALIZATION_CACHE_DIR', os.path.join(BASE_DATA_DIR, 'visualization_cache'))
+# project frames kept in memory per process, least recently used are dropped
+VISUALIZATION_CACHE_LOADED_PROJECTS = int(get_env('VISUALIZATION_CACHE_LOADED_PROJECTS', 4))
+# tasks serialized per query batch when building project frames
+VISUALIZATION_BATCH_SIZE = int(get_env('VISUALIZATION_BATCH_SIZE', 5000))
+# sql engine for visualization queries: sqlite (same dialect as pandasql), duckdb, pandasql,
+# auto (duckdb if installed); duckdb is faster but has its own SQL dialect, so saved queries may need changes
+VISUALIZATION_SQL_ENGINE = get_env('VISUALIZATION_SQL_ENGINE', 'sqlite')
+# number of project frames kept registered in the sql engine per process
+VISUALIZATION_SQL_ENGINE_MAX_TABLES = int(get_env('VISUALIZATION_SQL_ENGINE_MAX_TABLES', 8))
+# rendered pages between progress updates of visualization report jobs
+VISUALIZATION_REPORT_PROGRESS_STEP = int(get_env('VISUALIZATION_REPORT_PROGRESS_STEP', 10))
+
+# dropbox media thumbnails, generated once per source file and evicted least recently used first
+DROPBOX_THUMBNAIL_CACHE_DIR = get_env('DROPBOX_THUMBNAIL_CACHE_DIR', os.path.join(BASE_DATA_DIR, 'thumbnails'))
+DROPBOX_THUMBNAIL_CACHE_MAX_SIZE = int(get_env('DROPBOX_THUMBNAIL_CACHE_MAX_SIZE', 512 * 1024 * 1024))
+DROPBOX_THUMBNAIL_SIZE = int(get_env('DROPBOX_THUMBNAIL_SIZE', 100))
+# browser cache lifetime of thumbnail responses, revalidated with ETag/Last-Modified afterwards
+DROPBOX_THUMBNAIL_MAX_AGE = int(get_env('DROPBOX_THUMBNAIL_MAX_AGE', 3600))
+# threads decoding images and running ffmpeg when thumbnails are pre-generated for uploaded files
+DROPBOX_THUMBNAIL_WORKERS = int(get_env('DROPBOX_THUMBNAIL_WORKERS', 4))
 
 # file / task size limits
 DATA_UPLOAD_MAX_MEMORY_SIZE = int(get_env('DATA_UPLOAD_MAX_MEMORY_SIZE', 250 * 1024 * 1024))
@@ -485,6 +514,13 @@ LABEL_STREAM_HISTORY_LIMIT = int(get_env('LABEL_STREAM_HISTORY_LIMIT', default=1
 
 RANDOM_NEXT_TASK_SAMPLE_SIZE = int(get_env('RANDOM_NEXT_TASK_SAMPLE_SIZE', 50))
 
+# pre-computed next task candidates per project and sampling mode, kept in redis
+NEXT_TASK_QUEUE_ENABLED = get_bool_env('NEXT_TASK_QUEUE_ENABLED', False)
+NEXT_TASK_QUEUE_SIZE = int(get_env('NEXT_TASK_QUEUE_SIZE', 500))
+# candidates checked against the database per request, the queue is refilled once it gets shorter
+NEXT_TASK_QUEUE_WINDOW = int(get_env('NEXT_TASK_QUEUE_WINDOW', 20))
+NEXT_TASK_QUEUE_TTL = int(get_env('NEXT_TASK_QUEUE_TTL', 600))
+
 TASK_API_PAGE_SIZE_MAX = int(get_env('TASK_API_PAGE_SIZE_MAX', 0)) or None
 
 # Email backend
@@ -584,8 +620,21 @@ PROJECT_DELETE = project_delete
 USER_AUTH = user_auth
 COLLECT_VERSIONS = collect_versions_dummy
 
+# Project list reads counters maintained in ProjectSummary, reconciled after changes with this delay in seconds
+PROJECT_COUNTERS_MATERIALIZED = get_bool_env('PROJECT_COUNTERS_MATERIALIZED', False)
+PROJECT_COUNTERS_RECONCILE_DELAY = int(get_env('PROJECT_COUNTERS_RECONCILE_DELAY', 60))
+# Overlap rearrangements of projects with this many tasks are recorded in AsyncMigrationStatus
+OVERLAP_REARRANGE_TRACKED_MIN_TASKS = int(get_env('OVERLAP_REARRANGE_TRACKED_MIN_TASKS', 100000))
+
 WEBHOOK_TIMEOUT = float(get_env('WEBHOOK_TIMEOUT', 1.0))
 WEBHOOK_BATCH_SIZE = int(get_env('WEBHOOK_BATCH_SIZE', 100))
+# Webhook delivery: parallel requests per event, retries of failed requests with exponential backoff
+WEBHOOK_CONCURRENCY = int(get_env('WEBHOOK_CONCURRENCY', 8))
+WEBHOOK_RETRIES = int(get_env('WEBHOOK_RETRIES', 2))
+WEBHOOK_RETRY_BACKOFF = float(get_env('WEBHOOK_RETRY_BACKOFF', 0.5))
+# Seconds to collect ANNOTATION_CREATED events into one ANNOTATIONS_CREATED payload, 0 sends every event,
+# requires redis and an rq worker with scheduler
+WEBHOOK_COALESCE_WINDOW = float(get_env('WEBHOOK_COALESCE_WINDOW', 0))
 WEBHOOK_SERIALIZERS = {
     'project': 'webhooks.serializers_for_hooks.ProjectWebhookSerializer',
     'task': 'webhooks.serializers_for_hooks.TaskWebhookSerializer',
@@ -617,6 +666,8 @@ FEATURE_FLAGS_FILE = get_env('FEATURE_FLAGS_FILE', 'feature_flags.json')
 FEATURE_FLAGS_OFFLINE = get_bool_env('FEATURE_FLAGS_OFFLINE', True)
 # default value for feature flags (if not overridden by environment or client)
 FEATURE_FLAGS_DEFAULT_VALUE = False
+# seconds to reuse flag values of the anonymous user between requests and jobs, 0 to evaluate them every time
+FEATURE_FLAGS_CACHE_TTL = float(get_env('FEATURE_FLAGS_CACHE_TTL', 5))
 
 # Whether to send analytics telemetry data. Fall back to old lowercase name for legacy compatibility.
 COLLECT_ANALYTICS = get_bool_env('COLLECT_ANALYTICS', get_bool_env('collect_analytics', True))
@@ -626,6 +677,11 @@ SVG_SECURITY_CLEANUP = get_bool_env('SVG_SECURITY_CLEANUP', False)
 
 ML_BLOCK_LOCAL_IP = get_bool_env('ML_BLOCK_LOCAL_IP', False)
 
+# Batch predictions: tasks per request to the ML backend, parallel requests and retries of a failed request
+ML_PREDICTION_CHUNK_SIZE = int(get_env('ML_PREDICTION_CHUNK_SIZE', 100))
+ML_PREDICTION_CONCURRENCY = int(get_env('ML_PREDICTION_CONCURRENCY', 4))
+ML_PREDICTION_RETRIES = int(get_env('ML_PREDICTION_RETRIES', 2))
+
 RQ_LONG_JOB_TIMEOUT = int(get_env('RQ_LONG_JOB_TIMEOUT', 36000))
 
 APP_WEBSERVER = get_env('APP_WEBSERVER', 'django')
@@ -636,6 +692,20 @@ FUTURE_SAVE_TASK_TO_STORAGE = get_bool_env('FUTURE_SAVE_TASK_TO_STORAGE', defaul
 FUTURE_SAVE_TASK_TO_STORAGE_JSON_EXT = get_bool_env('FUTURE_SAVE_TASK_TO_STORAGE_JSON_EXT', default=True)
 STORAGE_IN_PROGRESS_TIMER = float(get_env('STORAGE_IN_PROGRESS_TIMER', 5.0))
 STORAGE_EXPORT_CHUNK_SIZE = int(get_env('STORAGE_EXPORT_CHUNK_SIZE', 100))
+# Presigned URLs cache: max entries per process, part of presign_ttl the entries live, sharing through redis
+PRESIGN_CACHE_SIZE = int(get_env('PRESIGN_CACHE_SIZE', 10000))
+PRESIGN_CACHE_TTL_FRACTION = float(get_env('PRESIGN_CACHE_TTL_FRACTION', 0.5))
+PRESIGN_CACHE_REDIS = get_bool_env('PRESIGN_CACHE_REDIS', False)
+# Storage proxy streams objects of storages without presigned urls, recently viewed ones are kept on disk
+STORAGE_PROXY_ENABLED = get_bool_env('STORAGE_PROXY_ENABLED', True)
+STORAGE_PROXY_CACHE_DIR = get_env('STORAGE_PROXY_CACHE_DIR', os.path.join(BASE_DATA_DIR, 'cache', 'storage_proxy'))
+STORAGE_PROXY_CACHE_SIZE = int(get_env('STORAGE_PROXY_CACHE_SIZE', 2 * 1024**3))
+STORAGE_PROXY_CACHE_MAX_OBJECT_SIZE = int(get_env('STORAGE_PROXY_CACHE_MAX_OBJECT_SIZE', 256 * 1024**2))
+STORAGE_PROXY_MAX_AGE = int(get_env('STORAGE_PROXY_MAX_AGE', 3600))
+# Import storage sync: new objects per batch of bulk created tasks and parallel object reads
+STORAGE_IMPORT_BATCHED = get_bool_env('STORAGE_IMPORT_BATCHED', True)
+STORAGE_IMPORT_BATCH_SIZE = int(get_env('STORAGE_IMPORT_BATCH_SIZE', 500))
+STORAGE_IMPORT_CONCURRENCY = int(get_env('STORAGE_IMPORT_CONCURRENCY', 8))
 
 USE_NGINX_FOR_EXPORT_DOWNLOADS = get_bool_env('USE_NGINX_FOR_EXPORT_DOWNLOADS', False)
 
@@ -705,6 +775,12 @@ DATA_MANAGER_FILTER_ALLOWLIST = list(
     set(get_env_list('DATA_MANAGER_FILTER_ALLOWLIST') + ['updated_by__active_organization'])
 )
 
+# task.data keys used for ordering and filtering get a partial expression index once the project has that many tasks
+DATA_MANAGER_AUTO_INDEX_MIN_TASKS = int(get_env('DATA_MANAGER_AUTO_INDEX_MIN_TASKS', 100000))
+DATA_MANAGER_MAX_INDEXED_COLUMNS = int(get_env('DATA_MANAGER_MAX_INDEXED_COLUMNS', 8))
+# task list totals for keyset pagination are cached per view filters and dropped on task changes
+DATA_MANAGER_TOTALS_CACHE_TTL = int(get_env('DATA_MANAGER_TOTALS_CACHE_TTL', 600))
+
 if ENABLE_CSP := get_bool_env('ENABLE_CSP', True):
     CSP_DEFAULT_SRC = (
         "'self'",
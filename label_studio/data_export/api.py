@@ -2,8 +2,9 @@
 """
 import logging
 import os
+import tempfile
 import traceback as tb
-from datetime import datetime
+from datetime import datetime, timedelta
 from urllib.parse import urlparse
 import json
 from core.feature_flags import flag_set
@@ -29,7 +30,6 @@ from tasks.models import Task
 # Data Visualization
 from io import BytesIO
 import pandas as pd
-import pandasql as psql
 import matplotlib
 matplotlib.use('Agg')  # Use the 'Agg' backend, which doesn't require a GUI
 import matplotlib.pyplot as plt
@@ -37,7 +37,13 @@ from matplotlib.backends.backend_pdf import PdfPages
 
 import math
 
-from .models import ConvertedFormat, DataExport, Export
+from .dataframes import (
+    ProjectDataFrameCache,
+    get_categorical_columns,
+    get_project_base_dataframe,
+    profile_columns,
+)
+from .models import ConvertedFormat, DataExport, Export, VisualizationReport
 from .serializers import (
     ExportConvertSerializer,
     ExportCreateSerializer,
@@ -45,7 +51,10 @@ from .serializers import (
     ExportParamSerializer,
     ExportSerializer,
     VisualizationParamSerializer,
+    VisualizationReportCreateSerializer,
+    VisualizationReportSerializer,
 )
+from .sql_engines import get_sql_engine
 
 logger = logging.getLogger(__name__)
 
@@ -351,7 +360,8 @@ class ExportListAPI(generics.ListCreateAPIView):
         serialization_options = serializer.validated_data.pop('serialization_options')
 
         project = self._get_project()
-        serializer.save(project=project, created_by=self.request.user)
+        since = self._get_delta_since(project, task_filter_options)
+        serializer.save(project=project, created_by=self.request.user, since=since)
         instance = serializer.instance
 
         instance.run_file_exporting(
@@ -360,6 +370,26 @@ class ExportListAPI(generics.ListCreateAPIView):
             serialization_options=serialization_options,
         )
 
+    @staticmethod
+    def _get_delta_since(project, task_filter_options):
+        """Start of a delta export, base_export is replaced with its watermark in the stored options"""
+        if not task_filter_options:
+            return None
+        base_export_id = task_filter_options.pop('base_export', None)
+        since = task_filter_options.pop('since', None)
+        if base_export_id:
+            base_export = Export.objects.filter(
+                project=project, id=base_export_id, status=Export.Status.COMPLETED, watermark__isnull=False
+            ).first()
+            if base_export is None:
+                raise ValidationError({'task_filter_options': {'base_export': 'Completed export snapshot not found'}})
+            # changes committed after the watermark may carry an earlier updated_at, they are exported again
+            since = base_export.watermark - timedelta(seconds=settings.EXPORT_DELTA_WATERMARK_MARGIN)
+        if since:
+            # options are stored as json with the export
+            task_filter_options['since'] = since.isoformat()
+        return since
+
     def get_queryset(self):
         project = self._get_project()
         return super().get_queryset().filter(project=project)
@@ -467,6 +497,34 @@ class ExportDetailAPI(generics.RetrieveDestroyAPIView):
         return super().get_queryset().filter(project=project)
 
 
+def file_download_response(request, file):
+    """Response serving `file` from export storage, through NGINX when it's enabled"""
+    if isinstance(file.storage, FileSystemStorage):
+        url = file.storage.url(file.name)
+    else:
+        url = file.storage.url(file.name, storage_url=True)
+    protocol = urlparse(url).scheme
+
+    # NGINX downloads are a solid way to make uwsgi workers free
+    if settings.USE_NGINX_FOR_EXPORT_DOWNLOADS:
+        # let NGINX handle it
+        response = HttpResponse()
+        # below header tells NGINX to catch it and serve, see docker-config/nginx-app.conf
+        redirect = '/file_download/' + protocol + '/' + url.replace(protocol + '://', '')
+        response['X-Accel-Redirect'] = redirect
+        response['Content-Disposition'] = 'attachment; filename="{}"'.format(file.name)
+        response['filename'] = os.path.basename(file.name)
+        return response
+
+    # No NGINX: standard way for export downloads in the community edition
+    else:
+        ext = file.name.split('.')[-1]
+        response = RangedFileResponse(request, file, content_type=f'application/{ext}')
+        response['Content-Disposition'] = f'attachment; filename="{file.name}"'
+        response['filename'] = os.path.basename(file.name)
+        return response
+
+
 @method_decorator(
     name='get',
     decorator=swagger_auto_schema(
@@ -539,30 +597,7 @@ class ExportDownloadAPI(generics.RetrieveAPIView):
                     raise NotFound(f'{export_type} format is not converted yet')
                 file = converted_file.file
 
-            if isinstance(file.storage, FileSystemStorage):
-                url = file.storage.url(file.name)
-            else:
-                url = file.storage.url(file.name, storage_url=True)
-            protocol = urlparse(url).scheme
-
-            # NGINX downloads are a solid way to make uwsgi workers free
-            if settings.USE_NGINX_FOR_EXPORT_DOWNLOADS:
-                # let NGINX handle it
-                response = HttpResponse()
-                # below header tells NGINX to catch it and serve, see docker-config/nginx-app.conf
-                redirect = '/file_download/' + protocol + '/' + url.replace(protocol + '://', '')
-                response['X-Accel-Redirect'] = redirect
-                response['Content-Disposition'] = 'attachment; filename="{}"'.format(file.name)
-                response['filename'] = os.path.basename(file.name)
-                return response
-
-            # No NGINX: standard way for export downloads in the community edition
-            else:
-                ext = file.name.split('.')[-1]
-                response = RangedFileResponse(request, file, content_type=f'application/{ext}')
-                response['Content-Disposition'] = f'attachment; filename="{file.name}"'
-                response['filename'] = os.path.basename(file.name)
-                return response
+            return file_download_response(request, file)
         else:
             if export_type is None:
                 file_ = snapshot.file
@@ -672,89 +707,77 @@ class ExportConvertAPI(generics.RetrieveAPIView):
         )
         return Response({'export_type': export_type, 'converted_format': converted_format.id})
 
-def execute_sql_query(df: pd.DataFrame, query: str) -> pd.DataFrame:
+
+@method_decorator(
+    name='post',
+    decorator=swagger_auto_schema(
+        tags=['Export'],
+        operation_summary='Resume export',
+        operation_description="""
+        Resume a failed export snapshot, shards of tasks which were already exported are kept.
+        """,
+        manual_parameters=[
+            openapi.Parameter(
+                name='id',
+                type=openapi.TYPE_INTEGER,
+                in_=openapi.IN_PATH,
+                description='A unique integer value identifying this project.',
+            ),
+            openapi.Parameter(
+                name='export_pk',
+                type=openapi.TYPE_STRING,
+                in_=openapi.IN_PATH,
+                description='Primary key identifying the export file.',
+            ),
+        ],
+        responses={200: ExportSerializer()},
+    ),
+)
+class ExportResumeAPI(generics.GenericAPIView):
+    queryset = Export.objects.all()
+    serializer_class = ExportSerializer
+    lookup_url_kwarg = 'export_pk'
+    permission_required = all_permissions.projects_change
+
+    def get_queryset(self):
+        project = generics.get_object_or_404(Project.objects.for_user(self.request.user), pk=self.kwargs.get('pk'))
+        return super().get_queryset().filter(project=project)
+
+    def post(self, request, *args, **kwargs):
+        snapshot = self.get_object()
+        if not snapshot.resume():
+            raise ValidationError('Only failed exports with exported shards can be resumed')
+        snapshot.refresh_from_db()
+        return Response(self.get_serializer(snapshot).data)
+
+
+def execute_sql_query(df: pd.DataFrame, query: str, table_key=None) -> pd.DataFrame:
     """
     Execute an SQL query on a pandas DataFrame and return the result as a DataFrame.
 
     Args:
-        df (pd.DataFrame): The DataFrame to query.
+        df (pd.DataFrame): The DataFrame to query, available as table `df`.
         query (str): The SQL query to execute.
+        table_key: Hashable key identifying `df` contents, the engine keeps the table
+            registered under it and reuses it for the next queries with the same key.
 
     Returns:
         pd.DataFrame: The result of the query.
     """
-    df = pd.DataFrame(df)
-    for column in df.columns:
-        if df[column].apply(type).nunique() > 1 or df[column].dtype == 'object':
-            # Check if the column contains unsupported types (e.g., lists, dicts)
-            df[column] =  df[column].apply(lambda x: x if not isinstance(x, (list, dict)) else json.dumps(x))
-    
     # Create a temporary CSV file
     if os.environ.get("TOPAZ_DEBUG_MODE") == "true":
         temp_csv_path = '/tmp/df_query_data.csv'
         df.to_csv(temp_csv_path, index=False)
-    result_df = psql.sqldf(query, locals())
-    
-    # Post-processing step to rename columns to X, Y, and Z if not present
-    if 'X' not in result_df.columns or 'Y' not in result_df.columns:
-        num_columns = len(result_df.columns)
-        if num_columns >= 1:
-            result_df = result_df.rename(columns={result_df.columns[0]: 'X'})
-        if num_columns >= 2:
-            result_df = result_df.rename(columns={result_df.columns[1]: 'Y'})
-        if num_columns >= 3:
-            result_df = result_df.rename(columns={result_df.columns[2]: 'Z'})
-            
-    return result_df
 
-def get_project_dataframe(project_id, only_finished=True, ignore_keys=None):
-    project = Project.objects.get(id=project_id)
-    query = Task.objects.filter(project=project)
-    if only_finished:
-        query = query.filter(annotations__isnull=False).distinct()
+    return get_sql_engine().execute(df, query, table_key=table_key)
 
-    tasks = serialize_tasks(query)
-    df = pd.DataFrame(tasks)
+def get_project_dataframe(project_id, only_finished=True, ignore_keys=None):
+    df = get_project_base_dataframe(project_id, only_finished=only_finished)
+    snapshot_version = df.attrs.get('snapshot_version')
 
-    # Save initial DataFrame to file for debugging
-    
+    # Save DataFrame after normalizing 'data' and extracting annotations for debugging
     if os.environ.get("TOPAZ_DEBUG_MODE") == "true":
-        df.to_csv('/tmp/initial_dataframe.csv', index=False)
-
-    if 'data' in df.columns:
-        data_df = pd.json_normalize(df['data'].apply(lambda x: {k: v for k, v in x.items() if k != 'id'}))
-        df = pd.concat([df.drop(columns=['data']), data_df], axis=1)
-
-        # Save DataFrame after normalizing 'data' for debugging
-        
-        if os.environ.get("TOPAZ_DEBUG_MODE") == "true":
-            df.to_csv('/tmp/after_normalizing_data.csv', index=False)
-
-    if 'annotations' in df.columns:
-        def extract_annotation(annotation):
-            if 'value' in annotation and 'choices' in annotation['value']:
-                return annotation['value']['choices'][0]
-            return None
-
-        def extract_annotation_columns(annotations_column_data):
-            if annotations_column_data and isinstance(annotations_column_data, list) and len(annotations_column_data) > 0:
-                first_annotation = annotations_column_data[0]
-                if isinstance(first_annotation, list):
-                    keys = [annotation["from_name"] for annotation in first_annotation if "from_name" in annotation]
-                    values = [extract_annotation(annotation) for annotation in first_annotation]
-                    return dict(zip(keys, values))
-            return {}
-
-        annotation_data = df['annotations'].apply(extract_annotation_columns)
-        for key in set().union(*annotation_data.apply(lambda x: x.keys())):
-            df[key] = annotation_data.apply(lambda x: x.get(key))
-        
-        df = df.drop(columns=['annotations'])
-
-        # Save DataFrame after extracting annotations for debugging
-        
-        if os.environ.get("TOPAZ_DEBUG_MODE") == "true":
-            df.to_csv('/tmp/after_extracting_annotations.csv', index=False)
+        df.to_csv('/tmp/after_extracting_annotations.csv', index=False)
 
     # Handle NaN and infinite values
     df = df.fillna(0)  # Replace NaN with 0 or any other value you find appropriate
@@ -773,51 +796,38 @@ def get_project_dataframe(project_id, only_finished=True, ignore_keys=None):
     if os.environ.get("TOPAZ_DEBUG_MODE") == "true":
         df.to_csv('/tmp/after_dropping_ignore_keys.csv', index=False)
 
+    df.attrs['snapshot_version'] = snapshot_version
     return df
 
-def serialize_tasks(queryset):
-    tasks = []
-    for task in queryset:
-        task_data = {
-            'id': task.id,
-            'data': task.data,
-            'annotations': [ann.result for ann in task.annotations.all()],
-            'predictions': [pred.result for pred in task.predictions.all()],
-        }
-        tasks.append(task_data)
-    return tasks
+def get_project_dataframe_key(df, project_id, only_finished=True, ignore_keys=None):
+    """Key identifying contents of a get_project_dataframe result, None when it isn't served from a snapshot"""
+    version = df.attrs.get('snapshot_version')
+    if version is None:
+        return None
+    return project_id, version, only_finished, tuple(sorted(ignore_keys or []))
+
+def get_project_column_profile(project_id):
+    """Column profile of the whole project frame, stored with the snapshot and reused until tasks change"""
+    if not settings.VISUALIZATION_CACHE_ENABLED:
+        return profile_columns(get_project_dataframe(project_id, only_finished=False))
+
+    cache = ProjectDataFrameCache(project_id)
+    _, version = cache.refresh()
+    profile = cache.load_profile(version)
+    if profile is None:
+        df = get_project_dataframe(project_id, only_finished=False)
+        profile = profile_columns(df)
+        cache.store_profile(df.attrs['snapshot_version'], profile)
+    return profile
 
 class VisualizationAPI(APIView):
     permission_required = all_permissions.projects_view
     
     def get(self, request, *args, **kwargs):
         project_id = self.kwargs.get('pk')
-        include_all_tasks = True
-        ignore_keys = []
-
-        df = get_project_dataframe(project_id, only_finished=False, ignore_keys=ignore_keys)
-        
-        num_rows = len(df)
-        threshold = num_rows // 2
-        min_occurrences = int(0.01 * num_rows)  # Ensure at least 1
-        
-        categorical_columns = []
-        
-        for column in [col for col in df.columns if col not in ignore_keys and "model_enh" not in col and "modelName" not in col]:
-            try:
-                unique_values = df[column].nunique()
-                
-                if unique_values < threshold:
-                    value_counts = df[column].value_counts()
-                    
-                    # Check if each value occurs at least min_occurrences times
-                    if all(count >= min_occurrences for count in value_counts):
-                        categorical_columns.append(column)
-            except TypeError:
-                # Skip columns that can't be hashed (e.g., lists)
-                continue
+        profile = get_project_column_profile(project_id)
         response_data = {
-            'categorical_columns': categorical_columns
+            'categorical_columns': get_categorical_columns(profile)
         }
         
         return Response(response_data)
@@ -836,9 +846,10 @@ class VisualizationAPI(APIView):
                 return Response({'error': 'No SQL query provided'}, status=400)
 
             df = get_project_dataframe(project_id, only_finished, ignore_keys)
+            table_key = get_project_dataframe_key(df, project_id, only_finished, ignore_keys)
 
             # Execute the SQL query
-            result_df = execute_sql_query(df, sql_query)
+            result_df = execute_sql_query(df, sql_query, table_key=table_key)
 
             # Save the result DataFrame after executing the SQL query for debugging
             if os.environ.get("TOPAZ_DEBUG_MODE") == "true":
@@ -857,13 +868,12 @@ class VisualizationAPI(APIView):
             logging.error(f"Error in VisualizationAPI: {str(e)}\nStack trace:\n{error_info}")
             return Response({'error': str(e)}, status=500)
 
-def categorical_discrete_visualization(df: pd.DataFrame, column_key: str, category: str = "all"):
+def iter_categorical_distributions(df: pd.DataFrame, column_key: str, category: str = "all"):
     """
-    Generate a categorical discrete visualization saved as a PDF.
+    Yield (title, value counts of `column_key`) for every page of a categorical report.
 
-    - If `category` is 'all', a single bar chart is saved to the PDF.
-    - If `category` is specified, a bar chart is generated for each unique value of `category`,
-      each saved as a separate page in the PDF.
+    Counts for all category values come from one groupby, instead of filtering the
+    DataFrame once per category value.
     """
     if column_key not in df.columns:
         raise ValueError(f"Column '{column_key}' not found in DataFrame")
@@ -871,29 +881,154 @@ def categorical_discrete_visualization(df: pd.DataFrame, column_key: str, catego
     if category != 'all' and category not in df.columns:
         raise ValueError(f"Category '{category}' not found in DataFrame")
 
+    if category == 'all':
+        yield f"Distribution of {column_key}", df[column_key].value_counts()
+        return
+
+    grouped = df.groupby(category, sort=False)[column_key].value_counts()
+    counts_by_category = {cat: counts.droplevel(0) for cat, counts in grouped.groupby(level=0, sort=False)}
+    for cat in df[category].unique():
+        yield f"Distribution of {column_key} for {category} = {cat}", counts_by_category[cat]
+
+
+def categorical_discrete_visualization(
+    df: pd.DataFrame, column_key: str, category: str = "all", output=None, on_page=None
+):
+    """
+    Generate a categorical discrete visualization saved as a PDF.
+
+    - If `category` is 'all', a single pie chart is saved to the PDF.
+    - If `category` is specified, a pie chart is generated for each unique value of `category`,
+      each saved as a separate page in the PDF.
+
+    Pages are written to `output` (a path or a binary file object) as soon as they are drawn,
+    an in-memory buffer is created and returned when it's omitted. `on_page` is called with the
+    number of pages written so far.
+    """
     # Create a BytesIO buffer to save the PDF
-    pdf_buffer = BytesIO()
+    pdf_buffer = BytesIO() if output is None else output
 
     with PdfPages(pdf_buffer) as pdf:
-        if category == 'all':
-            counts = df[column_key].value_counts()
-            probabilities = counts / counts.sum()
+        for page, (title, counts) in enumerate(iter_categorical_distributions(df, column_key, category), 1):
+            probabilities = counts / counts.sum()  # Convert counts to probabilities
             fig, ax = plt.subplots()
             ax.pie(probabilities.values, labels=probabilities.index, autopct='%1.1f%%')
-            ax.set_title(f"Distribution of {column_key}")
+            ax.set_title(title)
             pdf.savefig(fig)
             plt.close(fig)
-        else:
-            unique_categories = df[category].unique()
-            for cat in unique_categories:
-                sub_df = df[df[category] == cat]
-                counts = sub_df[column_key].value_counts()
-                probabilities = counts / counts.sum()  # Convert counts to probabilities
-                fig, ax = plt.subplots()
-                ax.pie(probabilities.values, labels=probabilities.index, autopct='%1.1f%%')
-                ax.set_title(f"Distribution of {column_key} for {category} = {cat}")
-                pdf.savefig(fig)
-                plt.close(fig)
-
-    pdf_buffer.seek(0)
-    return pdf_buffer
+            if on_page:
+                on_page(page)
+
+    if output is None:
+        pdf_buffer.seek(0)
+        return pdf_buffer
+    return output
+
+
+def render_visualization_report(report_id, *args, **kwargs):
+    report = VisualizationReport.objects.get(id=report_id)
+    report.status = VisualizationReport.Status.IN_PROGRESS
+    report.save(update_fields=['status'])
+
+    params = report.params
+    df = get_project_dataframe(
+        report.project_id, only_finished=not params['include_all_tasks'], ignore_keys=params['ignore_keys']
+    )
+    category = params['category']
+    total = 1 if category == 'all' or category not in df.columns else int(df[category].nunique())
+    report.counters = {'pages': 0, 'total': total}
+    report.save(update_fields=['counters'])
+
+    def update_progress(page):
+        if page % settings.VISUALIZATION_REPORT_PROGRESS_STEP == 0 or page == total:
+            VisualizationReport.objects.filter(id=report_id).update(counters={'pages': page, 'total': total})
+
+    with tempfile.NamedTemporaryFile(suffix='.pdf', dir=settings.FILE_UPLOAD_TEMP_DIR) as file:
+        categorical_discrete_visualization(df, params['column_key'], category, output=file, on_page=update_progress)
+        file.seek(0)
+
+        now = datetime.now()
+        file_name = f'project-{report.project_id}-visualization-{report.id}-at-{now.strftime("%Y-%m-%d-%H-%M")}.pdf'
+        file_path = f'{report.project_id}/{file_name}'  # finally file will be in settings.DELAYED_EXPORT_DIR/project.id/file_name
+        report.file.save(file_path, File(file, name=file_path), save=False)
+
+    report.status = VisualizationReport.Status.COMPLETED
+    report.finished_at = datetime.now()
+    report.save(update_fields=['file', 'status', 'finished_at'])
+
+
+def set_visualization_report_background_failure(job, connection, type, value, traceback_obj):
+    report_id = job.args[0]
+    trace = tb.format_exception(type, value, traceback_obj)
+    VisualizationReport.objects.filter(id=report_id).update(
+        status=VisualizationReport.Status.FAILED, traceback=''.join(trace), finished_at=datetime.now()
+    )
+
+
+class VisualizationReportMixin:
+    """Common queryset and project lookup of visualization report views"""
+
+    queryset = VisualizationReport.objects.all()
+    project_model = Project
+    serializer_class = VisualizationReportSerializer
+    lookup_url_kwarg = 'report_pk'
+    permission_required = all_permissions.projects_view
+
+    def _get_project(self):
+        project_pk = self.kwargs.get('pk')
+        project = generics.get_object_or_404(
+            self.project_model.objects.for_user(self.request.user),
+            pk=project_pk,
+        )
+        return project
+
+    def get_queryset(self):
+        project = self._get_project()
+        return super().get_queryset().filter(project=project)
+
+
+@method_decorator(name='get', decorator=swagger_auto_schema(auto_schema=None))
+@method_decorator(name='post', decorator=swagger_auto_schema(auto_schema=None))
+class VisualizationReportListAPI(VisualizationReportMixin, generics.ListCreateAPIView):
+    def create(self, request, *args, **kwargs):
+        project = self._get_project()
+        serializer = VisualizationReportCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = dict(serializer.validated_data)
+        params['ignore_keys'] = [key for key in params['ignore_keys'].split(',') if key]
+
+        columns = set(get_project_column_profile(project.id)['columns']) - set(params['ignore_keys'])
+        if params['column_key'] not in columns:
+            raise ValidationError({'column_key': f"Column '{params['column_key']}' not found"})
+        if params['category'] != 'all' and params['category'] not in columns:
+            raise ValidationError({'category': f"Category '{params['category']}' not found"})
+
+        report = VisualizationReport.objects.create(project=project, created_by=request.user, params=params)
+        start_job_async_or_sync(
+            render_visualization_report,
+            report.id,
+            on_failure=set_visualization_report_background_failure,
+            job_timeout=settings.RQ_LONG_JOB_TIMEOUT,
+        )
+        report.refresh_from_db()
+        return Response(self.get_serializer(report).data, status=status.HTTP_201_CREATED)
+
+    def filter_queryset(self, queryset):
+        return super().filter_queryset(queryset).order_by('-created_at')[:100]
+
+
+@method_decorator(name='get', decorator=swagger_auto_schema(auto_schema=None))
+@method_decorator(name='delete', decorator=swagger_auto_schema(auto_schema=None))
+class VisualizationReportDetailAPI(VisualizationReportMixin, generics.RetrieveDestroyAPIView):
+    pass
+
+
+@method_decorator(name='get', decorator=swagger_auto_schema(auto_schema=None))
+class VisualizationReportDownloadAPI(VisualizationReportMixin, generics.RetrieveAPIView):
+    serializer_class = None
+
+    def get(self, request, *args, **kwargs):
+        report = self.get_object()
+        if report.status != VisualizationReport.Status.COMPLETED:
+            return HttpResponse('Visualization report is not completed', status=404)
+        return file_download_response(request, report.file)
@@ -0,0 +1,418 @@
+"""This file and its contents are licensed under the Apache License 2.0. Please see the included NOTICE for copyright information and LICENSE for a copy of the license.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from tasks.models import Annotation, Prediction, Task
+
+try:
+    import fcntl
+except ImportError:  # Windows: snapshots are guarded within the process only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# hidden column kept in the snapshot to serve both `only_finished` variants from one frame
+HAS_ANNOTATIONS_COLUMN = '__has_annotations'
+# dirty log entry of bulk changes without known task ids, the whole snapshot is rebuilt
+ALL_TASKS = '*'
+
+
+def iter_task_batches(queryset, batch_size=None):
+    """Yield serialized tasks of `queryset` in batches of `batch_size`
+
+    Tasks are paginated by id (keyset), so every batch is three bounded queries whatever
+    the project size: task ids with data, annotation results and prediction results.
+    Each item is `{'id': ..., 'data': ..., 'annotations': [result, ...], 'predictions': [result, ...]}`.
+    """
+    batch_size = batch_size or settings.VISUALIZATION_BATCH_SIZE
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', 'data')[:batch_size])
+        if not rows:
+            return
+
+        task_ids = [task_id for task_id, _ in rows]
+        annotations = defaultdict(list)
+        for task_id, result in (
+            Annotation.objects.filter(task_id__in=task_ids).order_by('id').values_list('task_id', 'result')
+        ):
+            annotations[task_id].append(result)
+        predictions = defaultdict(list)
+        for task_id, result in (
+            Prediction.objects.filter(task_id__in=task_ids).order_by('id').values_list('task_id', 'result')
+        ):
+            predictions[task_id].append(result)
+
+        yield [
+            {
+                'id': task_id,
+                'data': data,
+                'annotations': annotations[task_id],
+                'predictions': predictions[task_id],
+            }
+            for task_id, data in rows
+        ]
+        last_id = task_ids[-1]
+
+
+def _extract_annotation(annotation):
+    if 'value' in annotation and 'choices' in annotation['value']:
+        return annotation['value']['choices'][0]
+    return None
+
+
+def _extract_annotation_columns(annotations_column_data):
+    if annotations_column_data and isinstance(annotations_column_data, list) and len(annotations_column_data) > 0:
+        first_annotation = annotations_column_data[0]
+        if isinstance(first_annotation, list):
+            keys = [annotation['from_name'] for annotation in first_annotation if 'from_name' in annotation]
+            values = [_extract_annotation(annotation) for annotation in first_annotation]
+            return dict(zip(keys, values))
+    return {}
+
+
+def tasks_to_dataframe(tasks):
+    """Build the flat visualization frame from serialized tasks
+
+    `data` keys are normalized into columns and every `from_name` of the first annotation
+    becomes a column holding its first choice. NaN values are left as is, so frames built
+    from different task subsets can be concatenated before the final cleanup.
+    """
+    df = pd.DataFrame(tasks)
+    if df.empty:
+        return df
+
+    df[HAS_ANNOTATIONS_COLUMN] = df['annotations'].apply(bool)
+
+    data_df = pd.json_normalize(df['data'].apply(lambda x: {k: v for k, v in x.items() if k != 'id'}))
+    df = pd.concat([df.drop(columns=['data']), data_df], axis=1)
+
+    annotation_data = df['annotations'].apply(_extract_annotation_columns)
+    for key in set().union(*annotation_data.apply(lambda x: x.keys())):
+        df[key] = annotation_data.apply(lambda x: x.get(key))
+
+    return df.drop(columns=['annotations'])
+
+
+def build_dataframe(queryset, batch_size=None):
+    """Visualization frame of `queryset` tasks, built batch by batch to bound intermediate memory"""
+    frames = [tasks_to_dataframe(batch) for batch in iter_task_batches(queryset, batch_size)]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+def profile_columns(df):
+    """Compute cardinality, minimum value occurrence and hashability of every column
+
+    Each column is factorized once, value counts come from a bincount over the codes, so
+    there's no separate nunique and value_counts pass. Columns holding lists or dicts are
+    reported as unhashable.
+    """
+    columns = {}
+    for column in df.columns:
+        try:
+            # missing values are coded -1 by default in every pandas version
+            codes, _ = pd.factorize(df[column])
+        except TypeError:
+            columns[column] = {'hashable': False, 'cardinality': None, 'min_count': None}
+            continue
+        counts = np.bincount(codes[codes >= 0])
+        counts = counts[counts > 0]
+        columns[column] = {
+            'hashable': True,
+            'cardinality': int(len(counts)),
+            'min_count': int(counts.min()) if len(counts) else 0,
+        }
+    return {'rows': len(df), 'columns': columns}
+
+
+def get_categorical_columns(profile, exclude=('model_enh', 'modelName')):
+    """Columns with fewer distinct values than half of the rows and every value seen in at least 1% of rows"""
+    num_rows = profile['rows']
+    threshold = num_rows // 2
+    min_occurrences = int(0.01 * num_rows)
+    return [
+        column
+        for column, stats in profile['columns'].items()
+        if stats['hashable']
+        and not any(part in column for part in exclude)
+        and stats['cardinality'] < threshold
+        and stats['min_count'] >= min_occurrences
+    ]
+
+
+class ProjectDataFrameCache:
+    """On-disk snapshot of the visualization frame of one project
+
+    The snapshot is built once with `build_dataframe` and then patched: task, annotation
+    and prediction signals append the changed task ids to a small dirty log next to the
+    snapshot, and the next read re-serializes only those tasks. Bulk creates of annotations and
+    predictions log their tasks through `post_bulk_create`, bulk updates must call `mark_tasks_dirty`
+    or `mark_project_dirty` themselves. Tasks created or deleted without signals are caught by comparing
+    the task count and max id stored with the snapshot, other changes without signals are not seen.
+
+    Every stored snapshot gets the next version number, it's kept in the snapshot meta and in a small
+    version file, so workers check their loaded frame is current without unpickling the snapshot.
+
+    Task payloads are arbitrary JSON, so the frame keeps object columns and is stored with
+    pickle rather than a typed columnar format. Load, patch and store run under a file lock,
+    so web and rq workers don't overwrite each other's patches.
+    """
+
+    _locks = {}
+    _locks_guard = threading.Lock()
+    # recently loaded snapshots, least recently used first: project_id => (version, frame, meta)
+    _loaded = OrderedDict()
+
+    def __init__(self, project_id):
+        self.project_id = project_id
+        self.directory = settings.VISUALIZATION_CACHE_DIR
+        self.snapshot_path = os.path.join(self.directory, f'project_{project_id}.pkl')
+        self.dirty_path = os.path.join(self.directory, f'project_{project_id}.dirty')
+        self.profile_path = os.path.join(self.directory, f'project_{project_id}.profile.json')
+        self.lock_path = os.path.join(self.directory, f'project_{project_id}.lock')
+        self.version_path = os.path.join(self.directory, f'project_{project_id}.version')
+
+    @classmethod
+    def _get_lock(cls, project_id):
+        with cls._locks_guard:
+            return cls._locks.setdefault(project_id, threading.Lock())
+
+    @contextmanager
+    def _lock(self):
+        """Exclusive access to the snapshot for threads of this process and for other processes"""
+        os.makedirs(self.directory, exist_ok=True)
+        with self._get_lock(self.project_id), open(self.lock_path, 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def exists(self):
+        return os.path.exists(self.snapshot_path)
+
+    def version(self):
+        """Version of the stored snapshot, changes every time the snapshot is rewritten"""
+        try:
+            with open(self.version_path) as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    @classmethod
+    def _get_loaded(cls, project_id):
+        with cls._locks_guard:
+            loaded = cls._loaded.get(project_id)
+            if loaded is not None:
+                cls._loaded.move_to_end(project_id)
+            return loaded
+
+    @classmethod
+    def _set_loaded(cls, project_id, version, df, meta):
+        with cls._locks_guard:
+            cls._loaded[project_id] = (version, df, meta)
+            cls._loaded.move_to_end(project_id)
+            while len(cls._loaded) > settings.VISUALIZATION_CACHE_LOADED_PROJECTS:
+                cls._loaded.popitem(last=False)
+
+    @classmethod
+    def _drop_loaded(cls, project_id):
+        with cls._locks_guard:
+            cls._loaded.pop(project_id, None)
+
+    def refresh(self):
+        """Bring the snapshot up to date with the database, return the full frame and its version"""
+        with self._lock():
+            df, meta = self._load()
+            if df is None:
+                df, meta = self.rebuild()
+            else:
+                df, meta = self._refresh(df, meta)
+            return df, meta['version']
+
+    def get(self, only_finished=True):
+        """Return a copy of the cached frame, building or patching the snapshot if needed
+
+        The version of the snapshot the frame was taken from is stored in `df.attrs['snapshot_version']`.
+        """
+        df, version = self.refresh()
+        if only_finished and HAS_ANNOTATIONS_COLUMN in df.columns:
+            df = df[df[HAS_ANNOTATIONS_COLUMN]]
+        df = df.drop(columns=[HAS_ANNOTATIONS_COLUMN], errors='ignore').reset_index(drop=True)
+        df.attrs['snapshot_version'] = version
+        return df
+
+    def rebuild(self, previous_meta=None):
+        """Serialize all project tasks from scratch and store a new snapshot"""
+        counters = self._get_task_counters()
+        # ids logged before this point are covered by the full rebuild
+        self._pop_dirty_ids()
+        df = build_dataframe(Task.objects.filter(project_id=self.project_id))
+        meta = self._store(df, counters, previous_meta)
+        logger.debug(f'Visualization snapshot for project {self.project_id} rebuilt with {len(df)} tasks')
+        return df, meta
+
+    def patch(self, df, task_ids):
+        """Replace rows of `task_ids` in `df` with freshly serialized tasks"""
+        task_ids = set(task_ids)
+        if 'id' in df.columns:
+            df = df[~df['id'].isin(task_ids)]
+        updated = build_dataframe(Task.objects.filter(project_id=self.project_id, id__in=task_ids))
+        if not updated.empty:
+            df = pd.concat([df, updated], ignore_index=True).sort_values('id', ignore_index=True)
+        return df
+
+    def mark_dirty(self, task_ids):
+        """Log changed task ids, they will be re-serialized on the next read, ALL_TASKS rebuilds the snapshot
+
+        The lock file is created before the first build, so changes made while it runs are logged too.
+        """
+        if not os.path.exists(self.lock_path):
+            return
+        with open(self.dirty_path, 'a') as f:
+            f.write(''.join(f'{task_id}\n' for task_id in task_ids))
+
+    def drop(self):
+        self._drop_loaded(self.project_id)
+        for path in (self.snapshot_path, self.version_path, self.dirty_path, self.profile_path, self.lock_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def load_profile(self, version):
+        """Column profile stored for the snapshot `version`, None if it was computed for another one"""
+        try:
+            with open(self.profile_path) as f:
+                stored = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if stored.get('version') != version:
+            return None
+        return stored['profile']
+
+    def store_profile(self, version, profile):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f'{self.profile_path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': version, 'profile': profile}, f)
+        os.replace(tmp_path, self.profile_path)
+
+    def _refresh(self, df, meta):
+        counters = self._get_task_counters()
+        dirty_ids = self._pop_dirty_ids()
+        if dirty_ids is None:
+            return self.rebuild(meta)
+
+        if counters['max_id'] is not None and counters['max_id'] != meta['max_id']:
+            # tasks imported with bulk_create are appended after the snapshot max id
+            new_ids = Task.objects.filter(project_id=self.project_id, id__gt=meta['max_id'] or 0).values_list(
+                'id', flat=True
+            )
+            dirty_ids.update(new_ids)
+
+        if not dirty_ids and all(meta.get(key) == value for key, value in counters.items()):
+            return df, meta
+
+        df = self.patch(df, dirty_ids)
+        if len(df) != counters['task_count']:
+            # tasks were created or removed bypassing signals
+            return self.rebuild(meta)
+        return df, self._store(df, counters, meta)
+
+    def _get_task_counters(self):
+        return Task.objects.filter(project_id=self.project_id).aggregate(
+            task_count=Count('id'),
+            max_id=Max('id'),
+        )
+
+    def _pop_dirty_ids(self):
+        """Logged task ids, None if the whole project was marked as changed"""
+        processing_path = self.dirty_path + '.processing'
+        try:
+            os.replace(self.dirty_path, processing_path)
+        except FileNotFoundError:
+            return set()
+        with open(processing_path) as f:
+            lines = {line.strip() for line in f if line.strip()}
+        os.remove(processing_path)
+        if ALL_TASKS in lines:
+            return None
+        return {int(line) for line in lines}
+
+    def _load(self):
+        version = self.version()
+        if version is None:
+            return None, None
+        loaded = self._get_loaded(self.project_id)
+        if loaded and loaded[0] == version:
+            return loaded[1], loaded[2]
+        try:
+            payload = pd.read_pickle(self.snapshot_path)
+        except Exception as exc:
+            logger.warning(f'Visualization snapshot for project {self.project_id} is broken, rebuilding: {exc}')
+            return None, None
+        meta = payload['meta']
+        if meta.get('version') != version:
+            # written before versions were kept or interrupted between the two files
+            return None, None
+        self._set_loaded(self.project_id, meta['version'], payload['frame'], meta)
+        return payload['frame'], meta
+
+    def _store(self, df, counters, previous_meta=None):
+        """Store the frame as the next version of the snapshot, return the new meta"""
+        previous_version = (previous_meta or {}).get('version')
+        # a snapshot built from nothing starts from the clock, so it never reuses versions of a lost one
+        version = previous_version + 1 if previous_version is not None else time.time_ns()
+        meta = dict(counters, version=version)
+
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f'{self.snapshot_path}.{uuid.uuid4().hex}.tmp'
+        pd.to_pickle({'frame': df, 'meta': meta}, tmp_path)
+        os.replace(tmp_path, self.snapshot_path)
+        tmp_path = f'{self.version_path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(str(version))
+        os.replace(tmp_path, self.version_path)
+        self._set_loaded(self.project_id, version, df, meta)
+        return meta
+
+
+def mark_tasks_dirty(project_id, task_ids):
+    """Schedule re-serialization of tasks in the project snapshot once the transaction is committed"""
+    if not settings.VISUALIZATION_CACHE_ENABLED:
+        return
+    cache = ProjectDataFrameCache(project_id)
+    task_ids = list(task_ids)
+    transaction.on_commit(lambda: cache.mark_dirty(task_ids))
+
+
+def mark_project_dirty(project_id):
+    """Rebuild the project snapshot on the next read, for bulk updates of tasks or results without task ids"""
+    mark_tasks_dirty(project_id, [ALL_TASKS])
+
+
+def get_project_base_dataframe(project_id, only_finished=True):
+    """Visualization frame of the project with NaNs preserved, served from the snapshot when enabled"""
+    if settings.VISUALIZATION_CACHE_ENABLED:
+        return ProjectDataFrameCache(project_id).get(only_finished=only_finished)
+
+    queryset = Task.objects.filter(project_id=project_id)
+    if only_finished:
+        queryset = queryset.filter(annotations__isnull=False).distinct()
+    df = build_dataframe(queryset)
+    return df.drop(columns=[HAS_ANNOTATIONS_COLUMN], errors='ignore')
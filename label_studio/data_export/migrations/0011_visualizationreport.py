@@ -0,0 +1,105 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('projects', '0046_transfer_project_groups_to_user_lists'),
+        ('data_export', '0010_alter_convertedformat_export_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisualizationReport',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                (
+                    'params',
+                    models.JSONField(
+                        default=dict,
+                        help_text='column_key, category, include_all_tasks and ignore_keys used to render the report',
+                        verbose_name='chart parameters',
+                    ),
+                ),
+                ('file', models.FileField(null=True, upload_to='export')),
+                (
+                    'status',
+                    models.CharField(
+                        choices=[
+                            ('created', 'Created'),
+                            ('in_progress', 'In progress'),
+                            ('failed', 'Failed'),
+                            ('completed', 'Completed'),
+                        ],
+                        default='created',
+                        max_length=64,
+                        verbose_name='report status',
+                    ),
+                ),
+                (
+                    'counters',
+                    models.JSONField(
+                        default=dict,
+                        help_text='Rendered and total page numbers',
+                        verbose_name='rendering meta data',
+                    ),
+                ),
+                (
+                    'traceback',
+                    models.TextField(
+                        blank=True,
+                        help_text='Traceback report in case of errors',
+                        null=True,
+                    ),
+                ),
+                (
+                    'created_at',
+                    models.DateTimeField(
+                        auto_now_add=True,
+                        help_text='Creation time',
+                        verbose_name='created at',
+                    ),
+                ),
+                (
+                    'finished_at',
+                    models.DateTimeField(
+                        default=None,
+                        help_text='Complete or fail time',
+                        null=True,
+                        verbose_name='finished at',
+                    ),
+                ),
+                (
+                    'created_by',
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name='+',
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name='created by',
+                    ),
+                ),
+                (
+                    'project',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='visualization_reports',
+                        to='projects.project',
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_export', '0011_visualizationreport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='export',
+            name='progress',
+            field=models.JSONField(
+                default=dict,
+                help_text='Export options and state of each shard, completed shards are kept when the export is resumed',
+                verbose_name='Export progress',
+            ),
+        ),
+    ]
@@ -0,0 +1,63 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_export', '0012_export_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='export',
+            name='since',
+            field=models.DateTimeField(
+                default=None,
+                help_text='Delta exports include only tasks changed or deleted after this time, empty for full snapshots',
+                null=True,
+                verbose_name='since',
+            ),
+        ),
+        migrations.AddField(
+            model_name='export',
+            name='watermark',
+            field=models.DateTimeField(
+                default=None,
+                help_text='Changes up to this time are included, the next delta export can start from it',
+                null=True,
+                verbose_name='watermark',
+            ),
+        ),
+        migrations.CreateModel(
+            name='ExportTombstone',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('project_id', models.IntegerField(verbose_name='project id')),
+                ('task_id', models.IntegerField(verbose_name='task id')),
+                (
+                    'annotation_id',
+                    models.IntegerField(
+                        default=None,
+                        help_text='Empty when the whole task was deleted',
+                        null=True,
+                        verbose_name='annotation id',
+                    ),
+                ),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, verbose_name='deleted at')),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['project_id', 'deleted_at'], name='data_export_project_087f57_idx'),
+                    models.Index(fields=['task_id', 'deleted_at'], name='data_export_task_id_9210c1_idx'),
+                ],
+            },
+        ),
+    ]
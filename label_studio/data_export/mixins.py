@@ -4,6 +4,7 @@ import json
 import logging
 import pathlib
 import shutil
+import time
 from datetime import datetime
 from functools import reduce
 
@@ -11,7 +12,6 @@ import django_rq
 from core.redis import redis_connected
 from core.utils.common import batch
 from core.utils.io import (
-    SerializableGenerator,
     get_all_dirs_from_dir,
     get_all_files_from_dir,
     get_temp_dir,
@@ -21,14 +21,17 @@ from django.conf import settings
 from django.core.files import File
 from django.core.files import temp as tempfile
 from django.db import transaction
-from django.db.models import Prefetch
+from django.db.models import Exists, OuterRef, Prefetch
 from django.db.models.query_utils import Q
 from django.utils import dateformat, timezone
+from django.utils.dateparse import parse_datetime
 from label_studio_sdk.converter import Converter
 from tasks.models import Annotation, Task
 
 ONLY = 'only'
 EXCLUDE = 'exclude'
+# rq kills export jobs after this many seconds, a shard in progress for longer is abandoned
+EXPORT_JOB_TIMEOUT = 3 * 60 * 60
 
 
 logger = logging.getLogger(__name__)
@@ -175,8 +178,6 @@ class ExportMixin:
                 })
         })
         """
-        from .serializers import ExportDataSerializer
-
         logger.debug('Run get_task_queryset')
 
         start = datetime.now()
@@ -184,39 +185,84 @@ class ExportMixin:
             # TODO: make counters from queryset
             # counters = Project.objects.with_counts().filter(id=self.project.id)[0].get_counters()
             self.counters = {'task_number': 0}
-            all_tasks = self.project.tasks
             logger.debug('Tasks filtration')
-            task_ids = (
-                self._get_filtered_tasks(all_tasks, task_filter_options=task_filter_options)
-                .distinct()
-                .values_list('id', flat=True)
-            )
+            task_ids = self.get_export_task_ids(task_filter_options)
             base_export_serializer_option = self._get_export_serializer_option(serialization_options)
             i = 0
             BATCH_SIZE = 1000
             for ids in batch(task_ids, BATCH_SIZE):
                 i += 1
-                tasks = list(self.get_task_queryset(ids, annotation_filter_options))
                 logger.debug(f'Batch: {i*BATCH_SIZE}')
-                if isinstance(task_filter_options, dict) and task_filter_options.get('only_with_annotations'):
-                    tasks = [task for task in tasks if task.annotations.exists()]
-
-                if serialization_options and serialization_options.get('include_annotation_history') is True:
-                    task_ids = [task.id for task in tasks]
-                    annotation_ids = Annotation.objects.filter(task_id__in=task_ids).values_list('id', flat=True)
-                    base_export_serializer_option = self.update_export_serializer_option(
-                        base_export_serializer_option, annotation_ids
-                    )
-
-                serializer = ExportDataSerializer(tasks, many=True, **base_export_serializer_option)
-                self.counters['task_number'] += len(tasks)
-                for task in serializer.data:
+                data = self.serialize_tasks(
+                    ids, annotation_filter_options, serialization_options, base_export_serializer_option
+                )
+                self.counters['task_number'] += len(data)
+                for task in data:
                     yield task
         duration = datetime.now() - start
         logger.info(
             f'{self.counters["task_number"]} tasks from project {self.project_id} exported in {duration.total_seconds():.2f} seconds'
         )
 
+    def get_export_task_ids(self, task_filter_options=None):
+        tasks = self._get_filtered_tasks(self.project.tasks, task_filter_options=task_filter_options)
+        if isinstance(task_filter_options, dict) and task_filter_options.get('only_with_annotations'):
+            # one EXISTS in the ids query instead of an annotations query per exported task
+            tasks = tasks.filter(Exists(Annotation.objects.filter(task=OuterRef('pk'))))
+        since = self._get_since(task_filter_options)
+        if since:
+            tasks = tasks.filter(self._changed_since(since))
+        return tasks.distinct().values_list('id', flat=True)
+
+    @staticmethod
+    def _get_since(task_filter_options):
+        if not isinstance(task_filter_options, dict) or not task_filter_options.get('since'):
+            return None
+        since = task_filter_options['since']
+        return parse_datetime(since) if isinstance(since, str) else since
+
+    def _changed_since(self, since):
+        """Tasks updated after `since`, including annotation changes made with bulk updates or deletes"""
+        from data_export.models import ExportTombstone
+
+        return (
+            Q(updated_at__gt=since)
+            | Exists(Annotation.objects.filter(task=OuterRef('pk'), project=self.project, updated_at__gt=since))
+            | Exists(
+                ExportTombstone.objects.filter(
+                    task_id=OuterRef('pk'), project_id=self.project.id, deleted_at__gt=since
+                )
+            )
+        )
+
+    def get_deleted_task_ids(self, task_filter_options=None):
+        """Ids of tasks deleted after `since` of a delta export"""
+        from data_export.models import ExportTombstone
+
+        since = self._get_since(task_filter_options)
+        if not since:
+            return []
+        task_ids = (
+            ExportTombstone.objects.filter(project_id=self.project.id, annotation_id=None, deleted_at__gt=since)
+            .exclude(task_id__in=self.project.tasks.values('id'))
+            .values_list('task_id', flat=True)
+            .distinct()
+        )
+        return sorted(task_ids)
+
+    def serialize_tasks(self, ids, annotation_filter_options, serialization_options, base_export_serializer_option):
+        from .serializers import ExportDataSerializer
+
+        tasks = list(self.get_task_queryset(ids, annotation_filter_options))
+        export_serializer_option = base_export_serializer_option
+        if serialization_options and serialization_options.get('include_annotation_history') is True:
+            task_ids = [task.id for task in tasks]
+            annotation_ids = Annotation.objects.filter(task_id__in=task_ids).values_list('id', flat=True)
+            export_serializer_option = self.update_export_serializer_option(
+                base_export_serializer_option, annotation_ids
+            )
+        return ExportDataSerializer(tasks, many=True, **export_serializer_option).data
+
     def update_export_serializer_option(self, base_export_serializer_option, annotation_ids):
         return base_export_serializer_option
 
@@ -241,6 +287,7 @@ class ExportMixin:
         self.save(update_fields=['file', 'md5', 'counters'])
 
     def export_to_file(self, task_filter_options=None, annotation_filter_options=None, serialization_options=None):
+        """Split the export into shards of task ids and start them, shards of a resumed export are kept"""
         logger.debug(
             f'Run export for {self.id} with params:\n'
             f'task_filter_options: {task_filter_options}\n'
@@ -248,35 +295,204 @@ class ExportMixin:
             f'serialization_options: {serialization_options}\n'
         )
         try:
-            iter_json = json.JSONEncoder(ensure_ascii=False).iterencode(
-                SerializableGenerator(
-                    self.get_export_data(
-                        task_filter_options=task_filter_options,
-                        annotation_filter_options=annotation_filter_options,
-                        serialization_options=serialization_options,
-                    )
-                )
+            if not self.progress.get('shards'):
+                # taken before the tasks are read, so changes made during the export get into the next delta
+                self.watermark = timezone.now()
+                self.progress = {
+                    'options': {
+                        'task_filter_options': task_filter_options,
+                        'annotation_filter_options': annotation_filter_options,
+                        'serialization_options': serialization_options,
+                    },
+                    'shards': self.plan_shards(task_filter_options),
+                }
+                self.save(update_fields=['progress', 'watermark'])
+        except Exception:
+            self.status = self.Status.FAILED
+            self.finished_at = datetime.now()
+            self.save(update_fields=['status', 'finished_at'])
+            logger.exception('Export was failed')
+            return
+
+        shards = self.progress['shards']
+        if all(shard['status'] == self.Status.COMPLETED for shard in shards):
+            return _run_export_job(export_assemble_background, self.id)
+        # shards still exported by jobs of the previous run start the assembly when they finish
+        pending = [
+            i
+            for i, shard in enumerate(shards)
+            if shard['status'] != self.Status.COMPLETED and not self.is_shard_running(shard)
+        ]
+        for index in pending:
+            _run_export_job(export_shard_background, self.id, index)
+
+    def plan_shards(self, task_filter_options=None):
+        """Id ranges of EXPORT_SHARD_SIZE tasks each, read with one pass over the ids"""
+        shards = []
+        task_ids = self.get_export_task_ids(task_filter_options).order_by('id')
+        for i, task_id in enumerate(task_ids.iterator()):
+            if i % settings.EXPORT_SHARD_SIZE == 0:
+                shards.append({'first_id': task_id, 'status': self.Status.CREATED, 'task_number': 0, 'file': None})
+            shards[-1]['last_id'] = task_id
+        if not shards:
+            # an empty export still has to produce a file
+            shards.append(
+                {'first_id': 0, 'last_id': -1, 'status': self.Status.CREATED, 'task_number': 0, 'file': None}
             )
+        return shards
+
+    def get_shard_name(self, index):
+        return f'{settings.DELAYED_EXPORT_DIR}/{self.project_id}/export-{self.id}-shards/{index:05d}.json'
+
+    def is_shard_running(self, shard):
+        return (
+            shard['status'] == self.Status.IN_PROGRESS
+            and time.time() - shard.get('started_at', 0) < EXPORT_JOB_TIMEOUT
+        )
+
+    def start_shard(self, index):
+        """Mark the shard as picked up by the current job, False if another job is exporting it"""
+        with transaction.atomic():
+            export = type(self).objects.select_for_update().get(id=self.id)
+            shard = export.progress['shards'][index]
+            if self.is_shard_running(shard):
+                return False
+            if shard['status'] != self.Status.COMPLETED:
+                shard.update(status=self.Status.IN_PROGRESS, started_at=time.time())
+                export.save(update_fields=['progress'])
+        self.progress = export.progress
+        return True
+
+    def export_shard(self, index):
+        """Serialize one shard into a JSON fragment in the export storage"""
+        if not self.start_shard(index):
+            logger.warning(f'Export shard {index} of export {self.id} is already in progress')
+            return
+        options = self.progress['options']
+        shard = self.progress['shards'][index]
+        if shard['status'] == self.Status.COMPLETED:
+            return self.complete_shard(index, shard['file'], shard['task_number'])
+
+        try:
+            task_ids = self.get_export_task_ids(options['task_filter_options']).filter(
+                id__gte=shard['first_id'], id__lte=shard['last_id']
+            )
+            task_ids = list(task_ids.order_by('id'))
+            base_export_serializer_option = self._get_export_serializer_option(options['serialization_options'])
+            encoder = json.JSONEncoder(ensure_ascii=False)
+            task_number = 0
+            name = None
+            with tempfile.NamedTemporaryFile(suffix='.export-shard.json', dir=settings.FILE_UPLOAD_TEMP_DIR) as file:
+                for ids in batch(task_ids, 1000):
+                    data = self.serialize_tasks(
+                        ids,
+                        options['annotation_filter_options'],
+                        options['serialization_options'],
+                        base_export_serializer_option,
+                    )
+                    for task in data:
+                        # the same item separator as json iterencode of the whole list
+                        file.write((', ' if task_number else '').encode('utf-8'))
+                        file.write(encoder.encode(task).encode('utf-8'))
+                        task_number += 1
+                if task_number:
+                    file.seek(0)
+                    storage = self.file.storage
+                    name = self.get_shard_name(index)
+                    if storage.exists(name):
+                        storage.delete(name)
+                    name = storage.save(name, File(file))
+        except Exception:
+            self.fail_shard(index)
+            logger.exception(f'Export shard {index} was failed')
+            return
+
+        return self.complete_shard(index, name, task_number)
+
+    def complete_shard(self, index, name, task_number):
+        """Record a finished shard, the shard finishing the export starts the assembly"""
+        with transaction.atomic():
+            export = type(self).objects.select_for_update().get(id=self.id)
+            export.progress['shards'][index].update(status=self.Status.COMPLETED, file=name, task_number=task_number)
+            done = all(shard['status'] == self.Status.COMPLETED for shard in export.progress['shards'])
+            assemble = done and not export.progress.get('assembling')
+            if assemble:
+                export.progress['assembling'] = True
+            export.save(update_fields=['progress'])
+        self.progress = export.progress
+
+        if assemble:
+            _run_export_job(export_assemble_background, self.id)
+
+    def fail_shard(self, index):
+        with transaction.atomic():
+            export = type(self).objects.select_for_update().get(id=self.id)
+            export.progress['shards'][index]['status'] = self.Status.FAILED
+            export.status = self.Status.FAILED
+            export.finished_at = datetime.now()
+            export.save(update_fields=['progress', 'status', 'finished_at'])
+        self.progress, self.status = export.progress, export.status
+
+    def assemble_shards(self):
+        """Concatenate shard fragments into the export file, hashing the content while it's written"""
+        storage = self.file.storage
+        shards = self.progress['shards']
+        try:
+            md5_object = hashlib.md5()  # nosec
             with tempfile.NamedTemporaryFile(suffix='.export.json', dir=settings.FILE_UPLOAD_TEMP_DIR) as file:
-                for chunk in iter_json:
-                    encoded_chunk = chunk.encode('utf-8')
-                    file.write(encoded_chunk)
+
+                def write(chunk):
+                    file.write(chunk)
+                    md5_object.update(chunk)
+
+                write(b'[')
+                written = False
+                for shard in shards:
+                    if not shard['task_number']:
+                        continue
+                    if written:
+                        write(b', ')
+                    with storage.open(shard['file'], 'rb') as shard_file:
+                        for chunk in iter(lambda: shard_file.read(1024 * 1024), b''):
+                            write(chunk)
+                    written = True
+                # deleted tasks of delta exports follow the changed ones
+                deleted_task_ids = self.get_deleted_task_ids(self.progress['options']['task_filter_options'])
+                encoder = json.JSONEncoder(ensure_ascii=False)
+                for task_id in deleted_task_ids:
+                    if written:
+                        write(b', ')
+                    write(encoder.encode(self.deleted_task_item(task_id)).encode('utf-8'))
+                    written = True
+                write(b']')
                 file.seek(0)
 
-                md5 = self.eval_md5(file)
-                self.save_file(file, md5)
+                self.counters = {'task_number': sum(shard['task_number'] for shard in shards)}
+                if self.since:
+                    self.counters['deleted_task_number'] = len(deleted_task_ids)
+                self.save_file(file, md5_object.hexdigest())
 
+            for shard in shards:
+                if shard['file']:
+                    storage.delete(shard['file'])
+            self.progress = {'options': self.progress['options'], 'shards': []}
             self.status = self.Status.COMPLETED
-            self.save(update_fields=['status'])
+            self.save(update_fields=['status', 'progress'])
 
         except Exception:
             self.status = self.Status.FAILED
-            self.save(update_fields=['status'])
+            self.progress.pop('assembling', None)
+            self.save(update_fields=['status', 'progress'])
             logger.exception('Export was failed')
         finally:
             self.finished_at = datetime.now()
             self.save(update_fields=['finished_at'])
 
+    @staticmethod
+    def deleted_task_item(task_id):
+        """Deleted task in the shape of an exported one"""
+        return {'id': task_id, 'deleted': True, 'data': {}, 'annotations': [], 'predictions': []}
+
     def run_file_exporting(self, task_filter_options=None, annotation_filter_options=None, serialization_options=None):
         if self.status == self.Status.IN_PROGRESS:
             logger.warning('Try to export with in progress stage')
@@ -285,23 +501,30 @@ class ExportMixin:
         self.status = self.Status.IN_PROGRESS
         self.save(update_fields=['status'])
 
-        if redis_connected():
-            queue = django_rq.get_queue('default')
-            queue.enqueue(
-                export_background,
-                self.id,
-                task_filter_options,
-                annotation_filter_options,
-                serialization_options,
-                on_failure=set_export_background_failure,
-                job_timeout='3h',  # 3 hours
-            )
-        else:
-            self.export_to_file(
-                task_filter_options=task_filter_options,
-                annotation_filter_options=annotation_filter_options,
-                serialization_options=serialization_options,
-            )
+        _run_export_job(
+            export_background,
+            self.id,
+            task_filter_options,
+            annotation_filter_options,
+            serialization_options,
+        )
+
+    def resume(self):
+        """Continue a failed export from its completed shards"""
+        if self.status != self.Status.FAILED or not self.progress.get('shards'):
+            return False
+        self.status = self.Status.IN_PROGRESS
+        self.finished_at = None
+        self.save(update_fields=['status', 'finished_at'])
+        options = self.progress['options']
+        _run_export_job(
+            export_background,
+            self.id,
+            options['task_filter_options'],
+            options['annotation_filter_options'],
+            options['serialization_options'],
+        )
+        return True
 
     def convert_file(self, to_format):
         with get_temp_dir() as tmp_dir:
@@ -356,8 +579,39 @@ def export_background(
     )
 
 
+def export_shard_background(export_id, index, *args, **kwargs):
+    from data_export.models import Export
+
+    Export.objects.get(id=export_id).export_shard(index)
+
+
+def export_assemble_background(export_id, *args, **kwargs):
+    from data_export.models import Export
+
+    Export.objects.get(id=export_id).assemble_shards()
+
+
+def _run_export_job(job, export_id, *args):
+    """Export steps are separate jobs, so shards of one export run in parallel on the workers"""
+    if redis_connected():
+        queue = django_rq.get_queue('default')
+        queue.enqueue(
+            job,
+            export_id,
+            *args,
+            on_failure=set_export_background_failure,
+            job_timeout=EXPORT_JOB_TIMEOUT,
+        )
+    else:
+        job(export_id, *args)
+
+
 def set_export_background_failure(job, connection, type, value, traceback):
     from data_export.models import Export
 
     export_id = job.args[0]
+    if job.func_name.endswith(export_shard_background.__name__):
+        # the shard can be resumed right away, not only after the job timeout
+        Export.objects.get(id=export_id).fail_shard(job.args[1])
+        return
     Export.objects.filter(id=export_id).update(status=Export.Status.FAILED)
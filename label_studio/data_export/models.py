@@ -4,6 +4,7 @@ import hashlib
 import logging
 import os
 import shutil
+from collections import defaultdict
 from copy import deepcopy
 from datetime import datetime
 
@@ -13,12 +14,14 @@ from core.feature_flags import flag_set
 from core.utils.common import load_func
 from core.utils.io import get_all_files_from_dir, get_temp_dir, path_to_open_binary_file
 from django.conf import settings
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 from label_studio_sdk.converter import Converter
-from tasks.models import Annotation
+from tasks.models import Annotation, Prediction, Task, post_bulk_create
+
+from .dataframes import ProjectDataFrameCache, mark_tasks_dirty
 
 logger = logging.getLogger(__name__)
 
@@ -70,6 +73,23 @@ class Export(ExportMixin, models.Model):
         _('Exporting meta data'),
         default=dict,
     )
+    progress = models.JSONField(
+        _('Export progress'),
+        default=dict,
+        help_text='Export options and state of each shard, completed shards are kept when the export is resumed',
+    )
+    since = models.DateTimeField(
+        _('since'),
+        null=True,
+        default=None,
+        help_text='Delta exports include only tasks changed or deleted after this time, empty for full snapshots',
+    )
+    watermark = models.DateTimeField(
+        _('watermark'),
+        null=True,
+        default=None,
+        help_text='Changes up to this time are included, the next delta export can start from it',
+    )
     project = models.ForeignKey(
         'projects.Project',
         related_name='exports',
@@ -91,6 +111,35 @@ def set_export_default_name(sender, instance, created, **kwargs):
         instance.save()
 
 
+class ExportTombstone(models.Model):
+    """Task or annotation deleted from a project, delta exports read deletions from these records"""
+
+    # not a foreign key: tasks are deleted together with their project, their tombstones are dropped after it
+    project_id = models.IntegerField(_('project id'))
+    task_id = models.IntegerField(_('task id'))
+    annotation_id = models.IntegerField(
+        _('annotation id'),
+        null=True,
+        default=None,
+        help_text='Empty when the whole task was deleted',
+    )
+    deleted_at = models.DateTimeField(_('deleted at'), auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['project_id', 'deleted_at']),
+            models.Index(fields=['task_id', 'deleted_at']),
+        ]
+
+
+def record_task_tombstones(project_id, task_ids):
+    """Tombstones for tasks deleted with bulk operations, which unlink tasks from the project first"""
+    ExportTombstone.objects.bulk_create(
+        [ExportTombstone(project_id=project_id, task_id=task_id) for task_id in task_ids],
+        batch_size=settings.BATCH_SIZE,
+    )
+
+
 class DataExport(object):
     # TODO: deprecated
     @staticmethod
@@ -249,3 +298,206 @@ class ConvertedFormat(models.Model):
             if self.file:
                 self.file.delete()
         super().delete(*args, **kwargs)
+
+
+class VisualizationReport(models.Model):
+    """PDF with categorical charts of project data, rendered by a background job"""
+
+    class Status(models.TextChoices):
+        CREATED = 'created', _('Created')
+        IN_PROGRESS = 'in_progress', _('In progress')
+        FAILED = 'failed', _('Failed')
+        COMPLETED = 'completed', _('Completed')
+
+    project = models.ForeignKey(
+        'projects.Project',
+        related_name='visualization_reports',
+        on_delete=models.CASCADE,
+    )
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name='+',
+        on_delete=models.SET_NULL,
+        null=True,
+        verbose_name=_('created by'),
+    )
+    params = models.JSONField(
+        _('chart parameters'),
+        default=dict,
+        help_text='column_key, category, include_all_tasks and ignore_keys used to render the report',
+    )
+    file = models.FileField(
+        upload_to=settings.DELAYED_EXPORT_DIR,
+        null=True,
+    )
+    status = models.CharField(
+        _('report status'),
+        max_length=64,
+        choices=Status.choices,
+        default=Status.CREATED,
+    )
+    counters = models.JSONField(
+        _('rendering meta data'),
+        default=dict,
+        help_text='Rendered and total page numbers',
+    )
+    traceback = models.TextField(null=True, blank=True, help_text='Traceback report in case of errors')
+    created_at = models.DateTimeField(
+        _('created at'),
+        auto_now_add=True,
+        help_text='Creation time',
+    )
+    finished_at = models.DateTimeField(
+        _('finished at'),
+        help_text='Complete or fail time',
+        null=True,
+        default=None,
+    )
+
+    def has_permission(self, user):
+        user.project = self.project  # link for activity log
+        return self.project.has_permission(user)
+
+    def delete(self, *args, **kwargs):
+        if self.file:
+            self.file.delete()
+        super().delete(*args, **kwargs)
+
+
+# =========== VISUALIZATION SNAPSHOT UPDATES ===========
+
+
+@receiver(post_save, sender=Task)
+def mark_visualization_task_dirty(sender, instance, created, update_fields, **kwargs):
+    """Task data is part of the visualization frame, other task fields are not"""
+    if update_fields and 'data' not in update_fields:
+        return
+    mark_tasks_dirty(instance.project_id, [instance.id])
+
+
+@receiver(post_delete, sender=Task)
+def mark_visualization_deleted_task_dirty(sender, instance, **kwargs):
+    mark_tasks_dirty(instance.project_id, [instance.id])
+
+
+@receiver(post_save, sender=Annotation)
+@receiver(post_delete, sender=Annotation)
+@receiver(post_save, sender=Prediction)
+@receiver(post_delete, sender=Prediction)
+def mark_visualization_result_task_dirty(sender, instance, **kwargs):
+    """Annotation and prediction results are part of the visualization frame of their task"""
+    project_id = instance.project_id or instance.task.project_id
+    mark_tasks_dirty(project_id, [instance.task_id])
+
+
+@receiver(post_bulk_create, sender=Annotation)
+@receiver(post_bulk_create, sender=Prediction)
+def mark_visualization_bulk_result_tasks_dirty(sender, objs, **kwargs):
+    task_ids_by_project = defaultdict(list)
+    for instance in objs:
+        task_ids_by_project[instance.project_id or instance.task.project_id].append(instance.task_id)
+    for project_id, task_ids in task_ids_by_project.items():
+        mark_tasks_dirty(project_id, task_ids)
+
+
+@receiver(post_delete, sender='projects.Project')
+def drop_visualization_snapshot(sender, instance, **kwargs):
+    ProjectDataFrameCache(instance.id).drop()
+
+
+# =========== DELTA EXPORT TOMBSTONES ===========
+
+
+class TombstoneBatch:
+    """Tombstones of rows deleted in one transaction, written with one bulk insert when it's committed
+
+    Rows of deleted projects get no tombstones, annotations of deleted tasks are covered by the task tombstone.
+    """
+
+    def __init__(self):
+        self.tombstones = []
+        self.deleted_projects = set()
+        self.deleted_tasks = set()
+
+    def __call__(self):
+        tombstones = [
+            tombstone
+            for tombstone in self.tombstones
+            if tombstone.project_id not in self.deleted_projects
+            and (tombstone.annotation_id is None or tombstone.task_id not in self.deleted_tasks)
+        ]
+        annotation_task_ids = {tombstone.task_id for tombstone in tombstones if tombstone.annotation_id is not None}
+        if annotation_task_ids:
+            # tasks unlinked from the project by bulk deletions have their own tombstones
+            project_task_ids = set(
+                Task.objects.filter(id__in=annotation_task_ids, project__isnull=False).values_list('id', flat=True)
+            )
+            tombstones = [
+                tombstone
+                for tombstone in tombstones
+                if tombstone.annotation_id is None or tombstone.task_id in project_task_ids
+            ]
+        ExportTombstone.objects.bulk_create(tombstones, batch_size=settings.BATCH_SIZE)
+
+
+def get_tombstone_batch():
+    """Batch of the current transaction, deletions run in the transaction of the Collector"""
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        return None
+    # the batch is registered as an on_commit callback, a rolled back transaction discards it
+    for callback in connection.run_on_commit:
+        if isinstance(callback[1], TombstoneBatch):
+            return callback[1]
+    batch = TombstoneBatch()
+    transaction.on_commit(batch)
+    return batch
+
+
+def record_tombstone(tombstone):
+    batch = get_tombstone_batch()
+    if batch is None:
+        batch = TombstoneBatch()
+        batch.tombstones.append(tombstone)
+        batch()
+    else:
+        batch.tombstones.append(tombstone)
+
+
+@receiver(pre_delete, sender='projects.Project')
+def skip_deleted_project_tombstones(sender, instance, **kwargs):
+    batch = get_tombstone_batch()
+    if batch is not None:
+        batch.deleted_projects.add(instance.id)
+
+
+@receiver(pre_delete, sender=Task)
+def skip_deleted_task_annotation_tombstones(sender, instance, **kwargs):
+    batch = get_tombstone_batch()
+    if batch is not None:
+        batch.deleted_tasks.add(instance.id)
+
+
+@receiver(post_delete, sender=Task)
+def record_deleted_task_tombstone(sender, instance, **kwargs):
+    if instance.project_id:
+        record_tombstone(ExportTombstone(project_id=instance.project_id, task_id=instance.id))
+
+
+@receiver(post_delete, sender=Annotation)
+def record_deleted_annotation_tombstone(sender, instance, **kwargs):
+    if instance.project_id and instance.task_id:
+        record_tombstone(
+            ExportTombstone(project_id=instance.project_id, task_id=instance.task_id, annotation_id=instance.id)
+        )
+
+
+@receiver(post_delete, sender='projects.Project')
+def drop_project_tombstones(sender, instance, **kwargs):
+    ExportTombstone.objects.filter(project_id=instance.id).delete()
+
+
+def drop_deleted_project_data(project_id):
+    """Cleanup of the project post_delete receivers above, for deletes made with signals disconnected"""
+    ExportTombstone.objects.filter(project_id=project_id).delete()
+    ProjectDataFrameCache(project_id).drop()
@@ -14,7 +14,7 @@ from tasks.serializers import AnnotationDraftSerializer, PredictionSerializer
 from users.models import User
 from users.serializers import UserSimpleSerializer
 
-from .models import ConvertedFormat, Export
+from .models import ConvertedFormat, Export, VisualizationReport
 
 
 class CompletedBySerializer(serializers.ModelSerializer):
@@ -95,6 +95,8 @@ class ExportSerializer(serializers.ModelSerializer):
             'md5',
             'counters',
             'converted_formats',
+            'since',
+            'watermark',
         ]
         fields = ['title'] + read_only
 
@@ -135,6 +137,21 @@ class TaskFilterOptionsSerializer(serializers.Serializer):
         '`exclude` - exclude all tasks with at least one not skipped annotation',
     )
     only_with_annotations = serializers.BooleanField(default=False, required=False, help_text='')
+    since = serializers.DateTimeField(
+        allow_null=True,
+        required=False,
+        help_text='Delta export: only tasks changed after this time and ids of tasks deleted after it',
+    )
+    base_export = serializers.IntegerField(
+        allow_null=True,
+        required=False,
+        help_text='Delta export: changes since the watermark of this completed export snapshot',
+    )
+
+    def validate(self, data):
+        if data.get('since') and data.get('base_export'):
+            raise serializers.ValidationError('Use either since or base_export')
+        return data
 
 
 class AnnotationFilterOptionsSerializer(serializers.Serializer):
@@ -202,10 +219,30 @@ class ExportParamSerializer(serializers.Serializer):
         default=False, help_text='Download all tasks or only finished.', required=False
     )
 
+
 class VisualizationParamSerializer(serializers.Serializer):
     include_all_tasks = serializers.BooleanField(default=False, required=False)
     ignore_keys = serializers.CharField(default='', required=False)
 
+
+class VisualizationReportCreateSerializer(VisualizationParamSerializer):
+    column_key = serializers.CharField(help_text='Column to draw the value distribution of.')
+    category = serializers.CharField(
+        default='all',
+        required=False,
+        help_text='Column to split the report by, one page per value. `all` for one page.',
+    )
+
+
+class VisualizationReportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = VisualizationReport
+        fields = ['id', 'created_by', 'created_at', 'finished_at', 'status', 'params', 'counters', 'traceback']
+        read_only_fields = fields
+
+    created_by = UserSimpleSerializer(required=False)
+
+
 class BaseExportDataSerializerForInteractive(InteractiveMixin, BaseExportDataSerializer):
     pass
 
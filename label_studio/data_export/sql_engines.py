@@ -0,0 +1,194 @@
+"""This file and its contents are licensed under the Apache License 2.0. Please see the included NOTICE for copyright information and LICENSE for a copy of the license.
+"""
+import json
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+try:
+    import duckdb
+
+    duckdb_loaded = True
+except (ModuleNotFoundError, ImportError):
+    duckdb_loaded = False
+
+logger = logging.getLogger(__name__)
+
+# visualization queries always select from this table name
+TABLE_NAME = 'df'
+# the only operations user queries may run on cached sqlite connections
+SQLITE_READ_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+
+
+def prepare_dataframe_for_sql(df: pd.DataFrame) -> pd.DataFrame:
+    """Serialize list and dict values to JSON strings, SQL engines can't store them as is"""
+    df = pd.DataFrame(df)
+    for column in df.columns:
+        if df[column].dtype == 'object':
+            values = df[column]
+            mask = values.map(lambda x: isinstance(x, (list, dict)))
+            if mask.any():
+                df[column] = values.where(~mask, values[mask].map(json.dumps))
+    return df
+
+
+def rename_result_columns(result_df: pd.DataFrame) -> pd.DataFrame:
+    """Rename the first three columns to X, Y and Z unless the query already named them"""
+    if 'X' not in result_df.columns or 'Y' not in result_df.columns:
+        num_columns = len(result_df.columns)
+        if num_columns >= 1:
+            result_df = result_df.rename(columns={result_df.columns[0]: 'X'})
+        if num_columns >= 2:
+            result_df = result_df.rename(columns={result_df.columns[1]: 'Y'})
+        if num_columns >= 3:
+            result_df = result_df.rename(columns={result_df.columns[2]: 'Z'})
+    return result_df
+
+
+class SQLEngine:
+    """Base class of visualization query engines
+
+    Engines keep the prepared frames registered under a table key, so repeated queries over
+    the same project snapshot skip preparation and loading. Passing `table_key=None` registers
+    a throwaway table for a single query. Registered tables are shared by all users of a project,
+    so engines must run user queries read-only.
+    """
+
+    name = None
+
+    def __init__(self, max_tables=8):
+        self.max_tables = max_tables
+        self._tables = OrderedDict()
+        self._lock = threading.Lock()
+
+    def execute(self, df: pd.DataFrame, query: str, table_key=None) -> pd.DataFrame:
+        if table_key is None:
+            table = self.register(prepare_dataframe_for_sql(df))
+            try:
+                result_df = self.query(table, query)
+            finally:
+                self.unregister(table)
+            return rename_result_columns(result_df)
+
+        table, table_lock = self._get_table(df, table_key)
+        with table_lock:
+            result_df = self.query(table, query)
+        return rename_result_columns(result_df)
+
+    def _get_table(self, df, table_key):
+        with self._lock:
+            if table_key in self._tables:
+                self._tables.move_to_end(table_key)
+                return self._tables[table_key]
+
+        # prepare outside of the registry lock, it's the slowest part
+        entry = (self.register(prepare_dataframe_for_sql(df)), threading.Lock())
+        with self._lock:
+            if table_key in self._tables:
+                # registered by a concurrent request meanwhile
+                self.unregister(entry[0])
+                return self._tables[table_key]
+            self._tables[table_key] = entry
+            while len(self._tables) > self.max_tables:
+                _, (evicted, evicted_lock) = self._tables.popitem(last=False)
+                with evicted_lock:
+                    self.unregister(evicted)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            while self._tables:
+                _, (table, table_lock) = self._tables.popitem()
+                with table_lock:
+                    self.unregister(table)
+
+    def register(self, df: pd.DataFrame):
+        raise NotImplementedError
+
+    def unregister(self, table):
+        pass
+
+    def query(self, table, query: str) -> pd.DataFrame:
+        raise NotImplementedError
+
+
+class DuckDBEngine(SQLEngine):
+    """Columnar engine, scans pandas buffers in place without copying them into a database"""
+
+    name = 'duckdb'
+
+    def register(self, df):
+        connection = duckdb.connect(database=':memory:', config={'enable_external_access': False})
+        connection.register(TABLE_NAME, df)
+        return connection
+
+    def unregister(self, connection):
+        connection.close()
+
+    def query(self, connection, query):
+        # in-memory duckdb can't be opened read-only, so anything but a single SELECT is rejected
+        statements = connection.extract_statements(query)
+        if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+            raise ValueError('Only a single SELECT query is allowed')
+        return connection.execute(query).fetchdf()
+
+
+class SQLiteEngine(SQLEngine):
+    """In-memory SQLite database per registered frame, same SQL dialect as pandasql"""
+
+    name = 'sqlite'
+
+    def register(self, df):
+        connection = sqlite3.connect(':memory:', check_same_thread=False)
+        df.to_sql(TABLE_NAME, connection, index=False)
+        connection.execute('PRAGMA query_only=ON')
+        # the authorizer also denies pragmas, so queries can't turn query_only off
+        connection.set_authorizer(
+            lambda action, *args: sqlite3.SQLITE_OK if action in SQLITE_READ_ACTIONS else sqlite3.SQLITE_DENY
+        )
+        return connection
+
+    def unregister(self, connection):
+        connection.close()
+
+    def query(self, connection, query):
+        return pd.read_sql_query(query, connection)
+
+
+class PandasSQLEngine(SQLEngine):
+    """Legacy pandasql path, copies the frame into a new SQLite database on every query"""
+
+    name = 'pandasql'
+
+    def execute(self, df, query, table_key=None):
+        import pandasql
+
+        return rename_result_columns(pandasql.sqldf(query, {TABLE_NAME: prepare_dataframe_for_sql(df)}))
+
+
+SQL_ENGINES = {engine.name: engine for engine in (DuckDBEngine, SQLiteEngine, PandasSQLEngine)}
+
+_engine = None
+
+
+def get_sql_engine() -> SQLEngine:
+    """Engine selected by VISUALIZATION_SQL_ENGINE, SQLite by default
+
+    DuckDB is opt-in (`duckdb` or `auto`): its dialect differs from SQLite, e.g. double quoted strings
+    are identifiers, `/` on integers returns floats, LIKE is case sensitive and GROUP BY is strict.
+    """
+    global _engine
+    if _engine is None:
+        from django.conf import settings
+
+        name = settings.VISUALIZATION_SQL_ENGINE
+        if name == 'auto':
+            name = DuckDBEngine.name if duckdb_loaded else SQLiteEngine.name
+        if name == DuckDBEngine.name and not duckdb_loaded:
+            logger.warning('duckdb is not installed, falling back to sqlite visualization engine')
+            name = SQLiteEngine.name
+        _engine = SQL_ENGINES[name](max_tables=settings.VISUALIZATION_SQL_ENGINE_MAX_TABLES)
+    return _engine
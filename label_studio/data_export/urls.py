@@ -11,6 +11,21 @@ _api_urlpatterns = [
     # export api
     path('<int:pk>/export', api.ExportAPI.as_view(), name='project-export'),
     path('<int:pk>/visualize/', api.VisualizationAPI.as_view(), name='project-visualize'),
+    path(
+        '<int:pk>/visualize/reports/',
+        api.VisualizationReportListAPI.as_view(),
+        name='project-visualization-reports-list',
+    ),
+    path(
+        '<int:pk>/visualize/reports/<int:report_pk>',
+        api.VisualizationReportDetailAPI.as_view(),
+        name='project-visualization-reports-detail',
+    ),
+    path(
+        '<int:pk>/visualize/reports/<int:report_pk>/download',
+        api.VisualizationReportDownloadAPI.as_view(),
+        name='project-visualization-reports-download',
+    ),
     path('<int:pk>/export/formats', api.ExportFormatsListAPI.as_view(), name='project-export-formats'),
     # Previously exported results
     path('<int:pk>/export/files', api.ProjectExportFiles.as_view(), name='project-export-files'),
@@ -20,6 +35,7 @@ _api_urlpatterns = [
         '<int:pk>/exports/<int:export_pk>/download', api.ExportDownloadAPI.as_view(), name='project-exports-download'
     ),
     path('<int:pk>/exports/<int:export_pk>/convert', api.ExportConvertAPI.as_view(), name='project-exports-convert'),
+    path('<int:pk>/exports/<int:export_pk>/resume', api.ExportResumeAPI.as_view(), name='project-exports-resume'),
 ]
 
 urlpatterns = [
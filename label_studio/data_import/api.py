@@ -4,6 +4,7 @@ import base64
 import json
 import logging
 import mimetypes
+import re
 import time
 from typing import Union
 from urllib.parse import unquote, urlparse
@@ -19,7 +20,7 @@ from core.utils.params import bool_from_request, list_of_strings_from_request
 from csp.decorators import csp
 from django.conf import settings
 from django.db import transaction
-from django.http import HttpRequest, HttpResponse, HttpResponseRedirect
+from django.http import HttpRequest, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.utils.decorators import method_decorator
 from drf_yasg.utils import swagger_auto_schema
 from projects.models import Project, ProjectImport, ProjectReimport
@@ -838,3 +839,165 @@ class ProjectPresignStorageData(PresignAPIMixin, APIView):
             return Response(status=status.HTTP_404_NOT_FOUND)
 
         return self.handle_presign(request, fileuri, project)
+
+
+def parse_range(header, size):
+    """(start, end) of a single byte range header, None for no or unsupported ranges
+    :raises ValueError: if the range can't be satisfied
+    """
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', (header or '').strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        # suffix range: the last bytes of the object
+        start, end = max(size - int(last), 0), size - 1
+        if int(last) == 0:
+            raise ValueError('Empty suffix range')
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError('Range is out of the object')
+    return start, end
+
+
+class ProxyAPIMixin:
+    """Stream storage objects with Range support, recently viewed objects are served from the disk cache"""
+
+    def handle_proxy(self, request: HttpRequest, fileuri: str, instance: Union[Task, Project]) -> HttpResponse:
+        from io_storages.functions import get_storage_by_url
+        from io_storages.proxy_cache import MediaCache, media_cache
+
+        model_name = type(instance).__name__
+        if not instance.has_permission(request.user):
+            return Response(status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            fileuri = base64.urlsafe_b64decode(fileuri.encode()).decode()
+        except Exception:
+            fileuri = unquote(fileuri)
+
+        project = instance if isinstance(instance, Project) else instance.project
+        storage_objects = project.get_all_storage_objects(type_='import')
+        storage = instance.get_storage(storage_objects) if isinstance(instance, Task) else None
+        storage = storage or get_storage_by_url(fileuri, storage_objects)
+        if storage is None or not storage.can_proxy:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            meta = storage.get_object_meta(fileuri)
+        except Exception as exc:
+            logger.error(f'Failed to proxy storage uri {fileuri} for {model_name} {instance.id}: {exc}')
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        # the object version is a part of the key, replaced objects get a new ETag and a new cache entry
+        key = MediaCache.get_key(storage, fileuri, meta.get('version'))
+        headers = {
+            'Accept-Ranges': 'bytes',
+            'Cache-Control': f'private, max-age={settings.STORAGE_PROXY_MAX_AGE}',
+            'ETag': f'"{key}"',
+        }
+        if request.headers.get('If-None-Match') == headers['ETag']:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            content_type = meta.get('content_type') or mimetypes.guess_type(fileuri)[0] or 'application/octet-stream'
+            response = None
+            path, _ = media_cache.get(key)
+            if path is not None:
+                try:
+                    response = RangedFileResponse(request, open(path, 'rb'), content_type=content_type)
+                except OSError:
+                    # evicted by another process in the meantime
+                    response = None
+            if response is None:
+                cache_key = key if media_cache.can_cache(meta['size']) else None
+                response = self.stream_object(request, storage, fileuri, meta, content_type, cache_key)
+
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    @staticmethod
+    def stream_object(request, storage, fileuri, meta, content_type, cache_key=None):
+        """Stream the object from the storage, only the requested range is read
+
+        With `cache_key` the object is cached too: whole objects are written to the cache as they are
+        streamed, for ranges it's downloaded in the background, so the first bytes aren't held up.
+        """
+        from io_storages.proxy_cache import media_cache
+
+        size = meta['size']
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        # players usually start with `bytes=0-`, it's the whole object
+        if byte_range is None or byte_range == (0, size - 1):
+            chunks = storage.iter_object(fileuri)
+            if cache_key is not None:
+                chunks = media_cache.tee(cache_key, chunks, meta)
+            if byte_range is None:
+                response = StreamingHttpResponse(chunks, content_type=content_type)
+            else:
+                response = StreamingHttpResponse(
+                    chunks, status=status.HTTP_206_PARTIAL_CONTENT, content_type=content_type
+                )
+                response['Content-Range'] = f'bytes 0-{size - 1}/{size}'
+            response['Content-Length'] = str(size)
+            return response
+
+        start, end = byte_range
+        if cache_key is not None:
+            media_cache.fill_in_background(cache_key, lambda: storage.iter_object(fileuri), meta)
+        response = StreamingHttpResponse(
+            storage.iter_object(fileuri, start, end),
+            status=status.HTTP_206_PARTIAL_CONTENT,
+            content_type=content_type,
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+        return response
+
+
+class TaskProxyStorageData(ProxyAPIMixin, APIView):
+    """A storage media proxy at the task level."""
+
+    swagger_schema = None
+    http_method_names = ['get']
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, *args, **kwargs):
+        fileuri = request.GET.get('fileuri')
+        if fileuri is None:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            task = Task.objects.get(pk=kwargs['task_id'])
+        except Task.DoesNotExist:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        return self.handle_proxy(request, fileuri, task)
+
+
+class ProjectProxyStorageData(ProxyAPIMixin, APIView):
+    """A storage media proxy at the project level."""
+
+    swagger_schema = None
+    http_method_names = ['get']
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, *args, **kwargs):
+        fileuri = request.GET.get('fileuri')
+        if fileuri is None:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            project = Project.objects.get(pk=kwargs['project_id'])
+        except Project.DoesNotExist:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        return self.handle_proxy(request, fileuri, project)
@@ -29,4 +29,10 @@ urlpatterns = [
         api.ProjectPresignStorageData.as_view(),
         name='project-storage-data-presign',
     ),
+    path('tasks/<int:task_id>/proxy/', api.TaskProxyStorageData.as_view(), name='task-storage-data-proxy'),
+    path(
+        'projects/<int:project_id>/proxy/',
+        api.ProjectProxyStorageData.as_view(),
+        name='project-storage-data-proxy',
+    ),
 ]
@@ -6,6 +6,7 @@ from datetime import datetime
 from core.permissions import AllPermissions
 from core.redis import start_job_async_or_sync
 from core.utils.common import load_func
+from data_export.models import record_task_tombstones
 from data_manager.functions import evaluate_predictions
 from django.conf import settings
 from projects.models import Project
@@ -38,6 +39,8 @@ def delete_tasks(project, queryset, **kwargs):
     count = len(tasks_ids)
     tasks_ids_list = [task['id'] for task in tasks_ids]
     project_count = project.tasks.count()
+    # tasks are deleted without a project, so delta exports learn about them here
+    record_task_tombstones(project.id, tasks_ids_list)
     # unlink tasks from project
     queryset = Task.objects.filter(id__in=tasks_ids_list)
     queryset.update(project=None)
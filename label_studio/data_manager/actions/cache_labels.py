@@ -5,6 +5,7 @@ import logging
 
 from core.permissions import AllPermissions
 from core.redis import start_job_async_or_sync
+from data_export.dataframes import mark_tasks_dirty
 from tasks.models import Annotation, Prediction, Task
 
 logger = logging.getLogger(__name__)
@@ -45,6 +46,7 @@ def cache_labels_job(project, queryset, **kwargs):
             task.data[column_name] = ', '.join(sorted(list(set(task_labels))))
 
     Task.objects.bulk_update(tasks, fields=['data'], batch_size=1000)
+    mark_tasks_dirty(project.id, [task.id for task in tasks])
     first_task = Task.objects.get(id=queryset.first().id)
     project.summary.update_data_columns([first_task])
     return {'response_code': 200, 'detail': f'Updated {len(tasks)} tasks'}
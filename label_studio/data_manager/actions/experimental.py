@@ -7,6 +7,7 @@ import random
 import ujson as json
 from core.permissions import AllPermissions
 from core.utils.db import fast_first
+from data_export.dataframes import mark_project_dirty
 from data_manager.functions import DataManagerException
 from django.conf import settings
 from tasks.models import Annotation, Task
@@ -189,6 +190,8 @@ def add_data_field(project, queryset, **kwargs):
                 )
             )
 
+    # bulk updates don't send signals
+    mark_project_dirty(project.id)
     project.summary.update_data_columns([queryset.first()])
     return {'response_code': 200, 'detail': f'Updated {size} tasks'}
 
@@ -2,28 +2,35 @@
 """
 import os
 import uuid
-import zipfile
 import logging
 
 from asgiref.sync import async_to_sync, sync_to_async
 from core.feature_flags import flag_set
 from core.permissions import ViewClassPermission, all_permissions
+from core.redis import start_job_async_or_sync
 from core.utils.common import int_from_request, load_func
 from core.utils.params import bool_from_request
 from data_manager.actions import get_all_actions, perform_action
+from data_manager.data_column_indexes import add_data_column_index
+from data_manager.dropbox_archive import DropboxArchive
 from data_manager.functions import evaluate_predictions, get_prepare_params, get_prepared_queryset
 from data_manager.managers import get_fields_for_evaluation
-from data_manager.models import View
+from data_manager.models import DataColumnIndex, View
+from data_manager.pagination import TaskKeysetPagination
 from data_manager.prepare_params import filters_schema, ordering_schema, prepare_params_schema
 from data_manager.serializers import (
+    DataColumnIndexSerializer,
     DataManagerTaskSerializer,
     ViewOrderSerializer,
     ViewResetSerializer,
     ViewSerializer,
     DropboxAPISerializer,
 )
+from data_manager.thumbnails import Thumbnail, generate_thumbnails, get_thumbnail, is_thumbnail_supported
 from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.utils.decorators import method_decorator
+from django.utils.http import http_date
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
@@ -33,13 +40,10 @@ from rest_framework import generics, viewsets
 from rest_framework.decorators import action
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
-from django.http import FileResponse, HttpResponse
+from django.http import FileResponse, StreamingHttpResponse
 from rest_framework.views import APIView
 from tasks.models import Annotation, Prediction, Task
 
-from PIL import Image
-import ffmpeg
-
 logger = logging.getLogger(__name__)
 BASE_DROPBOX_DIR = os.getenv('BASE_DROPBOX_DIR', '/path/to/dropbox')
 
@@ -262,6 +266,16 @@ class TaskListAPI(generics.ListCreateAPIView):
     )
     pagination_class = TaskPagination
 
+    @property
+    def paginator(self):
+        # infinite scroll in large projects opts in to keyset pagination by passing `cursor`
+        if not hasattr(self, '_paginator'):
+            if TaskKeysetPagination.cursor_query_param in self.request.GET:
+                self._paginator = TaskKeysetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
     @staticmethod
     def get_task_serializer_context(request, project):
         all_fields = request.GET.get('fields', None) == 'all'  # false by default
@@ -280,19 +294,28 @@ class TaskListAPI(generics.ListCreateAPIView):
 
     @staticmethod
     def prefetch(queryset):
-        return queryset.prefetch_related(
+        return queryset.select_related(*Task.get_storage_link_fields()).prefetch_related(
             'annotations',
             'predictions',
             'annotations__completed_by',
             'project',
-            'io_storages_azureblobimportstoragelink',
-            'io_storages_gcsimportstoragelink',
-            'io_storages_localfilesimportstoragelink',
-            'io_storages_redisimportstoragelink',
-            'io_storages_s3importstoragelink',
             'file_upload',
         )
 
+    def load_page(self, ids, fields_for_evaluation, all_fields, request, project):
+        """Annotated tasks of the page with their relations, in the order of ids"""
+        tasks = self.prefetch(
+            Task.prepared.annotate_queryset(
+                Task.objects.filter(id__in=ids),
+                fields_for_evaluation=fields_for_evaluation,
+                all_fields=all_fields,
+                request=request,
+                project=project,
+            )
+        )
+        tasks_by_ids = {task.id: task for task in tasks}
+        return [tasks_by_ids[_id] for _id in ids]
+
     def get(self, request):
         # get project
         view_pk = int_from_request(request.GET, 'view', 0) or int_from_request(request.data, 'view', 0)
@@ -308,6 +331,7 @@ class TaskListAPI(generics.ListCreateAPIView):
             return Response({'detail': 'Neither project nor view id specified'}, status=404)
         # get prepare params (from view or from payload directly)
         prepare_params = get_prepare_params(request, project)
+        self.project, self.prepare_params = project, prepare_params
         queryset = self.get_task_queryset(request, prepare_params)
         context = self.get_task_serializer_context(self.request, project)
 
@@ -324,19 +348,7 @@ class TaskListAPI(generics.ListCreateAPIView):
             all_fields = None
         if page is not None:
             ids = [task.id for task in page]  # page is a list already
-            tasks = list(
-                self.prefetch(
-                    Task.prepared.annotate_queryset(
-                        Task.objects.filter(id__in=ids),
-                        fields_for_evaluation=fields_for_evaluation,
-                        all_fields=all_fields,
-                        request=request,
-                    )
-                )
-            )
-            tasks_by_ids = {task.id: task for task in tasks}
-            # keep ids ordering
-            page = [tasks_by_ids[_id] for _id in ids]
+            page = self.load_page(ids, fields_for_evaluation, all_fields, request, project)
 
             # retrieve ML predictions if tasks don't have them
             if not review and project.evaluate_predictions_automatically:
@@ -345,8 +357,9 @@ class TaskListAPI(generics.ListCreateAPIView):
                 # will slow down initial DM load
                 # if project.retrieve_predictions_automatically is deprecated now and no longer used
                 tasks_for_predictions = Task.objects.filter(id__in=ids, predictions__isnull=True)
-                evaluate_predictions(tasks_for_predictions)
-                [tasks_by_ids[_id].refresh_from_db() for _id in ids]
+                if tasks_for_predictions.exists():
+                    evaluate_predictions(tasks_for_predictions)
+                    page = self.load_page(ids, fields_for_evaluation, all_fields, request, project)
 
             if flag_set('fflag_fix_back_leap_24_tasks_api_optimization_05092023_short'):
                 serializer = self.task_serializer_class(
@@ -361,8 +374,14 @@ class TaskListAPI(generics.ListCreateAPIView):
         # all tasks
         if project.evaluate_predictions_automatically:
             evaluate_predictions(queryset.filter(predictions__isnull=True))
-        queryset = Task.prepared.annotate_queryset(
-            queryset, fields_for_evaluation=fields_for_evaluation, all_fields=all_fields, request=request
+        queryset = self.prefetch(
+            Task.prepared.annotate_queryset(
+                queryset,
+                fields_for_evaluation=fields_for_evaluation,
+                all_fields=all_fields,
+                request=request,
+                project=project,
+            )
         )
         serializer = self.task_serializer_class(queryset, many=True, context=context)
         return Response(serializer.data)
@@ -433,6 +452,76 @@ class ProjectColumnsAPI(APIView):
         return Response(data)
 
 
+@method_decorator(
+    name='get',
+    decorator=swagger_auto_schema(
+        tags=['Data Manager'],
+        x_fern_audiences=['internal'],
+        operation_summary='List indexed data columns',
+        operation_description='List task data keys of the project served by typed partial expression indexes.',
+        manual_parameters=[
+            openapi.Parameter(
+                name='project', type=openapi.TYPE_INTEGER, in_=openapi.IN_QUERY, description='Project ID'
+            ),
+        ],
+    ),
+)
+@method_decorator(
+    name='post',
+    decorator=swagger_auto_schema(
+        tags=['Data Manager'],
+        x_fern_audiences=['internal'],
+        operation_summary='Index data column',
+        operation_description='Detect the type of a task data key and build its index in the background.',
+        request_body=DataColumnIndexSerializer,
+    ),
+)
+@method_decorator(
+    name='delete',
+    decorator=swagger_auto_schema(
+        tags=['Data Manager'],
+        x_fern_audiences=['internal'],
+        operation_summary='Drop data column index',
+        manual_parameters=[
+            openapi.Parameter(
+                name='project', type=openapi.TYPE_INTEGER, in_=openapi.IN_QUERY, description='Project ID'
+            ),
+            openapi.Parameter(name='key', type=openapi.TYPE_STRING, in_=openapi.IN_QUERY, description='Data key'),
+        ],
+    ),
+)
+class DataColumnIndexAPI(APIView):
+    permission_required = ViewClassPermission(
+        GET=all_permissions.projects_view,
+        POST=all_permissions.projects_change,
+        DELETE=all_permissions.projects_change,
+    )
+
+    def get(self, request):
+        project = generics.get_object_or_404(Project, pk=int_from_request(request.GET, 'project', 0))
+        self.check_object_permissions(request, project)
+        return Response(DataColumnIndexSerializer(project.data_column_indexes.order_by('id'), many=True).data)
+
+    def post(self, request):
+        serializer = DataColumnIndexSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        project = serializer.validated_data['project']
+        self.check_object_permissions(request, project)
+        if serializer.validated_data['key'] not in (project.summary.all_data_columns or {}):
+            return Response({'key': ['Key is not found in task data of the project']}, status=400)
+
+        column = add_data_column_index(project, serializer.validated_data['key'])
+        return Response(DataColumnIndexSerializer(column).data, status=201)
+
+    def delete(self, request):
+        project = generics.get_object_or_404(Project, pk=int_from_request(request.GET, 'project', 0))
+        self.check_object_permissions(request, project)
+        column = generics.get_object_or_404(DataColumnIndex, project=project, key=request.GET.get('key'))
+        # the index itself is dropped in background
+        column.delete()
+        return Response(status=204)
+
+
 @method_decorator(
     name='get',
     decorator=swagger_auto_schema(
@@ -599,14 +688,15 @@ class DropboxAPI(APIView):
                 return FileResponse(open(image_path, 'rb'))
 
         if download:
-            zip_filename = f"project_{pk}_dropbox.zip"
-            zip_filepath = os.path.join(dropbox_dir, zip_filename)
-            files =  os.listdir(dropbox_dir)
-            with zipfile.ZipFile(zip_filepath, 'w') as zipf:
-                for file in files:
-                    if valid_filetype(file):
-                        zipf.write(os.path.join(dropbox_dir, file), file)
-            return FileResponse(open(zip_filepath, 'rb'), as_attachment=True)
+            archive = DropboxArchive(dropbox_dir, f"project_{pk}_dropbox.zip")
+            files = archive.list_files()
+            signature = archive.signature(files)
+            cached_path = archive.get_cached(signature)
+            if cached_path:
+                return FileResponse(open(cached_path, 'rb'), as_attachment=True, filename=archive.filename)
+            response = StreamingHttpResponse(archive.stream(files, signature), content_type='application/zip')
+            response['Content-Disposition'] = f'attachment; filename="{archive.filename}"'
+            return response
 
         images = []
         for file in os.listdir(dropbox_dir):
@@ -630,19 +720,25 @@ class DropboxAPI(APIView):
         dropbox_dir = get_project_dropbox_dir(pk)
         os.makedirs(dropbox_dir, exist_ok=True)
 
+        saved_paths = []
         for file in files:
             try:
                 if not valid_filetype(file.name):
                     continue
                 file_name, file_format = os.path.splitext(file.name)
                 unique_filename = f"{uuid.uuid4()}{file_format}"
-                with open(os.path.join(dropbox_dir, unique_filename), 'wb') as f:
+                file_path = os.path.join(dropbox_dir, unique_filename)
+                with open(file_path, 'wb') as f:
                     for chunk in file.chunks():
                         f.write(chunk)
+                saved_paths.append(file_path)
             except Exception as e:
                 logger.error(f"Failed to process file {file.name}: {e}")
                 continue
 
+        if saved_paths:
+            start_job_async_or_sync(generate_thumbnails, saved_paths)
+
         return Response({"status": "success"}, status=201)
 
     def delete(self, request):
@@ -655,6 +751,8 @@ class DropboxAPI(APIView):
 
         image_path = os.path.join(get_project_dropbox_dir(pk), image)
         if os.path.exists(image_path):
+            if is_thumbnail_supported(image):
+                Thumbnail(image_path).delete()
             os.remove(image_path)
             return Response({"status": "success"}, status=204)
         else:
@@ -674,22 +772,25 @@ class ThumbnailAPI(APIView):
         image_path = os.path.join(get_project_dropbox_dir(pk), image)
         if not os.path.exists(image_path):
             return Response({"error": "Image/Video not found"}, status=404)
+        if not is_thumbnail_supported(image):
+            return Response({"error": "Invalid file type"}, status=400)
+
+        # Thumbnails are rendered once (usually in background right after upload) and then served from the cache
+        thumbnail = Thumbnail(image_path)
+        etag = f'"{thumbnail.key}"'
+        not_modified = get_conditional_response(request, etag=etag, last_modified=int(thumbnail.last_modified))
+        if not_modified is not None:
+            thumbnail.touch()
+            return not_modified
 
         try:
-            # Use PIL to create a thumbnail for images, and ffmpeg to create a thumbnail for videos
-            if image.lower().endswith(('png', 'jpg', 'jpeg', 'gif', 'bmp')):
-                img = Image.open(image_path)
-                img.thumbnail((100, 100))
-                response = HttpResponse(content_type="image/png")
-                img.save(response, "PNG")
-                return response
-            elif image.lower().endswith(('mp4', 'mov', 'avi', 'mkv')):
-                # Use ffmpeg to create a thumbnail for videos
-                thumbnail_data = ffmpeg.input(image_path, ss=0).filter('scale', 100, -1).output('pipe:', format='image2', vframes=1).run(capture_stdout=True)
-                response = HttpResponse(thumbnail_data[0], content_type="image/jpeg")
-                return response
-            else:
-                return Response({"error": "Invalid file type"}, status=400)
+            thumbnail = get_thumbnail(image_path)
+            response = FileResponse(open(thumbnail.path, 'rb'), content_type=thumbnail.content_type)
         except Exception as e:
             logger.error(f"Failed to create thumbnail for {image}: {e}")
-            return Response({"error": "Failed to create thumbnail"}, status=404)
\ No newline at end of file
+            return Response({"error": "Failed to create thumbnail"}, status=404)
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(thumbnail.last_modified)
+        patch_cache_control(response, private=True, max_age=settings.DROPBOX_THUMBNAIL_MAX_AGE)
+        return response
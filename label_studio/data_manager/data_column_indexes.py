@@ -0,0 +1,209 @@
+"""This file and its contents are licensed under the Apache License 2.0. Please see the included NOTICE for copyright information and LICENSE for a copy of the license.
+"""
+import hashlib
+import json
+import logging
+
+from core.redis import start_job_async_or_sync
+from data_manager.models import DataColumnIndex
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, FloatField, Func, TextField
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Cast
+
+logger = logging.getLogger(__name__)
+
+# json value types of postgres (jsonb_typeof) and sqlite (json_type) which are cast to numbers
+NUMBER_JSON_TYPES = {'number', 'integer', 'real'}
+
+
+def data_value_sql(column_sql, key_sql, column_type, vendor):
+    """SQL of a task.data key value of the given type, values of other types become NULL, so the cast never fails.
+    The same SQL is used for the index and for the queries, otherwise the planner can't match the index.
+    """
+    if vendor == 'postgresql':
+        if column_type == DataColumnIndex.Type.NUMBER:
+            return (
+                f"(CASE WHEN jsonb_typeof({column_sql} -> {key_sql}) = 'number' "
+                f'THEN ({column_sql} ->> {key_sql})::double precision END)'
+            )
+        return f'({column_sql} ->> {key_sql})'
+
+    if vendor == 'sqlite':
+        if column_type == DataColumnIndex.Type.NUMBER:
+            return (
+                f"(CASE WHEN json_type({column_sql}, {key_sql}) IN ('integer', 'real') "
+                f'THEN CAST(json_extract({column_sql}, {key_sql}) AS REAL) END)'
+            )
+        return f'json_extract({column_sql}, {key_sql})'
+
+    raise NotImplementedError(f'Typed data columns are not supported for {vendor}')
+
+
+def _key_param(key, vendor):
+    # sqlite addresses keys with json paths
+    return f'$.{json.dumps(key)}' if vendor == 'sqlite' else key
+
+
+class TypedDataValue(Func):
+    """Value of a task.data key with the type recorded in DataColumnIndex"""
+
+    def __init__(self, key, column_type):
+        self.key = key
+        self.column_type = column_type
+        output_field = FloatField() if column_type == DataColumnIndex.Type.NUMBER else TextField()
+        super().__init__(F('data'), output_field=output_field)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        # mysql and others use the generic cast
+        if self.column_type == DataColumnIndex.Type.NUMBER:
+            expression = Cast(KeyTextTransform(self.key, 'data'), output_field=FloatField())
+        else:
+            expression = KeyTextTransform(self.key, 'data')
+        return compiler.compile(expression.resolve_expression(compiler.query))
+
+    def _typed_sql(self, compiler, connection):
+        column_sql, params = compiler.compile(self.source_expressions[0])
+        sql = data_value_sql(column_sql, '%s', self.column_type, connection.vendor)
+        key = _key_param(self.key, connection.vendor)
+        return sql, (*params, *([key] * sql.count('%s')))
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self._typed_sql(compiler, connection)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self._typed_sql(compiler, connection)
+
+
+def index_name(project_id, key):
+    return f'task_data_{project_id}_{hashlib.sha1(key.encode()).hexdigest()[:12]}'
+
+
+def get_typed_data_columns(project):
+    """{key: type} of the project data columns with a detected type, cached on the project instance"""
+    if not hasattr(project, '_typed_data_columns'):
+        project._typed_data_columns = dict(
+            project.data_column_indexes.filter(status=DataColumnIndex.Status.COMPLETED).values_list('key', 'type')
+        )
+    return project._typed_data_columns
+
+
+def get_data_value_expression(project, key):
+    """Typed expression for a task.data key if the key is an indexed column, otherwise None"""
+    column_type = get_typed_data_columns(project).get(key)
+    return TypedDataValue(key, column_type) if column_type else None
+
+
+def get_value_type(value):
+    """DataColumnIndex type of a task.data value, None for empty values"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return DataColumnIndex.Type.NUMBER
+    return DataColumnIndex.Type.STRING
+
+
+def redetect_data_column_types(project, tasks_data):
+    """Detect the type of indexed columns again when imported tasks bring values of another type.
+    Until the job finishes the columns have no recorded type, so queries use the generic cast.
+    """
+    typed_columns = get_typed_data_columns(project)
+    if not typed_columns:
+        return
+    changed_keys = set()
+    for data in tasks_data:
+        for key, column_type in typed_columns.items():
+            value_type = get_value_type(data.get(key))
+            if value_type is not None and value_type != column_type:
+                changed_keys.add(key)
+    if not changed_keys:
+        return
+
+    logger.info(f'Data columns {changed_keys} of project {project.id} got values of another type, detecting again')
+    columns = project.data_column_indexes.filter(key__in=changed_keys)
+    column_ids = list(columns.values_list('id', flat=True))
+    columns.update(status=DataColumnIndex.Status.CREATED)
+    del project._typed_data_columns
+    for column_id in column_ids:
+        transaction.on_commit(lambda column_id=column_id: start_job_async_or_sync(create_data_column_index, column_id))
+
+
+def detect_column_type(project_id, key):
+    vendor = connection.vendor
+    if vendor == 'postgresql':
+        sql = 'select distinct jsonb_typeof(data -> %s) from task where project_id = %s'
+    elif vendor == 'sqlite':
+        sql = 'select distinct json_type(data, %s) from task where project_id = %s'
+    else:
+        return DataColumnIndex.Type.STRING
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [_key_param(key, vendor), project_id])
+        json_types = {row[0] for row in cursor.fetchall()} - {None, 'null'}
+    if json_types and json_types <= NUMBER_JSON_TYPES:
+        return DataColumnIndex.Type.NUMBER
+    return DataColumnIndex.Type.STRING
+
+
+def create_data_column_index(column_id):
+    """Job detecting the type of a data column and building its partial expression index"""
+    column = DataColumnIndex.objects.filter(id=column_id).first()
+    if column is None:
+        return
+    column.status = DataColumnIndex.Status.IN_PROGRESS
+    column.save(update_fields=['status'])
+    try:
+        previous_type = column.type
+        column.type = detect_column_type(column.project_id, column.key)
+        # sqlite and mysql projects only record the type, which already replaces the cast probe
+        if connection.vendor == 'postgresql':
+            if previous_type is not None and previous_type != column.type:
+                # the index of the other type has the same name
+                drop_data_column_index(index_name(column.project_id, column.key))
+            key_literal = "'" + column.key.replace("'", "''") + "'"
+            expression = data_value_sql('data', key_literal, column.type, 'postgresql')
+            # concurrent builds don't block imports, but they aren't possible inside of a transaction
+            concurrently = '' if connection.in_atomic_block else 'concurrently '
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'create index {concurrently}if not exists {index_name(column.project_id, column.key)} '
+                    f'on task (({expression})) where project_id = {int(column.project_id)}'
+                )
+        column.status = DataColumnIndex.Status.COMPLETED
+        column.error = None
+    except Exception as exc:
+        logger.error(f'Failed to index data column {column.key} of project {column.project_id}: {exc}', exc_info=True)
+        column.status = DataColumnIndex.Status.FAILED
+        column.error = str(exc)
+    column.save(update_fields=['type', 'status', 'error'])
+
+
+def drop_data_column_index(name):
+    if connection.vendor != 'postgresql':
+        return
+    concurrently = '' if connection.in_atomic_block else 'concurrently '
+    with connection.cursor() as cursor:
+        cursor.execute(f'drop index {concurrently}if exists {name}')
+
+
+def add_data_column_index(project, key, auto=False):
+    column, created = DataColumnIndex.objects.get_or_create(project=project, key=key, defaults={'auto': auto})
+    if created or column.status == DataColumnIndex.Status.FAILED:
+        transaction.on_commit(lambda: start_job_async_or_sync(create_data_column_index, column.id))
+    return column
+
+
+def maybe_index_data_column(project, key):
+    """Index a data key used for ordering or filtering once the project is large enough for it to matter"""
+    if key in get_typed_data_columns(project):
+        return
+    summary = getattr(project, 'summary', None)
+    all_data_columns = (summary.all_data_columns or {}) if summary else {}
+    if all_data_columns.get(key, 0) < settings.DATA_MANAGER_AUTO_INDEX_MIN_TASKS:
+        return
+    columns = project.data_column_indexes.all()
+    if columns.filter(key=key).exists() or columns.count() >= settings.DATA_MANAGER_MAX_INDEXED_COLUMNS:
+        return
+    logger.info(f'Data column {key} of project {project.id} is indexed automatically')
+    add_data_column_index(project, key, auto=True)
@@ -0,0 +1,118 @@
+"""This file and its contents are licensed under the Apache License 2.0. Please see the included NOTICE for copyright information and LICENSE for a copy of the license.
+"""
+import hashlib
+import json
+import logging
+import os
+import uuid
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_EXTENSIONS = ('png', 'jpg', 'jpeg', 'gif', 'bmp', 'mp4', 'raw', 'tiff', 'mov', 'avi', 'mkv')
+CHUNK_SIZE = 1024 * 1024
+
+
+class _ZipSink:
+    """Write-only file object collecting zipfile output, so it can be yielded to the client chunk by chunk
+
+    It has no `seek`, so zipfile writes entries with data descriptors instead of going back to patch headers.
+    Everything written is also copied to `tee`, if given.
+    """
+
+    def __init__(self, tee=None):
+        self.tee = tee
+        self.position = 0
+        self.chunks = []
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        if self.tee is not None:
+            self.tee.write(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class DropboxArchive:
+    """Zip archive of all media files of a project dropbox
+
+    Media is already compressed, so entries are stored as is and the archive is streamed while it's written.
+    The streamed bytes are also saved next to the dropbox and served directly by the following downloads,
+    until the listing of the dropbox (names, sizes and mtimes) no longer matches the one stored in the
+    archive comment.
+    """
+
+    def __init__(self, dropbox_dir, filename):
+        self.dropbox_dir = dropbox_dir
+        self.filename = filename
+        self.path = os.path.join(dropbox_dir, filename)
+
+    def list_files(self):
+        files = []
+        with os.scandir(self.dropbox_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.lower().endswith(ARCHIVE_EXTENSIONS):
+                    files.append((entry.name, entry.path))
+        return sorted(files)
+
+    @staticmethod
+    def signature(files):
+        listing = []
+        for name, path in files:
+            stat = os.stat(path)
+            listing.append([name, stat.st_size, stat.st_mtime_ns])
+        return hashlib.sha256(json.dumps(listing).encode()).hexdigest().encode()
+
+    def get_cached(self, signature):
+        """Path of the saved archive if it was built from the same dropbox listing"""
+        try:
+            with zipfile.ZipFile(self.path) as zf:
+                if zf.comment == signature:
+                    return self.path
+        except (FileNotFoundError, zipfile.BadZipFile):
+            pass
+        return None
+
+    def stream(self, files, signature):
+        """Yield the archive of `files` chunk by chunk and save it for the following downloads"""
+        tmp_path = f'{self.path}.{uuid.uuid4().hex}.tmp'
+        completed = False
+        try:
+            with open(tmp_path, 'wb') as tmp:
+                sink = _ZipSink(tee=tmp)
+                with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+                    for name, path in files:
+                        try:
+                            zinfo = zipfile.ZipInfo.from_file(path, name)
+                        except FileNotFoundError:
+                            # removed after the listing, the next download will rebuild the archive anyway
+                            continue
+                        zinfo.compress_type = zipfile.ZIP_STORED
+                        with open(path, 'rb') as src, zf.open(zinfo, 'w') as dst:
+                            while True:
+                                chunk = src.read(CHUNK_SIZE)
+                                if not chunk:
+                                    break
+                                dst.write(chunk)
+                                yield sink.pop()
+                        yield sink.pop()
+                    zf.comment = signature
+                yield sink.pop()
+            # readers of the previous archive keep their open file, the new one takes its place atomically
+            os.replace(tmp_path, self.path)
+            completed = True
+        finally:
+            if not completed and os.path.exists(tmp_path):
+                os.remove(tmp_path)
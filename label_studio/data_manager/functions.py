@@ -326,7 +326,13 @@ def get_prepare_params(request, project):
         filters = data.get('filters', None)
         ordering = data.get('ordering', [])
         prepare_params = PrepareParams(
-            project=project.id, selectedItems=selected, data=data, filters=filters, ordering=ordering, request=request
+            project=project.id,
+            selectedItems=selected,
+            data=data,
+            filters=filters,
+            ordering=ordering,
+            request=request,
+            project_instance=project,
         )
     return prepare_params
 
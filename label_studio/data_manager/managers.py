@@ -3,11 +3,14 @@
 import logging
 import re
 from datetime import datetime
+from functools import lru_cache
 from typing import ClassVar
 
 import ujson as json
 from core.feature_flags import flag_set
 from core.utils.db import fast_first
+from data_manager.data_column_indexes import get_data_value_expression, maybe_index_data_column
+from data_manager.models import DataColumnIndex
 from data_manager.prepare_params import ConjunctionEnum
 from django.conf import settings
 from django.contrib.postgres.aggregates import ArrayAgg
@@ -124,7 +127,6 @@ def get_fields_for_evaluation(prepare_params, user, skip_regular=True):
     :param user: user
     :return: list of field names
     """
-    from projects.models import Project
     from tasks.models import Task
 
     result = []
@@ -136,7 +138,7 @@ def get_fields_for_evaluation(prepare_params, user, skip_regular=True):
         from label_studio.data_manager.functions import TASKS
 
         GET_ALL_COLUMNS = load_func(settings.DATA_MANAGER_GET_ALL_COLUMNS)
-        all_columns = GET_ALL_COLUMNS(Project.objects.get(id=prepare_params.project), user)
+        all_columns = GET_ALL_COLUMNS(prepare_params.get_project(), user)
         all_columns = set(
             [TASKS + ('data.' if c.get('parent', None) == 'data' else '') + c['id'] for c in all_columns['columns']]
         )
@@ -179,8 +181,18 @@ def apply_ordering(queryset, ordering, project, request, view_data=None):
         if field_name.startswith('data__'):
             # annotate task with data field for float/int/bool ordering support
             json_field = field_name.replace('data__', '')
+            # indexed columns have a recorded type, so there is nothing to probe,
+            # the typed value is used only if it's the ordering requested by the column display type
+            typed_value = get_data_value_expression(project, json_field)
+            expected_type = DataColumnIndex.Type.NUMBER if numeric_ordering else DataColumnIndex.Type.STRING
+            if typed_value is not None and typed_value.column_type != expected_type:
+                typed_value = None
             numeric_ordering_applied = False
-            if numeric_ordering is True:
+            if typed_value is not None:
+                queryset = queryset.annotate(ordering_field=typed_value)
+                numeric_ordering_applied = True
+            elif numeric_ordering is True:
+                maybe_index_data_column(project, json_field)
                 queryset = queryset.annotate(
                     ordering_field=Cast(KeyTextTransform(json_field, 'data'), output_field=FloatField())
                 )
@@ -190,6 +202,8 @@ def apply_ordering(queryset, ordering, project, request, view_data=None):
                     numeric_ordering_applied = True
                 except Exception as e:
                     logger.warning(f'Failed to apply numeric ordering for field {json_field}: {e}')
+            else:
+                maybe_index_data_column(project, json_field)
             if not numeric_ordering_applied:
                 queryset = queryset.annotate(ordering_field=KeyTextTransform(json_field, 'data'))
             f = F('ordering_field').asc(nulls_last=True) if ascending else F('ordering_field').desc(nulls_last=True)
@@ -223,27 +237,59 @@ def cast_value(_filter):
             _filter.value = cast_bool_from_str(_filter.value)
 
 
+# SQLite full-text tables (FTS5, trigram tokenizer) mirroring `result` of annotations and predictions,
+# they are kept in sync by triggers from tasks/migrations/0051_result_search_indexes.py
+RESULT_SEARCH_TABLES = {
+    'annotations_results': 'task_completion_result_fts',
+    'predictions_results': 'prediction_result_fts',
+}
+# trigram phrases can't match shorter substrings
+RESULT_SEARCH_MIN_LENGTH = 3
+
+
+@lru_cache(maxsize=None)
+def result_search_table_exists(table):
+    """FTS5 trigram tokenizer needs SQLite 3.34+, otherwise the migration skips the search tables"""
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute("select 1 from sqlite_master where type = 'table' and name = %s", [table])
+        return cursor.fetchone() is not None
+
+
+def result_search_condition(field_name, value):
+    """Substring condition on result text which can use an index:
+    GIN trigram indexes on `cast(result as text)` for Postgres, FTS5 tables for SQLite
+    """
+    from django.db.models.expressions import RawSQL
+
+    table = RESULT_SEARCH_TABLES[field_name]
+    if (
+        settings.DJANGO_DB == settings.DJANGO_DB_SQLITE
+        and len(value) >= RESULT_SEARCH_MIN_LENGTH
+        and result_search_table_exists(table)
+    ):
+        phrase = '"' + value.replace('"', '""') + '"'
+        return Q(id__in=RawSQL(f'select rowid from {table} where {table} match %s', [phrase]))
+    return Q(json_str__contains=value)
+
+
 def add_result_filter(field_name, _filter, filter_expressions, project):
     from django.db.models.expressions import RawSQL
     from tasks.models import Annotation, Prediction
 
     _class = Annotation if field_name == 'annotations_results' else Prediction
 
-    # Annotation
-    if field_name == 'annotations_results':
+    # not correlated with the task row, so the database resolves matching results once using the index
+    # and then takes their tasks, instead of scanning the results of every task
+    if _filter.operator in [Operator.CONTAINS, Operator.NOT_CONTAINS, Operator.SUBSTRING]:
+        # legacy predictions may have no `project`
+        project_filter = Q(project=project) if field_name == 'annotations_results' else Q(task__project=project)
         subquery = Q(
-            id__in=Annotation.objects.annotate(json_str=RawSQL('cast(result as text)', ''))
-            .filter(Q(project=project) & Q(json_str__contains=_filter.value))
-            .filter(task=OuterRef('pk'))
+            id__in=_class.objects.annotate(json_str=RawSQL('cast(result as text)', ''))
+            .filter(project_filter & Q(task__isnull=False) & result_search_condition(field_name, _filter.value))
             .values_list('task', flat=True)
         )
-    # Predictions: they don't have `project` yet
-    else:
-        subquery = Exists(
-            _class.objects.annotate(json_str=RawSQL('cast(result as text)', '')).filter(
-                Q(task=OuterRef('pk')) & Q(json_str__contains=_filter.value)
-            )
-        )
 
     if _filter.operator in [Operator.EQUAL, Operator.NOT_EQUAL]:
         try:
@@ -368,13 +414,11 @@ def apply_filters(queryset, filters, project, request):
         # annotate with cast to number if need
         if _filter.type == 'Number' and field_name.startswith('data__'):
             json_field = field_name.replace('data__', '')
-            queryset = queryset.annotate(
-                **{
-                    f'filter_{json_field.replace("$undefined$", "undefined")}': Cast(
-                        KeyTextTransform(json_field, 'data'), output_field=FloatField()
-                    )
-                }
-            )
+            typed_value = get_data_value_expression(project, json_field)
+            if typed_value is None or typed_value.column_type != DataColumnIndex.Type.NUMBER:
+                maybe_index_data_column(project, json_field)
+                typed_value = Cast(KeyTextTransform(json_field, 'data'), output_field=FloatField())
+            queryset = queryset.annotate(**{f'filter_{json_field.replace("$undefined$", "undefined")}': typed_value})
             clean_field_name = f'filter_{json_field.replace("$undefined$", "undefined")}'
         else:
             clean_field_name = field_name
@@ -520,14 +564,12 @@ class TaskQuerySet(models.QuerySet):
         :param prepare_params: prepare params with project, filters, orderings, etc
         :return: ordered and filtered queryset
         """
-        from projects.models import Project
-
         queryset = self
 
         if prepare_params is None:
             return queryset
 
-        project = Project.objects.get(pk=prepare_params.project)
+        project = prepare_params.get_project()
         request = prepare_params.request
         queryset = apply_filters(queryset, prepare_params.filters, project, request)
         queryset = apply_ordering(queryset, prepare_params.ordering, project, request, view_data=prepare_params.data)
@@ -668,31 +710,37 @@ def annotate_annotators(queryset):
         return queryset.annotate(annotators=ArrayAgg('annotations__completed_by', distinct=True))
 
 
+def get_prediction_model_versions(project, request=None):
+    """Model versions the predictions score is averaged over, None for all predictions.
+    Memoized per request, so repeated annotate_queryset calls don't query ML backends again.
+    """
+    memo = getattr(request, '_dm_prediction_model_versions', None)
+    if memo is None:
+        memo = {}
+        if request is not None:
+            request._dm_prediction_model_versions = memo
+
+    if project.id not in memo:
+        # new approach with each ML backend contains it's version
+        if flag_set('ff_front_dev_1682_model_version_dropdown_070622_short', project.organization.created_by):
+            model_versions = list(project.ml_backends.filter(project=project).values_list('model_version', flat=True))
+            memo[project.id] = model_versions or None
+        else:
+            memo[project.id] = None if project.model_version is None else [project.model_version]
+    return memo[project.id]
+
+
 def annotate_predictions_score(queryset):
-    first_task = queryset.first()
-    if not first_task:
+    project = getattr(queryset, 'project', None)
+    if project is None:
         return queryset
 
-    # new approach with each ML backend contains it's version
-    if flag_set('ff_front_dev_1682_model_version_dropdown_070622_short', first_task.project.organization.created_by):
-        model_versions = list(
-            first_task.project.ml_backends.filter(project=first_task.project).values_list('model_version', flat=True)
-        )
-        if len(model_versions) == 0:
-            return queryset.annotate(predictions_score=Avg('predictions__score'))
-
-        else:
-            return queryset.annotate(
-                predictions_score=Avg('predictions__score', filter=Q(predictions__model_version__in=model_versions))
-            )
-    else:
-        model_version = first_task.project.model_version
-        if model_version is None:
-            return queryset.annotate(predictions_score=Avg('predictions__score'))
-        else:
-            return queryset.annotate(
-                predictions_score=Avg('predictions__score', filter=Q(predictions__model_version=model_version))
-            )
+    model_versions = get_prediction_model_versions(project, getattr(queryset, 'request', None))
+    if model_versions is None:
+        return queryset.annotate(predictions_score=Avg('predictions__score'))
+    return queryset.annotate(
+        predictions_score=Avg('predictions__score', filter=Q(predictions__model_version__in=model_versions))
+    )
 
 
 def annotate_annotations_ids(queryset):
@@ -754,14 +802,18 @@ def update_annotation_map(obj):
 
 class PreparedTaskManager(models.Manager):
     @staticmethod
-    def annotate_queryset(queryset, fields_for_evaluation=None, all_fields=False, request=None):
+    def annotate_queryset(queryset, fields_for_evaluation=None, all_fields=False, request=None, project=None):
         annotations_map = get_annotations_map()
 
         if fields_for_evaluation is None:
             fields_for_evaluation = []
 
-        first_task = queryset.first()
-        project = None if first_task is None else first_task.project
+        if project is None:
+            # callers pass the project, this fallback only keeps old call sites working
+            from projects.models import Project
+
+            project_id = queryset.order_by().values_list('project_id', flat=True).first()
+            project = None if project_id is None else Project.objects.get(pk=project_id)
 
         # db annotations applied only if we need them in ordering or filters
         for field in annotations_map.keys():
@@ -787,13 +839,17 @@ class PreparedTaskManager(models.Manager):
             fields_for_evaluation=fields_for_evaluation,
             all_fields=all_fields,
             request=prepare_params.request,
+            project=prepare_params.get_project(),
         )
 
     def only_filtered(self, prepare_params=None):
         request = prepare_params.request
-        queryset = TaskQuerySet(self.model).filter(project=prepare_params.project)
+        project = prepare_params.get_project()
+        queryset = TaskQuerySet(self.model).filter(project=project)
         fields_for_filter_ordering = get_fields_for_filter_ordering(prepare_params)
-        queryset = self.annotate_queryset(queryset, fields_for_evaluation=fields_for_filter_ordering, request=request)
+        queryset = self.annotate_queryset(
+            queryset, fields_for_evaluation=fields_for_filter_ordering, request=request, project=project
+        )
         return queryset.prepared(prepare_params=prepare_params)
 
 
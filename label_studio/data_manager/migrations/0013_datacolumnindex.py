@@ -0,0 +1,69 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("projects", "0047_projectgrouplist_rank"),
+        ("data_manager", "0012_alter_view_user"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DataColumnIndex",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("key", models.CharField(help_text="Key of task data", max_length=1024, verbose_name="key")),
+                (
+                    "type",
+                    models.CharField(
+                        choices=[("Number", "Number"), ("String", "String")],
+                        default=None,
+                        help_text="Detected value type",
+                        max_length=64,
+                        null=True,
+                        verbose_name="type",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("created", "Created"),
+                            ("in_progress", "In progress"),
+                            ("failed", "Failed"),
+                            ("completed", "Completed"),
+                        ],
+                        default="created",
+                        max_length=64,
+                    ),
+                ),
+                (
+                    "auto",
+                    models.BooleanField(
+                        default=False, help_text="Created by usage heuristics, not by an admin", verbose_name="auto"
+                    ),
+                ),
+                ("error", models.TextField(blank=True, null=True)),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, help_text="Creation time", verbose_name="created at"),
+                ),
+                (
+                    "project",
+                    models.ForeignKey(
+                        help_text="Project ID",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="data_column_indexes",
+                        to="projects.project",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(fields=("project", "key"), name="unique_data_column_index")
+                ],
+            },
+        ),
+    ]
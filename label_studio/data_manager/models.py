@@ -2,7 +2,9 @@
 """
 from data_manager.prepare_params import PrepareParams
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 
 
@@ -74,7 +76,12 @@ class View(ViewBaseModel, ProjectViewMixin):
             selected_items = self.selected_items
 
         return PrepareParams(
-            project=self.project_id, ordering=ordering, filters=filters, data=self.data, selectedItems=selected_items
+            project=self.project_id,
+            ordering=ordering,
+            filters=filters,
+            data=self.data,
+            selectedItems=selected_items,
+            project_instance=self.project,
         )
 
 
@@ -91,3 +98,64 @@ class Filter(models.Model):
     type = models.CharField(_('type'), max_length=1024, help_text='Field type')
     operator = models.CharField(_('operator'), max_length=1024, help_text='Filter operator')
     value = models.JSONField(_('value'), default=dict, null=True, help_text='Filter value')
+
+
+class DataColumnIndex(models.Model):
+    """`task.data` key of a project served by a typed partial expression index
+
+    The index is created and dropped by background jobs from data_manager.data_column_indexes,
+    ordering and filters use the recorded type instead of probing the cast on every request.
+    """
+
+    class Type(models.TextChoices):
+        NUMBER = 'Number', _('Number')
+        STRING = 'String', _('String')
+
+    class Status(models.TextChoices):
+        CREATED = 'created', _('Created')
+        IN_PROGRESS = 'in_progress', _('In progress')
+        FAILED = 'failed', _('Failed')
+        COMPLETED = 'completed', _('Completed')
+
+    project = models.ForeignKey(
+        'projects.Project', related_name='data_column_indexes', on_delete=models.CASCADE, help_text='Project ID'
+    )
+    key = models.CharField(_('key'), max_length=1024, help_text='Key of task data')
+    type = models.CharField(
+        _('type'), max_length=64, choices=Type.choices, null=True, default=None, help_text='Detected value type'
+    )
+    status = models.CharField(max_length=64, choices=Status.choices, default=Status.CREATED)
+    auto = models.BooleanField(_('auto'), default=False, help_text='Created by usage heuristics, not by an admin')
+    error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True, help_text='Creation time')
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['project', 'key'], name='unique_data_column_index')]
+
+    def has_permission(self, user):
+        return self.project.has_permission(user)
+
+
+@receiver(post_delete, sender=DataColumnIndex)
+def drop_index_of_deleted_data_column(sender, instance, **kwargs):
+    # also fired when the project is deleted, partial indexes don't go away together with the rows
+    from core.redis import start_job_async_or_sync
+    from data_manager.data_column_indexes import drop_data_column_index, index_name
+
+    name = index_name(instance.project_id, instance.key)
+    transaction.on_commit(lambda: start_job_async_or_sync(drop_data_column_index, name))
+
+
+@receiver(post_save, sender='tasks.Task')
+@receiver(post_delete, sender='tasks.Task')
+@receiver(post_save, sender='tasks.Annotation')
+@receiver(post_delete, sender='tasks.Annotation')
+@receiver(post_save, sender='tasks.Prediction')
+@receiver(post_delete, sender='tasks.Prediction')
+def invalidate_task_list_totals(sender, instance, **kwargs):
+    """Cached totals of keyset paginated task lists depend on tasks, annotations and predictions"""
+    from data_manager.pagination import invalidate_task_totals
+
+    # legacy predictions may have no project
+    project_id = instance.project_id or instance.task.project_id
+    transaction.on_commit(lambda: invalidate_task_totals(project_id))
@@ -0,0 +1,150 @@
+"""This file and its contents are licensed under the Apache License 2.0. Please see the included NOTICE for copyright information and LICENSE for a copy of the license.
+"""
+import base64
+import hashlib
+import json
+import logging
+import time
+from datetime import datetime
+
+from core.redis import redis_delete, redis_hget, redis_hset
+from core.utils.common import load_func
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+
+def totals_key(project_id):
+    return f'dm_task_totals:{project_id}'
+
+
+def invalidate_task_totals(project_id):
+    """Drop cached totals of all views of the project, called whenever tasks, annotations or predictions change"""
+    redis_delete(totals_key(project_id))
+
+
+def get_task_totals(queryset, prepare_params, user):
+    """Task, annotation and prediction counts of the filtered queryset, cached per project and filters hash"""
+    from tasks.models import Annotation, Prediction
+
+    filters = prepare_params.filters.model_dump() if prepare_params.filters else None
+    selected_items = prepare_params.selectedItems.model_dump() if prepare_params.selectedItems else None
+    # custom filter expressions may depend on the user
+    payload = json.dumps([filters, selected_items, user.id], sort_keys=True, default=str)
+    filters_hash = hashlib.sha1(payload.encode()).hexdigest()
+
+    cached = redis_hget(totals_key(prepare_params.project), filters_hash)
+    if cached:
+        totals = json.loads(cached)
+        # bulk operations bypass the signals, so entries expire anyway
+        if time.time() - totals.pop('ts') < settings.DATA_MANAGER_TOTALS_CACHE_TTL:
+            return totals
+
+    queryset = queryset.order_by()
+    totals = {
+        'total': queryset.count(),
+        'total_annotations': Annotation.objects.filter(task_id__in=queryset, was_cancelled=False).count(),
+        'total_predictions': Prediction.objects.filter(task_id__in=queryset).count(),
+    }
+    redis_hset(totals_key(prepare_params.project), filters_hash, json.dumps(dict(totals, ts=time.time())))
+    return totals
+
+
+def encode_cursor(value, pk):
+    if hasattr(value, 'pk'):
+        value = value.pk
+    elif isinstance(value, datetime):
+        value = {'datetime': value.isoformat()}
+    elif isinstance(value, (list, tuple, dict)):
+        raise ValidationError({'cursor': 'Keyset pagination is not supported for ordering by list columns'})
+    return base64.urlsafe_b64encode(json.dumps([value, pk]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value['datetime'])
+        return value, int(pk)
+    except (TypeError, ValueError, KeyError) as exc:
+        raise NotFound('Invalid cursor') from exc
+
+
+class TaskKeysetPagination(BasePagination):
+    """Opt-in cursor pagination for the data manager task list, enabled by the `cursor` query param
+
+    Pages continue after the (ordering value, id) of the last task of the previous page, so deep pages
+    cost the same as the first one, and totals come from the cache instead of COUNT(*) per page.
+    """
+
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = settings.TASK_API_PAGE_SIZE_MAX
+    cursor_query_param = 'cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            page_size = self.page_size
+        page_size = max(page_size, 1)
+        return min(page_size, self.max_page_size) if self.max_page_size else page_size
+
+    @staticmethod
+    def get_ordering(project, prepare_params):
+        """Name of the queryset field the view is ordered by and the direction"""
+        if not prepare_params.ordering:
+            return 'id', True
+        preprocess_field_name = load_func(settings.PREPROCESS_FIELD_NAME)
+        field_name, ascending = preprocess_field_name(
+            prepare_params.ordering[0], only_undefined_field=project.only_undefined_field
+        )
+        # task.data keys are annotated as ordering_field by apply_ordering
+        if field_name.startswith('data__'):
+            field_name = 'ordering_field'
+        return field_name, ascending
+
+    @staticmethod
+    def after_cursor(field_name, ascending, value, pk):
+        """Tasks after the cursor with the ordering of apply_ordering: nulls last, ties broken by id"""
+        if field_name == 'id':
+            return Q(id__gt=pk) if ascending else Q(id__lt=pk)
+        if value is None:
+            return Q(**{f'{field_name}__isnull': True, 'id__gt': pk})
+        lookup = '__gt' if ascending else '__lt'
+        return (
+            Q(**{f'{field_name}{lookup}': value})
+            | Q(**{field_name: value, 'id__gt': pk})
+            | Q(**{f'{field_name}__isnull': True})
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        project, prepare_params = view.project, view.prepare_params
+        page_size = self.get_page_size(request)
+        field_name, ascending = self.get_ordering(project, prepare_params)
+
+        self.totals = get_task_totals(queryset, prepare_params, request.user)
+
+        if field_name == 'id':
+            queryset = queryset.order_by('id' if ascending else '-id')
+        else:
+            queryset = queryset.order_by(*queryset.query.order_by, 'id')
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            value, pk = decode_cursor(cursor)
+            queryset = queryset.filter(self.after_cursor(field_name, ascending, value, pk))
+
+        tasks = list(queryset[: page_size + 1])
+        self.next_cursor = None
+        if len(tasks) > page_size:
+            tasks = tasks[:page_size]
+            last = tasks[-1]
+            self.next_cursor = encode_cursor(getattr(last, field_name), last.id)
+        return tasks
+
+    def get_paginated_response(self, data):
+        return Response(dict(self.totals, tasks=data, next=self.next_cursor))
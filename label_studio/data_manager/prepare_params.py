@@ -42,6 +42,16 @@ class PrepareParams(BaseModel):
     filters: Optional[Filters] = None
     data: Optional[dict] = None
     request: Optional[Any] = None
+    # Project instance of `project`, when the caller already has it
+    project_instance: Optional[Any] = None
+
+    def get_project(self):
+        """Project of the params, fetched from the database at most once"""
+        if self.project_instance is None:
+            from projects.models import Project
+
+            self.project_instance = Project.objects.get(pk=self.project)
+        return self.project_instance
 
 
 class CustomEnum(Enum):
@@ -3,7 +3,7 @@
 import os
 
 import ujson as json
-from data_manager.models import Filter, FilterGroup, View
+from data_manager.models import DataColumnIndex, Filter, FilterGroup, View
 from django.conf import settings
 from django.db import transaction
 from drf_yasg import openapi
@@ -500,4 +500,13 @@ class DropboxAPISerializer(serializers.Serializer):
     download = serializers.BooleanField(required=False, help_text='Flag to download the image or zip file')
     files = serializers.ListField(
         child=serializers.FileField(), required=False, help_text='List of files to upload'
-    )
\ No newline at end of file
+    )
+
+
+class DataColumnIndexSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DataColumnIndex
+        fields = ['id', 'project', 'key', 'type', 'status', 'auto', 'error', 'created_at']
+        read_only_fields = ['type', 'status', 'auto', 'error', 'created_at']
+        # re-adding a failed column retries it, so uniqueness is handled by the view
+        validators = []
@@ -0,0 +1,172 @@
+"""This file and its contents are licensed under the Apache License 2.0. Please see the included NOTICE for copyright information and LICENSE for a copy of the license.
+"""
+import hashlib
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import ffmpeg
+from django.conf import settings
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('png', 'jpg', 'jpeg', 'gif', 'bmp')
+VIDEO_EXTENSIONS = ('mp4', 'mov', 'avi', 'mkv')
+
+# evict after this many thumbnails were written by the current process
+EVICTION_CHECK_EVERY = 100
+# eviction frees space down to this share of the size limit, so it doesn't run on every write
+EVICTION_LOW_WATERMARK = 0.9
+
+_writes_since_eviction = 0
+_writes_lock = threading.Lock()
+_eviction_lock = threading.Lock()
+
+
+class Thumbnail:
+    """Cached thumbnail of a dropbox file
+
+    Thumbnails are addressed by the identity of the source file (real path, size and mtime), so a
+    replaced file gets a new key and its old thumbnail simply ages out of the cache.
+    """
+
+    def __init__(self, source_path):
+        self.source_path = source_path
+        self.source_stat = os.stat(source_path)
+        identity = f'{os.path.realpath(source_path)}:{self.source_stat.st_size}:{self.source_stat.st_mtime_ns}'
+        self.key = hashlib.sha256(identity.encode()).hexdigest()
+        self.is_video = source_path.lower().endswith(VIDEO_EXTENSIONS)
+        self.content_type = 'image/jpeg' if self.is_video else 'image/png'
+        extension = 'jpg' if self.is_video else 'png'
+        self.path = os.path.join(settings.DROPBOX_THUMBNAIL_CACHE_DIR, self.key[:2], f'{self.key}.{extension}')
+
+    @property
+    def last_modified(self):
+        return self.source_stat.st_mtime
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def touch(self):
+        """Mark the thumbnail as recently used, eviction goes by modification time"""
+        try:
+            os.utime(self.path)
+        except FileNotFoundError:
+            pass
+
+    def generate(self):
+        """Render the thumbnail into the cache unless it's already there"""
+        if self.exists():
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        size = settings.DROPBOX_THUMBNAIL_SIZE
+        tmp_path = f'{self.path}.{uuid.uuid4().hex}.tmp'
+        try:
+            if self.is_video:
+                data, _ = (
+                    ffmpeg.input(self.source_path, ss=0)
+                    .filter('scale', size, -1)
+                    .output('pipe:', format='image2', vframes=1)
+                    .run(capture_stdout=True, quiet=True)
+                )
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+            else:
+                with Image.open(self.source_path) as img:
+                    img.draft('RGB', (size, size))
+                    img.thumbnail((size, size))
+                    img.save(tmp_path, 'PNG')
+            os.replace(tmp_path, self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        _count_write()
+
+    def delete(self):
+        if self.exists():
+            os.remove(self.path)
+
+
+def is_thumbnail_supported(filename):
+    return filename.lower().endswith(IMAGE_EXTENSIONS + VIDEO_EXTENSIONS)
+
+
+def get_thumbnail(source_path):
+    """Return the cached thumbnail of `source_path`, generating it on a cache miss"""
+    thumbnail = Thumbnail(source_path)
+    if thumbnail.exists():
+        thumbnail.touch()
+    else:
+        thumbnail.generate()
+    return thumbnail
+
+
+def _generate_thumbnail(source_path):
+    try:
+        Thumbnail(source_path).generate()
+    except Exception as exc:
+        logger.warning(f'Failed to pre-generate thumbnail for {source_path}: {exc}')
+
+
+def generate_thumbnails(source_paths):
+    """Job rendering thumbnails of freshly uploaded dropbox files in a thread pool
+
+    PIL decoding and ffmpeg processes release the GIL, so threads keep several cores busy.
+    """
+    source_paths = [path for path in source_paths if is_thumbnail_supported(path)]
+    if not source_paths:
+        return
+    with ThreadPoolExecutor(max_workers=settings.DROPBOX_THUMBNAIL_WORKERS) as executor:
+        list(executor.map(_generate_thumbnail, source_paths))
+    evict_thumbnails()
+
+
+def evict_thumbnails(max_size=None):
+    """Remove least recently used thumbnails until the cache fits into DROPBOX_THUMBNAIL_CACHE_MAX_SIZE"""
+    max_size = settings.DROPBOX_THUMBNAIL_CACHE_MAX_SIZE if max_size is None else max_size
+    with _eviction_lock:
+        entries = []
+        total_size = 0
+        for root, _, files in os.walk(settings.DROPBOX_THUMBNAIL_CACHE_DIR):
+            for name in files:
+                # thumbnails being rendered by other threads or processes
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total_size += stat.st_size
+
+        if total_size <= max_size:
+            return 0
+
+        removed = 0
+        target_size = max_size * EVICTION_LOW_WATERMARK
+        for _, size, path in sorted(entries):
+            if total_size <= target_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            removed += 1
+        logger.debug(f'Evicted {removed} dropbox thumbnails')
+        return removed
+
+
+def _count_write():
+    global _writes_since_eviction
+    with _writes_lock:
+        _writes_since_eviction += 1
+        eviction_due = _writes_since_eviction >= EVICTION_CHECK_EVERY
+        if eviction_due:
+            _writes_since_eviction = 0
+    if eviction_due:
+        evict_thumbnails()
@@ -13,6 +13,7 @@ urlpatterns = [
     path('api/dm/thumbnail/', api.ThumbnailAPI.as_view(), name='thumbnail'),
     path('api/dm/dropbox/', api.DropboxAPI.as_view(), name='dropbox'),
     path('api/dm/columns/', api.ProjectColumnsAPI.as_view(), name='dm-columns'),
+    path('api/dm/indexed-columns/', api.DataColumnIndexAPI.as_view(), name='dm-indexed-columns'),
     path('api/dm/project/', api.ProjectStateAPI.as_view(), name='dm-project'),
     path('api/dm/actions/', api.ProjectActionsAPI.as_view(), name='dm-actions'),
     # path("api/dm/tasks/", api.TaskListAPI.as_view()),
@@ -156,6 +156,25 @@ class AzureBlobImportStorageBase(AzureBlobStorageMixin, ImportStorage):
             'https://' + self.get_account_name() + '.blob.core.windows.net/' + container + '/' + blob + '?' + sas_token
         )
 
+    can_proxy = True
+
+    def _get_blob_client(self, uri):
+        r = urlparse(uri, allow_fragments=False)
+        client, _ = self.get_client_and_container()
+        return client.get_blob_client(container=r.netloc, blob=r.path.lstrip('/'))
+
+    def get_object_meta(self, uri):
+        properties = self._get_blob_client(uri).get_blob_properties()
+        return {
+            'size': properties.size,
+            'content_type': properties.content_settings.content_type,
+            'version': (properties.etag or '').strip('"'),
+        }
+
+    def iter_object(self, uri, start=None, end=None):
+        length = end - start + 1 if start is not None else None
+        yield from self._get_blob_client(uri).download_blob(offset=start, length=length).chunks()
+
     def get_blob_metadata(self, key):
         return AZURE.get_blob_metadata(
             key, self.container, account_name=self.account_name, account_key=self.account_key
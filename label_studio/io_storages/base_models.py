@@ -4,6 +4,8 @@ import base64
 import json
 import logging
 import traceback as tb
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from urllib.parse import urljoin
 
@@ -16,15 +18,16 @@ from core.utils.common import load_func
 from data_export.serializers import ExportDataSerializer
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
-from django.db import models, transaction
-from django.db.models import JSONField
+from django.db import connection, connections, models, transaction
+from django.db.models import JSONField, Max
 from django.shortcuts import reverse
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django_rq import job
+from io_storages.presign_cache import presign_cache
 from io_storages.utils import get_uri_via_regex
 from rq.job import Job
-from tasks.models import Annotation, Task
+from tasks.models import Annotation, Prediction, Task, update_is_labeled_batch
 from tasks.serializers import AnnotationSerializer, PredictionSerializer
 from webhooks.models import WebhookAction
 from webhooks.utils import emit_webhooks_for_instance
@@ -231,6 +234,32 @@ class ImportStorage(Storage):
     def generate_http_url(self, url):
         raise NotImplementedError
 
+    # storages streaming objects through the storage proxy instead of inlining them into tasks
+    can_proxy = False
+
+    def get_object_meta(self, uri):
+        """Size, content type and version (e.g. ETag) of the storage object, the version changes when it's replaced"""
+        raise NotImplementedError
+
+    def iter_object(self, uri, start=None, end=None):
+        """Chunks of the storage object, from start to end inclusive when they are set"""
+        raise NotImplementedError
+
+    def get_proxy_url(self, uri, task=None):
+        fileuri = base64.urlsafe_b64encode(uri.encode()).decode()
+        if task is not None:
+            path = reverse('data_import:task-storage-data-proxy', kwargs={'task_id': task.id})
+        else:
+            path = reverse('data_import:project-storage-data-proxy', kwargs={'project_id': self.project_id})
+        return urljoin(settings.HOSTNAME, f'{path}?fileuri={fileuri}')
+
+    def get_http_url(self, url):
+        """generate_http_url shared through the presign cache by storages with presigned urls"""
+        # without presign the url is the whole object inlined as a data url, it's never cached
+        if not getattr(self, 'presign', False) or getattr(self, 'presign_ttl', None) is None:
+            return self.generate_http_url(url)
+        return presign_cache.get_or_generate(self, url)
+
     def can_resolve_url(self, url):
         # TODO: later check to the full prefix like "url.startswith(self.path_full)"
         # Search of occurrences inside string, e.g. for cases like "gs://bucket/file.pdf" or "<embed src='gs://bucket/file.pdf'/>"
@@ -273,25 +302,226 @@ class ImportStorage(Storage):
                         + f'?fileuri={base64.urlsafe_b64encode(extracted_uri.encode()).decode()}',
                     )
                     return uri.replace(extracted_uri, proxy_url)
+                elif not getattr(self, 'presign', True) and self.can_proxy and settings.STORAGE_PROXY_ENABLED:
+                    # objects are streamed by the storage proxy instead of being inlined as data urls
+                    return uri.replace(extracted_uri, self.get_proxy_url(extracted_uri, task))
                 else:
                     # resolve uri to url using storages
-                    http_url = self.generate_http_url(extracted_uri)
+                    http_url = self.get_http_url(extracted_uri)
 
                 return uri.replace(extracted_uri, http_url)
             except Exception:
                 logger.info(f"Can't resolve URI={uri}", exc_info=True)
 
-    def _scan_and_create_links_v2(self):
-        # Async job execution for batch of objects:
-        # e.g. GCS example
-        # | "GetKey" >>  --> read file content into label_studio_semantic_search.indexer.RawDataObject repr
-        # | "AggregateBatch" >> beam.Combine      --> combine read objects into a batch
-        # | "AddObjects" >> label_studio_semantic_search.indexer.add_objects_from_bucket
-        # --> add objects from batch to Vector DB
-        # or for project task creation last step would be
-        # | "AddObject" >> ImportStorage.add_task
+    def _read_task(self, key):
+        """Task dict of the storage object, called from the threads of the batched sync"""
+        try:
+            return self.get_data(key)
+        except (UnicodeDecodeError, json.decoder.JSONDecodeError) as exc:
+            logger.debug(exc, exc_info=True)
+            raise ValueError(
+                f'Error loading JSON from file "{key}".\nIf you\'re trying to import non-JSON data '
+                f'(images, audio, text, etc.), edit storage settings and enable '
+                f'"Treat every bucket object as a source file"'
+            )
+        finally:
+            connections.close_all()
 
-        raise NotImplementedError
+    def _scan_and_create_links_v2(self, link_class):
+        """Batched version of _scan_and_create_links:
+        known keys are checked against a set of link keys loaded once, objects of new keys are read by
+        a bounded thread pool and every batch of them is bulk created with add_tasks
+        """
+        # set in progress status for storage info
+        self.info_set_in_progress()
+
+        tasks_existed = tasks_created = 0
+        maximum_annotations = self.project.maximum_annotations
+        existing_keys = link_class.existing_keys(self)
+
+        def new_key_batches():
+            nonlocal tasks_existed
+            keys = []
+            for key in self.iterkeys():
+                if link_class.key_exists(key, self, existing_keys):
+                    logger.debug(f'{self.__class__.__name__} link {key} already exists')
+                    tasks_existed += 1
+                    continue
+                keys.append(key)
+                if len(keys) >= settings.STORAGE_IMPORT_BATCH_SIZE:
+                    yield keys
+                    keys = []
+            if keys:
+                yield keys
+
+        tasks_for_webhook = []
+        with ThreadPoolExecutor(max_workers=max(settings.STORAGE_IMPORT_CONCURRENCY, 1)) as executor:
+            for keys in new_key_batches():
+                logger.debug(f'{self}: found {len(keys)} new keys')
+                # map keeps the order of keys, at most one batch of objects is kept in memory
+                items = [(key, data) for key, data in zip(keys, executor.map(self._read_task, keys)) if data]
+                tasks = self.add_tasks(items, self.project, maximum_annotations, self, link_class)
+                existing_keys.update(keys)
+
+                # update progress counters for storage info
+                tasks_created += len(tasks)
+                self.info_update_progress(last_sync_count=tasks_created, tasks_existed=tasks_existed)
+
+                # webhooks are sent in batches of WEBHOOK_BATCH_SIZE tasks as in _scan_and_create_links
+                tasks_for_webhook.extend(tasks)
+                while len(tasks_for_webhook) >= settings.WEBHOOK_BATCH_SIZE:
+                    emit_webhooks_for_instance(
+                        self.project.organization,
+                        self.project,
+                        WebhookAction.TASKS_CREATED,
+                        tasks_for_webhook[: settings.WEBHOOK_BATCH_SIZE],
+                    )
+                    tasks_for_webhook = tasks_for_webhook[settings.WEBHOOK_BATCH_SIZE :]
+        if tasks_for_webhook:
+            emit_webhooks_for_instance(
+                self.project.organization, self.project, WebhookAction.TASKS_CREATED, tasks_for_webhook
+            )
+
+        self.project.update_tasks_states(
+            maximum_annotations_changed=False, overlap_cohort_percentage_changed=False, tasks_number_changed=True
+        )
+
+        # sync is finished, set completed status for storage info
+        self.info_set_completed(last_sync_count=tasks_created, tasks_existed=tasks_existed)
+
+    @staticmethod
+    def _validated_items(serializer_class, task_items, raise_exception):
+        """Validated data of predictions or annotations of a batch of tasks. When some of them are invalid,
+        tasks are validated one by one, so only items of tasks with invalid ones are skipped as in add_task
+        """
+        items = [item for items in task_items for item in items]
+        if not items:
+            return []
+        serializer = serializer_class(data=items, many=True)
+        if serializer.is_valid():
+            return serializer.validated_data
+
+        validated = []
+        for items in task_items:
+            if not items:
+                continue
+            serializer = serializer_class(data=items, many=True)
+            if serializer.is_valid(raise_exception=raise_exception):
+                validated.extend(serializer.validated_data)
+        return validated
+
+    @staticmethod
+    def _update_skipped_items_counters(db_tasks, db_predictions, db_annotations):
+        predictions, annotations, cancelled = Counter(), Counter(), Counter()
+        for prediction in db_predictions:
+            predictions[prediction.task_id] += 1
+        for annotation in db_annotations:
+            (cancelled if annotation.was_cancelled else annotations)[annotation.task_id] += 1
+
+        changed = []
+        for task in db_tasks:
+            counters = (annotations[task.id], cancelled[task.id], predictions[task.id])
+            if counters != (task.total_annotations, task.cancelled_annotations, task.total_predictions):
+                task.total_annotations, task.cancelled_annotations, task.total_predictions = counters
+                changed.append(task)
+        Task.objects.bulk_update(
+            changed,
+            ['total_annotations', 'cancelled_annotations', 'total_predictions'],
+            batch_size=settings.BATCH_SIZE,
+        )
+
+    @classmethod
+    def add_tasks(cls, items, project, maximum_annotations, storage, link_class):
+        """Bulk version of add_task for a list of (key, data), returns created tasks"""
+        db_tasks, task_predictions, task_annotations = [], [], []
+        for key, data in items:
+            predictions = data.get('predictions', [])
+            annotations = data.get('annotations', [])
+            if (predictions or annotations) and 'data' not in data:
+                field = 'predictions' if predictions else 'annotations'
+                raise ValueError(
+                    f'If you use "{field}" field in the task, ' 'you must put "data" field in the task too'
+                )
+            cancelled_annotations = len([a for a in annotations if a.get('was_cancelled', False)])
+            if 'data' in data and isinstance(data['data'], dict):
+                data = data['data']
+
+            db_tasks.append(
+                Task(
+                    data=data,
+                    project=project,
+                    overlap=maximum_annotations,
+                    is_labeled=len(annotations) >= maximum_annotations,
+                    total_predictions=len(predictions),
+                    total_annotations=len(annotations) - cancelled_annotations,
+                    cancelled_annotations=cancelled_annotations,
+                )
+            )
+            task_predictions.append(predictions)
+            task_annotations.append(annotations)
+
+        if not db_tasks:
+            return []
+
+        raise_exception = not flag_set(
+            'ff_fix_back_dev_3342_storage_scan_with_invalid_annotations', user=AnonymousUser()
+        )
+        with transaction.atomic():
+            # inner ids of the batch are reserved at once
+            max_inner_id = project.tasks.aggregate(max_inner_id=Max('inner_id'))['max_inner_id'] or 0
+            for i, task in enumerate(db_tasks, start=1):
+                task.inner_id = max_inner_id + i
+            if not connection.features.can_return_rows_from_bulk_insert:
+                last_task = Task.objects.order_by('-id').first()
+                current_id = last_task.id + 1 if last_task else 1
+                for i, task in enumerate(db_tasks):
+                    task.id = current_id + i
+            db_tasks = Task.objects.bulk_create(db_tasks, batch_size=settings.BATCH_SIZE)
+
+            link_class.objects.bulk_create(
+                [link_class(task=task, key=key, storage=storage) for task, (key, _) in zip(db_tasks, items)],
+                batch_size=settings.BATCH_SIZE,
+            )
+            logger.debug(f'Create {len(db_tasks)} {storage.__class__.__name__} links')
+
+            for task, predictions, annotations in zip(db_tasks, task_predictions, task_annotations):
+                for item in predictions + annotations:
+                    item['task'] = task.id
+                    item['project'] = project.id
+
+            db_predictions = []
+            for prediction in cls._validated_items(PredictionSerializer, task_predictions, raise_exception):
+                # bulk_create doesn't call save(), which normalizes the result
+                prediction['result'] = Prediction.prepare_prediction_result(prediction['result'], project)
+                db_predictions.append(Prediction(**prediction))
+            Prediction.objects.bulk_create(db_predictions, batch_size=settings.BATCH_SIZE)
+            logger.debug(f'Create {len(db_predictions)} predictions')
+
+            db_annotations = [
+                Annotation(**annotation)
+                for annotation in cls._validated_items(AnnotationSerializer, task_annotations, raise_exception)
+            ]
+            Annotation.objects.bulk_create(db_annotations, batch_size=settings.BATCH_SIZE)
+            logger.debug(f'Create {len(db_annotations)} annotations')
+
+            if len(db_predictions) + len(db_annotations) < sum(map(len, task_predictions + task_annotations)):
+                # invalid items were skipped, counters of their tasks are computed from the created ones
+                cls._update_skipped_items_counters(db_tasks, db_predictions, db_annotations)
+
+            if any(task_annotations):
+                # is_labeled depends on the project settings, e.g. whether cancelled annotations count
+                task_ids = [task.id for task in db_tasks]
+                update_is_labeled_batch(task_ids, project.id)
+                is_labeled = dict(Task.objects.filter(id__in=task_ids).values_list('id', 'is_labeled'))
+                for task in db_tasks:
+                    task.is_labeled = is_labeled[task.id]
+
+        # bulk_create skips the signals which keep the project summary up to date
+        summary = getattr(project, 'summary', None)
+        if summary is not None:
+            summary.update_data_columns(db_tasks)
+            summary.update_created_annotations_and_labels(db_annotations)
+        return db_tasks
 
     @classmethod
     def add_task(cls, data, project, maximum_annotations, max_inner_id, storage, key, link_class):
@@ -360,6 +590,9 @@ class ImportStorage(Storage):
         TODO: deprecate this function and transform it to "pipeline" version  _scan_and_create_links_v2,
         TODO: it must be compatible with opensource, so old version is needed as well
         """
+        if settings.STORAGE_IMPORT_BATCHED:
+            return self._scan_and_create_links_v2(link_class)
+
         # set in progress status for storage info
         self.info_set_in_progress()
 
@@ -598,6 +831,16 @@ class ImportStorageLink(models.Model):
     def exists(cls, key, storage):
         return cls.objects.filter(key=key, storage=storage.id).exists()
 
+    @classmethod
+    def existing_keys(cls, storage):
+        """Keys of all links of the storage, so a sync checks keys without a query per key"""
+        return set(cls.objects.filter(storage=storage.id).values_list('key', flat=True).iterator())
+
+    @classmethod
+    def key_exists(cls, key, storage, existing_keys):
+        """Same check as exists() against existing_keys"""
+        return key in existing_keys
+
     @classmethod
     def create(cls, task, key, storage):
         link, created = cls.objects.get_or_create(task_id=task.id, key=key, storage=storage, object_exists=True)
@@ -2,6 +2,7 @@
 """
 import json
 import logging
+from urllib.parse import urlparse
 
 from core.redis import start_job_async_or_sync
 from django.conf import settings
@@ -17,6 +18,7 @@ from io_storages.base_models import (
     ProjectStorageMixin,
 )
 from io_storages.gcs.utils import GCS
+from io_storages.proxy_cache import CHUNK_SIZE
 from tasks.models import Annotation
 
 logger = logging.getLogger(__name__)
@@ -93,6 +95,31 @@ class GCSImportStorageBase(GCSStorageMixin, ImportStorage):
             presign_ttl=self.presign_ttl,
         )
 
+    can_proxy = True
+
+    def _get_blob(self, uri):
+        r = urlparse(uri, allow_fragments=False)
+        return self.get_client().bucket(r.netloc).blob(r.path.lstrip('/'))
+
+    def get_object_meta(self, uri):
+        blob = self._get_blob(uri)
+        blob.reload()
+        return {'size': blob.size, 'content_type': blob.content_type, 'version': str(blob.generation or blob.etag)}
+
+    def iter_object(self, uri, start=None, end=None):
+        with self._get_blob(uri).open('rb', chunk_size=CHUNK_SIZE) as f:
+            if start is None:
+                yield from iter(lambda: f.read(CHUNK_SIZE), b'')
+                return
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
     def scan_and_create_links(self):
         return self._scan_and_create_links(GCSImportStorageLink)
 
@@ -0,0 +1,102 @@
+"""This file and its contents are licensed under the Apache License 2.0. Please see the included NOTICE for copyright information and LICENSE for a copy of the license.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from core.redis import redis_get, redis_set
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PresignCache:
+    """Presigned URLs of import storages keyed by (storage, uri), shared by all tasks and requests of the process.
+
+    Entries live for PRESIGN_CACHE_TTL_FRACTION of the storage presign_ttl,
+    so a cached URL always stays valid for the rest of the TTL after it's returned.
+    With PRESIGN_CACHE_REDIS the entries are shared by all processes through redis.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_key(storage, uri):
+        # storage settings are in the key, so edited storages don't return the previous signatures
+        raw = f'{storage.__class__.__name__}:{storage.id}:{storage.presign}:{storage.presign_ttl}:{uri}'
+        return 'presign:' + hashlib.sha1(raw.encode()).hexdigest()
+
+    @staticmethod
+    def get_ttl(storage):
+        return int(storage.presign_ttl * 60 * settings.PRESIGN_CACHE_TTL_FRACTION)
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                url, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    return url
+                del self._entries[key]
+
+        if settings.PRESIGN_CACHE_REDIS:
+            url = redis_get(key)
+            if url is not None:
+                return url.decode() if isinstance(url, bytes) else url
+
+    def set(self, key, url, ttl):
+        with self._lock:
+            self._entries[key] = (url, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.PRESIGN_CACHE_SIZE:
+                self._entries.popitem(last=False)
+        if settings.PRESIGN_CACHE_REDIS:
+            redis_set(key, url, ttl=ttl)
+
+    def get_or_generate(self, storage, uri):
+        """storage.generate_http_url(uri) served from the cache while it's fresh"""
+        ttl = self.get_ttl(storage) if storage.id is not None and storage.presign else 0
+        if ttl <= 0 or settings.PRESIGN_CACHE_SIZE <= 0:
+            return storage.generate_http_url(uri)
+
+        key = self.get_key(storage, uri)
+        url = self.get(key)
+        with self._lock:
+            if url is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if url is not None:
+            return url
+
+        url = storage.generate_http_url(uri)
+        if url:
+            self.set(key, url, ttl)
+        return url
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def get_stats(self):
+        with self._lock:
+            hits, misses, size = self.hits, self.misses, len(self._entries)
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / total if total else None,
+            'size': size,
+        }
+
+
+presign_cache = PresignCache()
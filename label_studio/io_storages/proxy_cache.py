@@ -0,0 +1,210 @@
+"""This file and its contents are licensed under the Apache License 2.0. Please see the included NOTICE for copyright information and LICENSE for a copy of the license.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+# the cache directory is walked when it may be over the limit or after this many seconds,
+# objects written by other processes are accounted for on the next walk
+SCAN_INTERVAL = 60
+# eviction frees some room below the limit, so the next writes don't walk the directory again
+EVICT_TO_FRACTION = 0.9
+# a fill not finished in this time is considered abandoned by a crashed process
+FILL_TIMEOUT = 600
+
+_fill_executor = None
+_fill_executor_lock = threading.Lock()
+
+
+def get_fill_executor():
+    """Threads filling the cache for range requests, bounded so misses don't multiply storage downloads"""
+    global _fill_executor
+    with _fill_executor_lock:
+        if _fill_executor is None:
+            _fill_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='storage-proxy-fill')
+        return _fill_executor
+
+
+class MediaCache:
+    """Bounded on-disk cache of storage objects served by the storage proxy.
+
+    Every object is a data file and a json file with its meta. Keys include the object version reported
+    by the storage, so replaced objects are never served from the cache. Access time is kept in the mtime
+    of the data file, the least recently used objects are removed when the cache grows over max_bytes.
+    A `.fill` file marks an object being written, concurrent misses don't download it again.
+    """
+
+    def __init__(self, directory=None, max_bytes=None, max_object_bytes=None):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._max_object_bytes = max_object_bytes
+        self._evict_lock = threading.Lock()
+        # estimated size of the cache and the time of the last walk, None until the first write
+        self._size = None
+        self._scanned_at = 0
+
+    # settings are read on access, so they can be changed without recreating the cache
+    @property
+    def directory(self):
+        return self._directory or settings.STORAGE_PROXY_CACHE_DIR
+
+    @property
+    def max_bytes(self):
+        return settings.STORAGE_PROXY_CACHE_SIZE if self._max_bytes is None else self._max_bytes
+
+    @property
+    def max_object_bytes(self):
+        if self._max_object_bytes is None:
+            return settings.STORAGE_PROXY_CACHE_MAX_OBJECT_SIZE
+        return self._max_object_bytes
+
+    @staticmethod
+    def get_key(storage, uri, version=None):
+        raw = f'{storage.__class__.__name__}:{storage.id}:{uri}:{version}'
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def can_cache(self, size):
+        return 0 < size <= self.max_object_bytes and self.max_object_bytes <= self.max_bytes
+
+    def get(self, key):
+        """Path and meta of the cached object, the object becomes the most recently used one"""
+        path = self._path(key)
+        try:
+            with open(path + '.json') as f:
+                meta = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None, None
+        return path, meta
+
+    def claim(self, key):
+        """Mark the object as being written, False if another request or process is writing it"""
+        fill_path = self._path(key) + '.fill'
+        os.makedirs(os.path.dirname(fill_path), exist_ok=True)
+        try:
+            os.close(os.open(fill_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            pass
+        try:
+            if time.time() - os.stat(fill_path).st_mtime < FILL_TIMEOUT:
+                return False
+        except OSError:
+            return False
+        # abandoned fill, the current request takes it over
+        os.utime(fill_path)
+        return True
+
+    def tee(self, key, chunks, meta):
+        """Yield chunks of the object while writing them to the cache, it's cached only when read to the end"""
+        if not self.claim(key):
+            yield from chunks
+            return
+        yield from self._write(key, chunks, meta)
+
+    def fill_in_background(self, key, get_chunks, meta):
+        """Download the object to the cache without holding up the response, e.g. when a range was requested"""
+        if not self.claim(key):
+            return
+
+        def fill():
+            try:
+                for _ in self._write(key, get_chunks(), meta):
+                    pass
+            except Exception as exc:
+                logger.warning(f'Storage proxy cache fill of {key} failed: {exc}')
+
+        get_fill_executor().submit(fill)
+
+    def put(self, key, chunks, meta):
+        """Write the whole object from chunks, returns its path or None if it's being written by someone else"""
+        for _ in self.tee(key, chunks, meta):
+            pass
+        return self.get(key)[0]
+
+    def _write(self, key, chunks, meta):
+        """Pass chunks through while writing them to a temporary file, readers see either the whole object
+        or nothing. A failing disk stops caching, not the response.
+        """
+        path = self._path(key)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        size = 0
+        f = open(tmp_path, 'wb')
+        try:
+            for chunk in chunks:
+                if f is not None:
+                    try:
+                        f.write(chunk)
+                        size += len(chunk)
+                    except OSError as exc:
+                        logger.warning(f'Storage proxy cache write of {key} failed: {exc}')
+                        f.close()
+                        f = None
+                yield chunk
+            if f is not None:
+                f.close()
+                f = None
+                with open(tmp_path + '.json', 'w') as meta_file:
+                    json.dump(meta, meta_file)
+                os.replace(tmp_path, path)
+                os.replace(tmp_path + '.json', path + '.json')
+                self._account(size)
+        finally:
+            if f is not None:
+                f.close()
+            for leftover in (tmp_path, tmp_path + '.json', path + '.fill'):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+
+    def _account(self, size):
+        with self._evict_lock:
+            if self._size is not None:
+                self._size += size
+            scan_due = time.monotonic() - self._scanned_at > SCAN_INTERVAL
+        if self._size is None or self._size > self.max_bytes or scan_due:
+            self.evict()
+
+    def evict(self):
+        with self._evict_lock:
+            entries = []
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if name.endswith(('.json', '.tmp', '.fill')):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            if total > self.max_bytes:
+                for _, size, path in sorted(entries):
+                    if total <= self.max_bytes * EVICT_TO_FRACTION:
+                        break
+                    for file_path in (path + '.json', path):
+                        try:
+                            os.remove(file_path)
+                        except OSError:
+                            pass
+                    total -= size
+                    logger.debug(f'Storage proxy cache evicted {path}')
+            self._size = total
+            self._scanned_at = time.monotonic()
+
+
+media_cache = MediaCache()
@@ -3,6 +3,7 @@
 import json
 import logging
 import re
+from urllib.parse import urlparse
 
 import boto3
 from core.feature_flags import flag_set
@@ -19,6 +20,7 @@ from io_storages.base_models import (
     ImportStorageLink,
     ProjectStorageMixin,
 )
+from io_storages.proxy_cache import CHUNK_SIZE
 from io_storages.s3.utils import get_client_and_resource, resolve_s3_url
 from tasks.models import Annotation
 from tasks.validation import ValidationError as TaskValidationError
@@ -161,10 +163,9 @@ class S3ImportStorageBase(S3StorageMixin, ImportStorage):
             data_key = settings.DATA_UNDEFINED_NAME
             return {data_key: uri}
 
-        # read task json from bucket and validate it
-        _, s3 = self.get_client_and_resource()
-        bucket = s3.Bucket(self.bucket)
-        obj = s3.Object(bucket.name, key).get()['Body'].read().decode('utf-8')
+        # read task json from bucket and validate it,
+        # the client is used because boto3 resources are not thread safe and batched syncs read in threads
+        obj = self.get_client().get_object(Bucket=self.bucket, Key=key)['Body'].read().decode('utf-8')
         value = json.loads(obj)
         if not isinstance(value, dict):
             raise ValueError(f'Error on key {key}: For S3 your JSON file must be a dictionary with one task')
@@ -175,6 +176,23 @@ class S3ImportStorageBase(S3StorageMixin, ImportStorage):
     def generate_http_url(self, url):
         return resolve_s3_url(url, self.get_client(), self.presign, expires_in=self.presign_ttl * 60)
 
+    can_proxy = True
+
+    def get_object_meta(self, uri):
+        r = urlparse(uri, allow_fragments=False)
+        meta = self.get_client().head_object(Bucket=r.netloc, Key=r.path.lstrip('/'))
+        return {
+            'size': meta['ContentLength'],
+            'content_type': meta.get('ContentType'),
+            'version': meta.get('VersionId') or meta.get('ETag', '').strip('"'),
+        }
+
+    def iter_object(self, uri, start=None, end=None):
+        r = urlparse(uri, allow_fragments=False)
+        kwargs = {'Range': f'bytes={start}-{end}'} if start is not None else {}
+        obj = self.get_client().get_object(Bucket=r.netloc, Key=r.path.lstrip('/'), **kwargs)
+        yield from obj['Body'].iter_chunks(CHUNK_SIZE)
+
     def get_blob_metadata(self, key):
         return AWS.get_blob_metadata(
             key,
@@ -277,6 +295,11 @@ class S3ImportStorageLink(ImportStorageLink):
             or cls.objects.filter(key=prefix + '/' + key, storage=storage.id).exists()
         )
 
+    @classmethod
+    def key_exists(cls, key, storage, existing_keys):
+        prefix = str(storage.prefix) or ''
+        return key in existing_keys or prefix + key in existing_keys or prefix + '/' + key in existing_keys
+
 
 class S3ExportStorageLink(ExportStorageLink):
     storage = models.ForeignKey(S3ExportStorage, on_delete=models.CASCADE, related_name='links')
@@ -1,3 +1,6 @@
+from collections import defaultdict
+
+from data_export.dataframes import mark_tasks_dirty
 from django.db import transaction
 from tasks.models import Annotation
 
@@ -10,7 +13,7 @@ def bulk_update_label(old_label, new_label, organization, project=None):
     updated_count = 0
     with transaction.atomic():
         update_annotations = []
-        for annotation in annotations.only('result').all():
+        for annotation in annotations.only('result', 'project_id', 'task_id').all():
             result = annotation.result
 
             updated_result = []
@@ -31,4 +34,9 @@ def bulk_update_label(old_label, new_label, organization, project=None):
 
         if update_annotations:
             Annotation.objects.bulk_update(update_annotations, ['result'])
+            task_ids_by_project = defaultdict(list)
+            for annotation in update_annotations:
+                task_ids_by_project[annotation.project_id].append(annotation.task_id)
+            for project_id, task_ids in task_ids_by_project.items():
+                mark_tasks_dirty(project_id, task_ids)
     return updated_count
@@ -0,0 +1,49 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ml', '0007_auto_20240314_1957'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mlbackendpredictionjob',
+            name='status',
+            field=models.CharField(
+                choices=[
+                    ('created', 'Created'),
+                    ('in_progress', 'In progress'),
+                    ('failed', 'Failed'),
+                    ('completed', 'Completed'),
+                ],
+                default='created',
+                max_length=64,
+                verbose_name='status',
+            ),
+        ),
+        migrations.AddField(
+            model_name='mlbackendpredictionjob',
+            name='total_tasks',
+            field=models.PositiveIntegerField(
+                default=0, help_text='Number of tasks to predict', verbose_name='total tasks'
+            ),
+        ),
+        migrations.AddField(
+            model_name='mlbackendpredictionjob',
+            name='processed_tasks',
+            field=models.PositiveIntegerField(
+                default=0, help_text='Number of tasks sent to the ML backend', verbose_name='processed tasks'
+            ),
+        ),
+        migrations.AddField(
+            model_name='mlbackendpredictionjob',
+            name='predicted_tasks',
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text='Number of tasks with predictions returned by the ML backend',
+                verbose_name='predicted tasks',
+            ),
+        ),
+    ]
@@ -1,17 +1,21 @@
 """This file and its contents are licensed under the Apache License 2.0. Please see the included NOTICE for copyright information and LICENSE for a copy of the license.
 """
 import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from typing import Dict, List
 
 from core.utils.common import conditional_atomic, db_is_not_sqlite, load_func
 from django.conf import settings
-from django.db import models, transaction
-from django.db.models import Count, JSONField, Q
+from django.db import connections, models, transaction
+from django.db.models import Exists, JSONField, OuterRef
 from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 from ml.api_connector import PREDICT_URL, TIMEOUT_PREDICT, MLApi
 from projects.models import Project
+from rq import get_current_job
+from tasks.models import Prediction, Task
 from tasks.serializers import PredictionSerializer, TaskSimpleSerializer
 from webhooks.serializers import Webhook, WebhookSerializer
 
@@ -259,7 +263,7 @@ class MLBackend(models.Model):
         }
 
     def _get_predictions_from_ml_backend_one_by_one(
-        self, serialized_tasks: List[Dict], current_responses: List[Dict]
+        self, serialized_tasks: List[Dict], current_responses: List[Dict], ml_api=None
     ) -> List[Dict]:
         """
         This is helper method to get predictions from ML backend one by one
@@ -274,10 +278,12 @@ class MLBackend(models.Model):
                 f"'ML backend '{self.title}' doesn't support batch processing of tasks, "
                 f'switched to one-by-one task retrieval'
             )
+            # the next chunks of predict_tasks go one by one right away
+            self._batch_unsupported = True
             predictions = []
             for serialized_task in serialized_tasks:
                 # get predictions per task
-                predictions.extend(self._get_predictions_from_ml_backend([serialized_task]))
+                predictions.extend(self._get_predictions_from_ml_backend([serialized_task], ml_api))
 
             return predictions
         else:
@@ -289,8 +295,27 @@ class MLBackend(models.Model):
             )
             return []
 
-    def _get_predictions_from_ml_backend(self, serialized_tasks: List[Dict]) -> List[Dict]:
-        result = self.api.make_predictions(serialized_tasks, self.project)
+    def _make_predictions(self, serialized_tasks: List[Dict], ml_api):
+        """Predict request retried with a backoff when the backend is unavailable or fails"""
+        for attempt in range(settings.ML_PREDICTION_RETRIES + 1):
+            result = ml_api.make_predictions(serialized_tasks, self.project)
+            # client errors won't pass on retry, connection errors are already retried by the session
+            if not result.is_error or 0 < result.status_code < 500:
+                break
+            if attempt < settings.ML_PREDICTION_RETRIES:
+                logger.info(f'Retrying predictions of {len(serialized_tasks)} tasks: {result.error_message}')
+                time.sleep(2**attempt)
+        return result
+
+    def _get_predictions_from_ml_backend(self, serialized_tasks: List[Dict], ml_api=None) -> List[Dict]:
+        ml_api = ml_api or self.api
+        if len(serialized_tasks) > 1 and getattr(self, '_batch_unsupported', False):
+            predictions = []
+            for serialized_task in serialized_tasks:
+                predictions.extend(self._get_predictions_from_ml_backend([serialized_task], ml_api))
+            return predictions
+
+        result = self._make_predictions(serialized_tasks, ml_api)
 
         # response validation
         if result.is_error:
@@ -312,7 +337,7 @@ class MLBackend(models.Model):
             # Number of tasks and responses are not equal
             # It can happen if ML backend doesn't support batch processing but only process one task at a time
             # In the future versions, we may better consider this as an error and deprecate this code branch
-            return self._get_predictions_from_ml_backend_one_by_one(serialized_tasks, responses)
+            return self._get_predictions_from_ml_backend_one_by_one(serialized_tasks, responses, ml_api)
 
         # ML backend supports batch processing
         for task, response in zip(serialized_tasks, responses):
@@ -346,25 +371,84 @@ class MLBackend(models.Model):
             return
 
         if isinstance(tasks, list):
-            from tasks.models import Task
-
             tasks = Task.objects.filter(id__in=[task.id for task in tasks])
 
         # Filter tasks that already contain the current model version in predictions
-        tasks = tasks.annotate(predictions_count=Count('predictions')).exclude(
-            Q(predictions_count__gt=0) & Q(predictions__model_version=model_version)
-        )
-        if not tasks.exists():
+        tasks = tasks.exclude(Exists(Prediction.objects.filter(task=OuterRef('pk'), model_version=model_version)))
+        task_ids = list(tasks.order_by('id').values_list('id', flat=True).distinct())
+        if not task_ids:
             logger.debug(f'All tasks already have prediction from model version={self.model_version}')
             return model_version
-        tasks_ser = TaskSimpleSerializer(tasks, many=True).data
-        predictions = self._get_predictions_from_ml_backend(tasks_ser)
-        with conditional_atomic(predicate=db_is_not_sqlite):
-            prediction_ser = PredictionSerializer(data=predictions, many=True)
-            prediction_ser.is_valid(raise_exception=True)
-            instances = prediction_ser.save()
+
+        rq_job = get_current_job()
+        job = MLBackendPredictionJob.objects.create(
+            job_id=rq_job.id if rq_job else '',
+            ml_backend=self,
+            model_version=model_version,
+            batch_size=settings.ML_PREDICTION_CHUNK_SIZE,
+            status=MLBackendPredictionJob.Status.IN_PROGRESS,
+            total_tasks=len(task_ids),
+        )
+        try:
+            instances = self._predict_chunks(task_ids, job)
+        except Exception:
+            job.status = MLBackendPredictionJob.Status.FAILED
+            job.save(update_fields=['status', 'updated_at'])
+            raise
+        job.status = MLBackendPredictionJob.Status.COMPLETED
+        job.save(update_fields=['status', 'updated_at'])
         return instances
 
+    def _predict_chunks(self, task_ids, job):
+        """Send chunks of tasks to the ML backend in parallel and save predictions of each chunk as it's done.
+
+        Only requests run in the threads, tasks are serialized and predictions are saved here, and at most
+        ML_PREDICTION_CONCURRENCY chunks are serialized ahead, so memory doesn't grow with the number of tasks.
+        """
+        ml_api = self.api
+        # load the project here, the threads use it for requests
+        project = self.project
+        chunk_size = max(settings.ML_PREDICTION_CHUNK_SIZE, 1)
+        concurrency = max(settings.ML_PREDICTION_CONCURRENCY, 1)
+        instances = []
+
+        def save(future):
+            processed, predictions = future.result()
+            if predictions:
+                with conditional_atomic(predicate=db_is_not_sqlite):
+                    prediction_ser = PredictionSerializer(data=predictions, many=True)
+                    prediction_ser.is_valid(raise_exception=True)
+                    instances.extend(prediction_ser.save())
+            job.processed_tasks += processed
+            job.predicted_tasks += len({prediction['task'] for prediction in predictions})
+            job.save(update_fields=['processed_tasks', 'predicted_tasks', 'updated_at'])
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            pending = set()
+            for i in range(0, len(task_ids), chunk_size):
+                if len(pending) >= concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        save(future)
+
+                chunk = Task.objects.filter(id__in=task_ids[i : i + chunk_size]).order_by('id')
+                chunk = chunk.prefetch_related('annotations', 'predictions')
+                for task in chunk:
+                    task.project = project
+                serialized_tasks = TaskSimpleSerializer(chunk, many=True).data
+                pending.add(executor.submit(self._predict_chunk, serialized_tasks, ml_api))
+
+            for future in pending:
+                save(future)
+        return instances
+
+    def _predict_chunk(self, serialized_tasks, ml_api):
+        try:
+            return len(serialized_tasks), self._get_predictions_from_ml_backend(serialized_tasks, ml_api)
+        finally:
+            # feature flags may query the database from this thread
+            connections.close_all()
+
     def interactive_annotating(self, task, context=None, user=None):
         result = {}
         options = {}
@@ -427,6 +511,11 @@ class MLBackend(models.Model):
 
 
 class MLBackendPredictionJob(models.Model):
+    class Status(models.TextChoices):
+        CREATED = 'created', _('Created')
+        IN_PROGRESS = 'in_progress', _('In progress')
+        FAILED = 'failed', _('Failed')
+        COMPLETED = 'completed', _('Completed')
 
     job_id = models.CharField(max_length=128)
     ml_backend = models.ForeignKey(MLBackend, related_name='prediction_jobs', on_delete=models.CASCADE)
@@ -436,6 +525,19 @@ class MLBackendPredictionJob(models.Model):
     batch_size = models.PositiveSmallIntegerField(
         _('batch size'), default=100, help_text='Number of tasks processed per batch'
     )
+    status = models.CharField(
+        _('status'),
+        max_length=64,
+        choices=Status.choices,
+        default=Status.CREATED,
+    )
+    total_tasks = models.PositiveIntegerField(_('total tasks'), default=0, help_text='Number of tasks to predict')
+    processed_tasks = models.PositiveIntegerField(
+        _('processed tasks'), default=0, help_text='Number of tasks sent to the ML backend'
+    )
+    predicted_tasks = models.PositiveIntegerField(
+        _('predicted tasks'), default=0, help_text='Number of tasks with predictions returned by the ML backend'
+    )
 
     created_at = models.DateTimeField(_('created at'), auto_now_add=True)
     updated_at = models.DateTimeField(_('updated at'), auto_now=True)
@@ -13,10 +13,11 @@ from core.redis import start_job_async_or_sync
 from core.utils.common import paginator, paginator_help, temporary_disconnect_all_signals
 from core.utils.exceptions import LabelStudioDatabaseException, ProjectExistException
 from core.utils.io import find_dir, find_file, read_yaml
+from data_export.models import drop_deleted_project_data
 from data_manager.functions import filters_ordering_selected_items_exist, get_prepared_queryset
 from django.conf import settings
 from django.db import IntegrityError
-from django.db.models import F
+from django.db.models import Case, F, Max, Min, Value, When
 from django.contrib.auth import get_user_model
 from django.db import transaction
 from django.http import Http404
@@ -25,6 +26,13 @@ from django_filters import CharFilter, FilterSet
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_yasg.utils import swagger_auto_schema
 from ml.serializers import MLBackendSerializer
+from projects.functions.group_ranks import (
+    MAX_UNREAD_RANK_LENGTH,
+    needs_renumbering,
+    rank_between,
+    ranks_after,
+    renumber_ranks,
+)
 from projects.functions.next_task import get_next_task
 from projects.functions.stream_history import get_label_stream_history
 from projects.functions.utils import recalculate_created_annotations_and_labels_from_scratch
@@ -434,9 +442,12 @@ class ProjectAPI(generics.RetrieveUpdateDestroyAPIView):
         project = ser.save()
 
     def perform_destroy(self, instance):
+        project_id = instance.id
         # we don't need to relaculate counters if we delete whole project
         with temporary_disconnect_all_signals():
             instance.delete()
+        # export tombstones and visualization snapshots aren't deleted by cascades
+        drop_deleted_project_data(project_id)
 
     @swagger_auto_schema(auto_schema=None)
     @api_webhook(WebhookAction.PROJECT_UPDATED)
@@ -854,6 +865,22 @@ class ProjectModelVersions(generics.RetrieveAPIView):
 
         return Response(data=count)
 
+
+def lock_user_group_list(user_id):
+    """Serialize changes of one user's list, e.g. reorderings made from two browser tabs at once"""
+    User.objects.select_for_update().filter(pk=user_id).values_list('pk', flat=True).first()
+
+
+def renumber_user_group_list(user_id):
+    """Renumber the user's list if its ranks got too long, the check is repeated under the lock"""
+    with transaction.atomic():
+        lock_user_group_list(user_id)
+        nodes = ProjectGroupList.objects.filter(user_id=user_id)
+        ranks = nodes.aggregate(first_rank=Min('rank'), last_rank=Max('rank'))
+        if needs_renumbering(ranks['first_rank'], ranks['last_rank']):
+            renumber_ranks(nodes)
+
+
 class ProjectGroupListAPI(APIView):
     def get(self, request):
         user = request.user
@@ -868,39 +895,31 @@ class ProjectGroupListAPI(APIView):
         return Response(serializer.data)
 
     def initialize_user_group_list(self, user):
-        existing_groups = ProjectGroupList.objects.filter(user=user)
-        all_groups = ProjectGroup.objects.all().order_by('id')
+        """Append groups missing from the user's list, the whole list is created on the first read.
+        Lists with too long ranks are renumbered here, new groups make the ranks longer without renumbering.
+        """
+        ranks = ProjectGroupList.objects.filter(user=user).aggregate(first_rank=Min('rank'), last_rank=Max('rank'))
+        new_group_ids = list(
+            ProjectGroup.objects.exclude(projectgrouplist__user=user).order_by('id').values_list('id', flat=True)
+        )
+        if new_group_ids:
+            new_ranks = ranks_after(ranks['last_rank'], len(new_group_ids))
+            ProjectGroupList.objects.bulk_create(
+                [
+                    ProjectGroupList(user=user, group_id=group_id, rank=rank)
+                    for group_id, rank in zip(new_group_ids, new_ranks)
+                ],
+                # a concurrent request may be initializing the same list
+                ignore_conflicts=True,
+            )
+            ranks['last_rank'] = new_ranks[-1]
 
-        with transaction.atomic():
-            if not existing_groups.exists():
-                prev_node = None
-                for group in all_groups:
-                    node = ProjectGroupList.objects.create(user=user, group=group, prev_group=prev_node)
-                    if prev_node:
-                        prev_node.next_group = node
-                        prev_node.save()
-                    prev_node = node
-            else:
-                # Check for new groups and add them to the user's list
-                user_group_ids = set(existing_groups.values_list('group_id', flat=True))
-                new_groups = all_groups.exclude(id__in=user_group_ids)
-                
-                last_node = existing_groups.filter(next_group__isnull=True).first()
-                for group in new_groups:
-                    new_node = ProjectGroupList.objects.create(user=user, group=group, prev_group=last_node)
-                    if last_node:
-                        last_node.next_group = new_node
-                        last_node.save()
-                    last_node = new_node
+        if needs_renumbering(ranks['first_rank'], ranks['last_rank']):
+            renumber_user_group_list(user.id)
 
     def get_ordered_groups(self, user):
-        head_node = ProjectGroupList.objects.filter(user=user, prev_group__isnull=True).first()
-        ordered_groups = []
-        current_node = head_node
-        while current_node:
-            ordered_groups.append(current_node.group)
-            current_node = current_node.next_group
-        return ordered_groups
+        nodes = ProjectGroupList.objects.filter(user=user).select_related('group').order_by('rank', 'id')
+        return [node.group for node in nodes]
 
     def post(self, request):
         serializer = ProjectGroupSerializer(data=request.data)
@@ -939,13 +958,18 @@ class ProjectGroupListAPI(APIView):
             return Response({"error": "No valid project groups to update."}, status=400)
 
     def add_group_to_all_users(self, new_group):
-        with transaction.atomic():
-            for user in User.objects.all():
-                first_node = ProjectGroupList.objects.filter(user=user, prev_group__isnull=True).first()
-                new_node = ProjectGroupList.objects.create(user=user, group=new_group, next_group=first_node)
-                if first_node:
-                    first_node.prev_group = new_node
-                    first_node.save()
+        """Put the new group on top of every materialized list, users without a list get it on the first read"""
+        first_ranks = ProjectGroupList.objects.values('user_id').annotate(first_rank=Min('rank')).order_by()
+        nodes = [
+            ProjectGroupList(user_id=row['user_id'], group=new_group, rank=rank_between(None, row['first_rank']))
+            for row in first_ranks
+        ]
+        ProjectGroupList.objects.bulk_create(nodes, batch_size=settings.BATCH_SIZE, ignore_conflicts=True)
+        # every prepend makes the first rank longer, lists are renumbered on their next read,
+        # only lists not read for hundreds of new groups are renumbered here
+        for node in nodes:
+            if needs_renumbering(node.rank, max_length=MAX_UNREAD_RANK_LENGTH):
+                renumber_user_group_list(node.user_id)
 
 class ProjectGroupListOpsAPI(APIView):
     def post(self, request):
@@ -969,36 +993,23 @@ class ProjectGroupListOpsAPI(APIView):
         if not group_a_id or not group_b_id:
             return Response({"error": "Both 'a' and 'b' IDs are required for swap."}, status=400)
 
-        try:
-            node_a = ProjectGroupList.objects.get(user=user, group_id=group_a_id)
-            node_b = ProjectGroupList.objects.get(user=user, group_id=group_b_id)
-        except ProjectGroupList.DoesNotExist:
-            return Response({"error": "One or both project groups do not exist for this user."}, status=404)
-
-        # Swap the prev_group and next_group of node_a and node_b
-        node_a_prev, node_a_next = node_a.prev_group, node_a.next_group
-        node_b_prev, node_b_next = node_b.prev_group, node_b.next_group
-
-        node_a.prev_group, node_a.next_group = node_b_prev, node_b_next
-        node_b.prev_group, node_b.next_group = node_a_prev, node_a_next
-
-        # Update surrounding nodes
-        if node_a_prev:
-            node_a_prev.next_group = node_b
-        if node_a_next and node_a_next != node_b:
-            node_a_next.prev_group = node_b
-        if node_b_prev and node_b_prev != node_a:
-            node_b_prev.next_group = node_a
-        if node_b_next:
-            node_b_next.prev_group = node_a
-
-        # Save all affected nodes
-        node_a.save()
-        node_b.save()
-        if node_a_prev: node_a_prev.save()
-        if node_a_next and node_a_next != node_b: node_a_next.save()
-        if node_b_prev and node_b_prev != node_a: node_b_prev.save()
-        if node_b_next: node_b_next.save()
+        with transaction.atomic():
+            lock_user_group_list(user.id)
+            ranks = dict(
+                ProjectGroupList.objects.filter(user=user, group_id__in=[group_a_id, group_b_id]).values_list(
+                    'group_id', 'rank'
+                )
+            )
+            if len(ranks) != 2:
+                return Response({"error": "One or both project groups do not exist for this user."}, status=404)
+
+            # Exchange the ranks of both nodes in one statement
+            ProjectGroupList.objects.filter(user=user, group_id__in=[group_a_id, group_b_id]).update(
+                rank=Case(
+                    When(group_id=group_a_id, then=Value(ranks[int(group_b_id)])),
+                    default=Value(ranks[int(group_a_id)]),
+                )
+            )
 
         return self.get_ordered_groups_response(user)
 
@@ -1010,42 +1021,38 @@ class ProjectGroupListOpsAPI(APIView):
         if not group_id or (next_id is None and prev_id is None):
             return Response({"error": "Group ID and either 'next' or 'prev' ID are required for move."}, status=400)
 
-        try:
-            node = ProjectGroupList.objects.get(user=user, group_id=group_id)
-            target_node = ProjectGroupList.objects.get(user=user, group_id=next_id if next_id is not None else prev_id)
-        except ProjectGroupList.DoesNotExist:
-            return Response({"error": "One or both project groups do not exist for this user."}, status=404)
-
-        # Remove node from its current position
-        if node.prev_group:
-            node.prev_group.next_group = node.next_group
-            node.prev_group.save()
-        if node.next_group:
-            node.next_group.prev_group = node.prev_group
-            node.next_group.save()
-            
-        node.refresh_from_db()
-        target_node.refresh_from_db()
-
-        # Insert node at new position
-        if next_id is not None:
-            node.prev_group = target_node.prev_group
-            node.next_group = target_node
-            if target_node.prev_group:
-                target_node.prev_group.next_group = node
-                target_node.prev_group.save()
-            target_node.prev_group = node
-            target_node.save()
-        else:
-            node.next_group = target_node.next_group
-            node.prev_group = target_node
-            if target_node.next_group:
-                target_node.next_group.prev_group = node
-                target_node.next_group.save()
-            target_node.next_group = node
-            target_node.save()
-
-        node.save()
+        target_id = next_id if next_id is not None else prev_id
+        with transaction.atomic():
+            lock_user_group_list(user.id)
+            nodes = {
+                node.group_id: node
+                for node in ProjectGroupList.objects.filter(user=user, group_id__in=[group_id, target_id]).only(
+                    'id', 'group_id', 'rank'
+                )
+            }
+            node, target_node = nodes.get(int(group_id)), nodes.get(int(target_id))
+            if node is None or target_node is None:
+                return Response({"error": "One or both project groups do not exist for this user."}, status=404)
+            if node.pk == target_node.pk:
+                return self.get_ordered_groups_response(user)
+
+            # The node goes right before `next` or right after `prev`, its other neighbour is the
+            # closest rank on that side of the target (ignoring the node itself)
+            others = ProjectGroupList.objects.filter(user=user).exclude(pk=node.pk)
+            if next_id is not None:
+                neighbour = (
+                    others.filter(rank__lt=target_node.rank).order_by('-rank').values_list('rank', flat=True).first()
+                )
+                rank = rank_between(neighbour, target_node.rank)
+            else:
+                neighbour = (
+                    others.filter(rank__gt=target_node.rank).order_by('rank').values_list('rank', flat=True).first()
+                )
+                rank = rank_between(target_node.rank, neighbour)
+
+            ProjectGroupList.objects.filter(pk=node.pk).update(rank=rank)
+            if needs_renumbering(rank):
+                renumber_ranks(ProjectGroupList.objects.filter(user=user))
 
         return self.get_ordered_groups_response(user)
 
@@ -0,0 +1,92 @@
+"""Project counters materialized in ProjectSummary, so the project list doesn't aggregate tasks and annotations.
+
+Signals add exact deltas to the per row counters, the counters of derived task states
+(finished tasks, tasks with annotations) and bulk changes are refreshed by a debounced reconciliation job.
+"""
+import logging
+
+from core.redis import redis_connected, redis_delete, redis_set, start_job_async_or_sync
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_BATCH_SIZE = 100
+
+
+def annotation_counters(annotation):
+    """Counters the annotation adds to its project, with the same predicates as projects.functions.annotate_*"""
+    useful = not annotation.was_cancelled and not annotation.ground_truth and annotation.result is not None
+    return {
+        'total_annotations_number': int(not annotation.was_cancelled),
+        'useful_annotation_number': int(useful),
+        'ground_truth_number': int(annotation.ground_truth),
+        'skipped_annotations_number': int(annotation.was_cancelled),
+    }
+
+
+def add_counters(project_id, counters, sign=1):
+    """Apply deltas in the same transaction as the change, projects without reconciled counters are skipped"""
+    from projects.models import ProjectSummary
+
+    deltas = {field: F(field) + sign * value for field, value in counters.items() if value}
+    if project_id and deltas:
+        ProjectSummary.objects.filter(project_id=project_id, counters_updated_at__isnull=False).update(**deltas)
+
+
+def reconcile_project_counters(project_ids=None):
+    """Recompute the counters of the projects (all projects by default) with the aggregating annotations"""
+    from projects.models import Project, ProjectManager, ProjectSummary
+
+    projects = Project.objects.all() if project_ids is None else Project.objects.filter(id__in=project_ids)
+    project_ids = list(projects.order_by('id').values_list('id', flat=True))
+    for i in range(0, len(project_ids), RECONCILE_BATCH_SIZE):
+        queryset = Project.objects.filter(id__in=project_ids[i : i + RECONCILE_BATCH_SIZE])
+        rows = ProjectManager.aggregate_counts(queryset).values('id', *ProjectManager.COUNTER_FIELDS)
+        now = timezone.now()
+        for counters in rows:
+            project_id = counters.pop('id')
+            ProjectSummary.objects.update_or_create(
+                project_id=project_id, defaults=dict(counters, counters_updated_at=now)
+            )
+    logger.info(f'Reconciled counters of {len(project_ids)} projects')
+    return len(project_ids)
+
+
+def reconcile_key(project_id):
+    return f'project_counters_reconcile:{project_id}'
+
+
+def scheduled_reconcile_project_counters(project_id):
+    # changes from now on schedule the next reconciliation
+    redis_delete(reconcile_key(project_id))
+    reconcile_project_counters([project_id])
+
+
+def schedule_counters_reconcile(project_id):
+    """Reconcile the project counters after PROJECT_COUNTERS_RECONCILE_DELAY seconds, once for all changes
+    made in that time
+    """
+    if not settings.PROJECT_COUNTERS_MATERIALIZED or not project_id:
+        return
+    delay = settings.PROJECT_COUNTERS_RECONCILE_DELAY
+    if redis_connected() and not redis_set(reconcile_key(project_id), 1, ttl=delay * 2 + 60, nx=True):
+        return
+    transaction.on_commit(
+        lambda: start_job_async_or_sync(scheduled_reconcile_project_counters, project_id, in_seconds=delay)
+    )
+
+
+def counters_are_materialized(queryset):
+    """Check all projects of the queryset have reconciled counters, start reconciliation of the others"""
+    missing = queryset.filter(Q(summary__isnull=True) | Q(summary__counters_updated_at__isnull=True)).order_by()
+    project_ids = list(missing.values_list('id', flat=True))
+    if not project_ids:
+        return True
+    # requests made while the job runs don't start it again
+    if not redis_connected() or redis_set(reconcile_key(f'missing:{project_ids[0]}'), 1, ttl=600, nx=True):
+        start_job_async_or_sync(reconcile_project_counters, project_ids)
+    # without redis the projects are reconciled already
+    return not missing.exists()
@@ -0,0 +1,80 @@
+"""This file and its contents are licensed under the Apache License 2.0. Please see the included NOTICE for copyright information and LICENSE for a copy of the license.
+"""
+from typing import List, Optional
+
+from django.conf import settings
+from django.db.models import Case, F, Value, When
+
+# ranks are compared as plain strings, so digits must sort the same way in every collation
+RANK_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+RANK_BASE = len(RANK_DIGITS)
+# lists with longer ranks are renumbered, repeated inserts at the same place add a digit every few ranks
+MAX_RANK_LENGTH = 32
+# lists are renumbered when they are read, lists not read for a long time are renumbered
+# when prepending a group makes their first rank this long, well below the max_length of the rank column
+MAX_UNREAD_RANK_LENGTH = 224
+
+
+def rank_between(before: Optional[str] = None, after: Optional[str] = None) -> str:
+    """Return a rank sorting strictly between `before` and `after`
+
+    None means an open end: `rank_between(last, None)` appends, `rank_between(None, first)` prepends.
+    Generated ranks never end with the lowest digit, so there's always room for another rank below them.
+    """
+    if before is not None and after is not None and before >= after:
+        raise ValueError(f'Rank {before!r} must be lower than {after!r}')
+    before = before or ''
+    rank = ''
+    position = 0
+    while True:
+        low = RANK_DIGITS.index(before[position]) if position < len(before) else 0
+        high = RANK_DIGITS.index(after[position]) if after is not None and position < len(after) else RANK_BASE
+        if high - low > 1:
+            return rank + RANK_DIGITS[(low + high) // 2]
+        rank += RANK_DIGITS[low]
+        if high - low == 1:
+            # the prefix is already lower than `after`, only `before` bounds the remaining digits
+            after = None
+        position += 1
+
+
+def initial_ranks(count: int) -> List[str]:
+    """Return `count` ascending ranks spread evenly over the rank space, used to (re)build a list"""
+    width = 1
+    while RANK_BASE**width <= count:
+        width += 1
+    step = RANK_BASE**width // (count + 1)
+
+    ranks = []
+    for i in range(1, count + 1):
+        value = step * i
+        digits = []
+        for _ in range(width):
+            value, digit = divmod(value, RANK_BASE)
+            digits.append(RANK_DIGITS[digit])
+        ranks.append(''.join(reversed(digits)).rstrip(RANK_DIGITS[0]))
+    return ranks
+
+
+def ranks_after(rank: Optional[str], count: int) -> List[str]:
+    """Return `count` ascending ranks following `rank` with nothing after it, used to append groups in bulk
+
+    Appending with `rank_between` one by one grows the rank by a digit every few groups, here the new
+    ranks share `rank` as a prefix and are spread evenly after it, so their length grows logarithmically.
+    """
+    return [(rank or '') + suffix for suffix in initial_ranks(count)]
+
+
+def needs_renumbering(*ranks: Optional[str], max_length: int = MAX_RANK_LENGTH) -> bool:
+    return any(rank is not None and len(rank) > max_length for rank in ranks)
+
+
+def renumber_ranks(nodes) -> None:
+    """Spread ranks of the list `nodes` (a queryset of one user's list) evenly again, keeping their order"""
+    pks = list(nodes.order_by('rank', 'id').values_list('pk', flat=True))
+    ranks = initial_ranks(len(pks))
+    for i in range(0, len(pks), settings.BATCH_SIZE):
+        batch = list(zip(pks[i : i + settings.BATCH_SIZE], ranks[i : i + settings.BATCH_SIZE]))
+        nodes.model.objects.filter(pk__in=[pk for pk, _ in batch]).update(
+            rank=Case(*[When(pk=pk, then=Value(rank)) for pk, rank in batch], default=F('rank'))
+        )
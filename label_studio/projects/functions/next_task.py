@@ -7,6 +7,7 @@ from core.utils.common import conditional_atomic, db_is_not_sqlite, load_func
 from django.conf import settings
 from django.db.models import BooleanField, Case, Count, Exists, F, Max, OuterRef, Q, QuerySet, Value, When
 from django.db.models.fields import DecimalField
+from projects.functions.next_task_queue import get_task_from_queue
 from projects.functions.stream_history import add_stream_history
 from projects.models import Project
 from tasks.models import Annotation, Task
@@ -288,8 +289,12 @@ def get_task_from_qs_with_sampling(
     project: Project,
     queue_info: str,
 ) -> Tuple[Union[Task, None], str]:
-    next_task = None
-    if project.sampling == project.SEQUENCE:
+    # pre-computed candidates from redis, if the queue is enabled and has a suitable one
+    next_task = get_task_from_queue(not_solved_tasks, project, user, prepared_tasks, user_solved_tasks_array)
+    if next_task:
+        queue_info += (' & ' if queue_info else '') + 'Pre-computed ' + project.sampling.lower() + ' queue'
+
+    elif project.sampling == project.SEQUENCE:
         logger.debug(f'User={user} tries sequence sampling from prepared tasks')
         next_task = _get_first_unlocked(not_solved_tasks, user)
         if next_task:
@@ -0,0 +1,233 @@
+"""Redis queue of pre-computed next task candidates
+
+Every project keeps one short list of unlabeled task ids per sampling mode, ordered the way the mode
+serves them: by id for sequence sampling, shuffled for uniform sampling and by prediction score for
+uncertainty sampling. `get_next_task` takes a window of candidates from the queue and validates it against
+the user's not solved tasks with one query, instead of sampling the whole project in the database.
+Whenever the queue has no suitable candidate, the regular database path is used.
+
+The queue is refilled in the background when it gets short, labeled tasks are removed from it by
+annotation signals and locked tasks are rotated to its tail, so concurrent annotators don't keep checking
+the same locked candidates.
+"""
+import logging
+import random
+from collections import Counter
+from typing import List, Union
+
+import redis
+from core import redis as core_redis
+from core.redis import redis_healthcheck, start_job_async_or_sync
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, QuerySet
+from tasks.models import Task
+
+logger = logging.getLogger(__name__)
+
+# Project.SEQUENCE, Project.UNIFORM and Project.UNCERTAINTY, projects.models imports this module
+SEQUENCE = 'Sequential sampling'
+UNIFORM = 'Uniform sampling'
+UNCERTAINTY = 'Uncertainty sampling'
+QUEUE_MODES = {SEQUENCE: 'sequence', UNIFORM: 'uniform', UNCERTAINTY: 'uncertainty'}
+# how many windows of candidates one request looks through before falling back to the database
+MAX_WINDOWS = 3
+
+
+def _get_connection():
+    if not settings.NEXT_TASK_QUEUE_ENABLED or not redis_healthcheck():
+        return None
+    return core_redis._redis
+
+
+def queue_key(project_id: int, sampling: str) -> str:
+    return f'next_task_queue:{project_id}:{QUEUE_MODES[sampling]}'
+
+
+def _refill_lock_key(key: str) -> str:
+    return f'{key}:refilling'
+
+
+def _model_version_key(key: str) -> str:
+    return f'{key}:model_version'
+
+
+def _encode(task_id: int, cluster=None) -> str:
+    return f'{task_id}' if cluster is None else f'{task_id}:{cluster}'
+
+
+def _decode(entry: bytes):
+    task_id, _, cluster = entry.decode().partition(':')
+    return int(task_id), (int(cluster) if cluster else None)
+
+
+def refill_next_task_queue(project_id: int, sampling: str):
+    """Job computing the candidates of one project queue and replacing the queue with them"""
+    from projects.models import Project
+
+    connection = _get_connection()
+    if connection is None:
+        return
+    key = queue_key(project_id, sampling)
+    try:
+        project = Project.objects.filter(id=project_id).first()
+        if project is None:
+            connection.delete(key)
+            return
+
+        size = settings.NEXT_TASK_QUEUE_SIZE
+        tasks = Task.objects.filter(project_id=project_id, is_labeled=False)
+        if sampling == UNCERTAINTY:
+            rows = (
+                tasks.filter(predictions__model_version=project.model_version)
+                .order_by('predictions__score', 'id')
+                .values_list('id', 'predictions__cluster')[:size]
+            )
+            entries = [_encode(task_id, cluster) for task_id, cluster in rows]
+        elif sampling == UNIFORM:
+            entries = [_encode(task_id) for task_id in tasks.order_by('?').values_list('id', flat=True)[:size]]
+        else:
+            entries = [_encode(task_id) for task_id in tasks.order_by('id').values_list('id', flat=True)[:size]]
+
+        pipeline = connection.pipeline()
+        pipeline.delete(key)
+        if entries:
+            pipeline.rpush(key, *entries)
+            pipeline.expire(key, settings.NEXT_TASK_QUEUE_TTL)
+        pipeline.set(_model_version_key(key), project.model_version or '', ex=settings.NEXT_TASK_QUEUE_TTL)
+        pipeline.execute()
+        logger.debug(f'Next task queue {key} refilled with {len(entries)} tasks')
+    finally:
+        connection.delete(_refill_lock_key(key))
+
+
+def schedule_refill(connection, project_id: int, sampling: str):
+    key = queue_key(project_id, sampling)
+    # only one refill per queue at a time
+    if connection.set(_refill_lock_key(key), 1, nx=True, ex=settings.NEXT_TASK_QUEUE_TTL):
+        start_job_async_or_sync(refill_next_task_queue, project_id, sampling)
+
+
+def _order_uncertainty_candidates(candidates, prepared_tasks: QuerySet, user_solved_tasks_array: List[int]):
+    """Serve candidates from the clusters the user solved least first, keeping the score order inside them"""
+    if not any(cluster is not None for _, cluster in candidates):
+        return candidates
+    user_solved_clusters = Counter(
+        prepared_tasks.filter(pk__in=user_solved_tasks_array)
+        .annotate(cluster=Max('predictions__cluster'))
+        .values_list('cluster', flat=True)
+    )
+    return sorted(candidates, key=lambda candidate: user_solved_clusters.get(candidate[1], 0))
+
+
+def get_task_from_queue(
+    not_solved_tasks: QuerySet,
+    project,
+    user,
+    prepared_tasks: QuerySet = None,
+    user_solved_tasks_array: List[int] = None,
+) -> Union[Task, None]:
+    """Take the next task for `user` from the project queue, return None to fall back to database sampling"""
+    if project.sampling not in QUEUE_MODES:
+        return None
+    connection = _get_connection()
+    if connection is None:
+        return None
+
+    key = queue_key(project.id, project.sampling)
+    window = settings.NEXT_TASK_QUEUE_WINDOW
+    try:
+        if project.sampling == UNCERTAINTY:
+            model_version = connection.get(_model_version_key(key))
+            if model_version is not None and model_version.decode() != (project.model_version or ''):
+                connection.delete(key)
+
+        for offset in range(0, window * MAX_WINDOWS, window):
+            entries = connection.lrange(key, offset, offset + window - 1)
+            if len(entries) < window and offset == 0:
+                schedule_refill(connection, project.id, project.sampling)
+                if not entries:
+                    entries = connection.lrange(key, 0, window - 1)
+            if not entries:
+                return None
+
+            candidates = [_decode(entry) for entry in entries]
+            # user specific filters (solved, postponed, assigned, overlap) are applied by the queryset
+            candidate_ids = [task_id for task_id, _ in candidates]
+            valid_ids = set(not_solved_tasks.filter(pk__in=candidate_ids).values_list('id', flat=True))
+            candidates = [candidate for candidate in candidates if candidate[0] in valid_ids]
+
+            if project.sampling == UNIFORM:
+                random.shuffle(candidates)
+            elif project.sampling == UNCERTAINTY and prepared_tasks is not None:
+                candidates = _order_uncertainty_candidates(candidates, prepared_tasks, user_solved_tasks_array or [])
+
+            for task_id, _ in candidates:
+                task = Task.objects.select_for_update(skip_locked=True).filter(pk=task_id).first()
+                if task is not None and not task.has_lock(user):
+                    return task
+            if len(entries) < window:
+                return None
+    except redis.exceptions.RedisError as exc:
+        logger.warning(f'Next task queue {key} is not available, falling back to database: {exc}')
+    return None
+
+
+def remove_tasks_from_queues(project_id: int, task_ids: List[int]):
+    """Drop tasks from all queues of the project, e.g. once they are labeled"""
+    connection = _get_connection()
+    if connection is None:
+        return
+    try:
+        pipeline = connection.pipeline()
+        for sampling in QUEUE_MODES:
+            key = queue_key(project_id, sampling)
+            for entry in _find_entries(connection, key, task_ids):
+                pipeline.lrem(key, 0, entry)
+        pipeline.execute()
+    except redis.exceptions.RedisError as exc:
+        logger.warning(f'Failed to remove tasks from next task queues of project {project_id}: {exc}')
+
+
+def rotate_task_in_queues(project_id: int, task_id: int):
+    """Move a locked task to the tail of the queues, it's checked again after the other candidates"""
+    connection = _get_connection()
+    if connection is None:
+        return
+    try:
+        pipeline = connection.pipeline()
+        for sampling in QUEUE_MODES:
+            key = queue_key(project_id, sampling)
+            for entry in _find_entries(connection, key, [task_id]):
+                pipeline.lrem(key, 0, entry)
+                pipeline.rpush(key, entry)
+        pipeline.execute()
+    except redis.exceptions.RedisError as exc:
+        logger.warning(f'Failed to rotate task {task_id} in next task queues of project {project_id}: {exc}')
+
+
+def invalidate_queues(project_id: int):
+    """Drop all queues of the project, they are recomputed on the next request"""
+    connection = _get_connection()
+    if connection is None:
+        return
+    try:
+        connection.delete(*[queue_key(project_id, sampling) for sampling in QUEUE_MODES])
+    except redis.exceptions.RedisError as exc:
+        logger.warning(f'Failed to invalidate next task queues of project {project_id}: {exc}')
+
+
+def _find_entries(connection, key, task_ids):
+    # uncertainty entries carry the cluster after the id, so entries are matched by their id prefix
+    prefixes = {str(task_id) for task_id in task_ids}
+    return [entry for entry in connection.lrange(key, 0, -1) if entry.decode().partition(':')[0] in prefixes]
+
+
+def on_commit_remove_labeled_task(task):
+    """Remove the task from the queues after the transaction if it has become labeled"""
+
+    def remove():
+        if task.is_labeled:
+            remove_tasks_from_queues(task.project_id, [task.id])
+
+    transaction.on_commit(remove)
@@ -0,0 +1,59 @@
+import sqlite3
+
+from django.db import connection
+
+# tasks ranked by finished state and annotation count: the first must_tasks get the maximum overlap
+RANKED_TASKS_SQL = """
+SELECT id, CASE
+    WHEN finished >= %s OR ROW_NUMBER() OVER (
+        ORDER BY CASE WHEN finished >= %s THEN 1 ELSE 0 END DESC, total DESC, id
+    ) <= %s THEN %s
+    ELSE 1
+END AS new_overlap
+FROM (
+    SELECT t.id AS id, COUNT(a.id) AS total, SUM(
+        CASE WHEN a.was_cancelled = %s AND a.ground_truth = %s AND a.result IS NOT NULL THEN 1 ELSE 0 END
+    ) AS finished
+    FROM {task} t LEFT JOIN {annotation} a ON a.task_id = t.id
+    WHERE t.project_id = %s
+    GROUP BY t.id
+) counts
+"""
+
+UPDATE_FROM_SQL = """
+UPDATE {task} SET overlap = ranked.new_overlap
+FROM ({ranked}) ranked
+WHERE {task}.id = ranked.id AND {task}.overlap <> ranked.new_overlap
+"""
+
+UPDATE_JOIN_SQL = """
+UPDATE {task} INNER JOIN ({ranked}) ranked ON {task}.id = ranked.id
+SET {task}.overlap = ranked.new_overlap
+WHERE {task}.overlap <> ranked.new_overlap
+"""
+
+
+def supports_set_based_rearrange():
+    if connection.vendor in ('postgresql', 'mysql'):
+        return True
+    # UPDATE ... FROM is available since sqlite 3.33
+    return connection.vendor == 'sqlite' and sqlite3.sqlite_version_info >= (3, 33, 0)
+
+
+def rearrange_overlap_cohort(project_id, maximum_annotations, must_tasks):
+    """Assign overlap to all tasks of the project in one statement, like Project._rearrange_overlap_cohort:
+    tasks finished with maximum_annotations keep the maximum overlap, then the tasks with the most annotations
+    get it until there are must_tasks of them, the rest get overlap 1.
+    :return: Number of tasks with changed overlap
+    """
+    from tasks.models import Annotation, Task
+
+    quote = connection.ops.quote_name
+    ranked = RANKED_TASKS_SQL.format(task=quote(Task._meta.db_table), annotation=quote(Annotation._meta.db_table))
+    template = UPDATE_JOIN_SQL if connection.vendor == 'mysql' else UPDATE_FROM_SQL
+    sql = template.format(task=quote(Task._meta.db_table), ranked=ranked)
+    params = [maximum_annotations, maximum_annotations, must_tasks, maximum_annotations, False, False, project_id]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
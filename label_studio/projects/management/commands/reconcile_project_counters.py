@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Recompute project counters materialized in ProjectSummary (task_number, total_annotations_number, etc)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--project',
+            dest='project_ids',
+            type=int,
+            nargs='*',
+            default=None,
+            help='Project ids to reconcile, all projects by default',
+        )
+        parser.add_argument(
+            '--redis',
+            dest='redis',
+            action='store_true',
+            default=False,
+            help='Use rq workers with redis (async background processing)',
+        )
+
+    def handle(self, *args, **options):
+        from core.redis import start_job_async_or_sync
+        from projects.functions.counters import reconcile_project_counters
+
+        start_job_async_or_sync(reconcile_project_counters, options['project_ids'], redis=options['redis'])
@@ -0,0 +1,85 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:34
+
+from django.db import migrations, models
+from projects.functions.group_ranks import initial_ranks
+
+
+def linked_list_to_ranks(apps, schema_editor):
+    """Walk every user's linked list once and store the position of each node as a rank"""
+    ProjectGroupList = apps.get_model('projects', 'ProjectGroupList')
+
+    nodes_by_user = {}
+    for node in ProjectGroupList.objects.all().only('id', 'user_id', 'prev_group_id', 'next_group_id'):
+        nodes_by_user.setdefault(node.user_id, {})[node.id] = node
+
+    updated = []
+    for nodes in nodes_by_user.values():
+        ordered, visited = [], set()
+        heads = sorted(node.id for node in nodes.values() if node.prev_group_id is None)
+        for head_id in heads:
+            current = nodes.get(head_id)
+            while current is not None and current.id not in visited:
+                visited.add(current.id)
+                ordered.append(current)
+                current = nodes.get(current.next_group_id)
+        # nodes cut off from the list by broken pointers go to the end
+        ordered.extend(nodes[node_id] for node_id in sorted(nodes) if node_id not in visited)
+
+        for node, rank in zip(ordered, initial_ranks(len(ordered))):
+            node.rank = rank
+            updated.append(node)
+
+    ProjectGroupList.objects.bulk_update(updated, ['rank'], batch_size=1000)
+
+
+def ranks_to_linked_list(apps, schema_editor):
+    ProjectGroupList = apps.get_model('projects', 'ProjectGroupList')
+
+    updated = []
+    prev_by_user = {}
+    for node in ProjectGroupList.objects.all().order_by('user_id', 'rank', 'id'):
+        prev = prev_by_user.get(node.user_id)
+        node.prev_group_id = prev.id if prev else None
+        node.next_group_id = None
+        if prev:
+            prev.next_group_id = node.id
+        prev_by_user[node.user_id] = node
+        updated.append(node)
+
+    ProjectGroupList.objects.bulk_update(updated, ['prev_group', 'next_group'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0046_transfer_project_groups_to_user_lists'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectgrouplist',
+            name='rank',
+            field=models.CharField(
+                default='',
+                help_text="Sortable position of the project group in the user's list, see projects.functions.group_ranks",
+                max_length=255,
+            ),
+        ),
+        migrations.RunPython(linked_list_to_ranks, ranks_to_linked_list),
+        migrations.RemoveField(
+            model_name='projectgrouplist',
+            name='next_group',
+        ),
+        migrations.RemoveField(
+            model_name='projectgrouplist',
+            name='prev_group',
+        ),
+        migrations.AlterModelOptions(
+            name='projectgrouplist',
+            options={'ordering': ['rank', 'id']},
+        ),
+        migrations.AddIndex(
+            model_name='projectgrouplist',
+            index=models.Index(fields=['user', 'rank'], name='projectgrouplist_user_rank'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0047_projectgrouplist_rank'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectsummary',
+            name='task_number',
+            field=models.IntegerField(default=0, help_text='Total task number in project', verbose_name='task number'),
+        ),
+        migrations.AddField(
+            model_name='projectsummary',
+            name='finished_task_number',
+            field=models.IntegerField(default=0, help_text='Finished tasks', verbose_name='finished task number'),
+        ),
+        migrations.AddField(
+            model_name='projectsummary',
+            name='total_predictions_number',
+            field=models.IntegerField(
+                default=0, help_text='Total predictions number in project', verbose_name='total predictions number'
+            ),
+        ),
+        migrations.AddField(
+            model_name='projectsummary',
+            name='total_annotations_number',
+            field=models.IntegerField(
+                default=0,
+                help_text='Total annotations number in project, skipped excluded',
+                verbose_name='total annotations number',
+            ),
+        ),
+        migrations.AddField(
+            model_name='projectsummary',
+            name='num_tasks_with_annotations',
+            field=models.IntegerField(
+                default=0, help_text='Tasks with annotations number in project', verbose_name='tasks with annotations'
+            ),
+        ),
+        migrations.AddField(
+            model_name='projectsummary',
+            name='useful_annotation_number',
+            field=models.IntegerField(
+                default=0,
+                help_text='Annotations excluding skipped and ground truth',
+                verbose_name='useful annotation number',
+            ),
+        ),
+        migrations.AddField(
+            model_name='projectsummary',
+            name='ground_truth_number',
+            field=models.IntegerField(default=0, help_text='Ground truth number', verbose_name='ground truth number'),
+        ),
+        migrations.AddField(
+            model_name='projectsummary',
+            name='skipped_annotations_number',
+            field=models.IntegerField(
+                default=0, help_text='Skipped annotations number', verbose_name='skipped annotations number'
+            ),
+        ),
+        migrations.AddField(
+            model_name='projectsummary',
+            name='counters_updated_at',
+            field=models.DateTimeField(
+                default=None,
+                help_text='Last reconciliation time of the counters',
+                null=True,
+                verbose_name='counters updated at',
+            ),
+        ),
+    ]
@@ -20,6 +20,7 @@ from core.label_config import (
     get_sample_task,
     validate_label_config,
 )
+from core.models import AsyncMigrationStatus
 from core.utils.common import (
     create_hash,
     get_attr_or_item,
@@ -31,7 +32,9 @@ from core.utils.exceptions import LabelStudioValidationErrorSentryIgnored
 from django.conf import settings
 from django.core.validators import MaxLengthValidator, MinLengthValidator
 from django.db import models, transaction
-from django.db.models import Avg, BooleanField, Case, Count, JSONField, Max, Q, Sum, Value, When
+from django.db.models import Avg, BooleanField, Case, Count, F, JSONField, Max, Q, Sum, Value, When
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 from label_studio_sdk._extensions.label_studio_tools.core.label_config import parse_config
 from labels_manager.models import Label
@@ -45,6 +48,18 @@ from projects.functions import (
     annotate_total_predictions_number,
     annotate_useful_annotation_number,
 )
+from projects.functions.counters import (
+    add_counters,
+    annotation_counters,
+    counters_are_materialized,
+    schedule_counters_reconcile,
+)
+from projects.functions.next_task_queue import (
+    invalidate_queues,
+    on_commit_remove_labeled_task,
+    rotate_task_in_queues,
+)
+from projects.functions.overlap import rearrange_overlap_cohort, supports_set_based_rearrange
 from projects.functions.utils import make_queryset_from_iterable
 from tasks.models import (
     Annotation,
@@ -52,7 +67,9 @@ from tasks.models import (
     Prediction,
     Q_task_finished_annotations,
     Task,
+    TaskLock,
     bulk_update_stats_project_tasks,
+    post_bulk_create,
 )
 
 logger = logging.getLogger(__name__)
@@ -95,7 +112,15 @@ class ProjectManager(models.Manager):
         else:
             to_annotate = {field: available_fields[field] for field in fields if field in available_fields}
 
-        for _, annotate_func in to_annotate.items():  # noqa: F402
+        # read the counters maintained in ProjectSummary instead of aggregating them for each project
+        if settings.PROJECT_COUNTERS_MATERIALIZED and counters_are_materialized(queryset):
+            return queryset.annotate(**{field: F(f'summary__{field}') for field in to_annotate})
+
+        return ProjectManager.aggregate_counts(queryset, to_annotate)
+
+    @staticmethod
+    def aggregate_counts(queryset, to_annotate=None):
+        for _, annotate_func in (to_annotate or ProjectManager.ANNOTATED_FIELDS).items():  # noqa: F402
             queryset = annotate_func(queryset)
 
         return queryset
@@ -447,17 +472,52 @@ class Project(ProjectMixin, models.Model):
         elif tasks_number_changed and self.overlap_cohort_percentage < 100 and self.maximum_annotations > 1:
             self._rearrange_overlap_cohort()
 
+        schedule_counters_reconcile(self.id)
+
     def _rearrange_overlap_cohort(self):
         """
         Rearrange overlap depending on annotation count in tasks
         """
         all_project_tasks = Task.objects.filter(project=self)
         max_annotations = self.maximum_annotations
-        must_tasks = int(self.tasks.count() * self.overlap_cohort_percentage / 100 + 0.5)
+        total_tasks = self.tasks.count()
+        must_tasks = int(total_tasks * self.overlap_cohort_percentage / 100 + 0.5)
         logger.info(
             f'Starting _rearrange_overlap_cohort with params: Project {str(self)} maximum_annotations '
             f'{max_annotations} and percentage {self.overlap_cohort_percentage}'
         )
+
+        # large projects record the progress of the job
+        migration = None
+        if total_tasks >= settings.OVERLAP_REARRANGE_TRACKED_MIN_TASKS:
+            migration = AsyncMigrationStatus.objects.create(
+                project=self,
+                name='rearrange_overlap_cohort',
+                status=AsyncMigrationStatus.STATUS_IN_PROGRESS,
+                meta={'total_tasks': total_tasks, 'must_tasks': must_tasks, 'maximum_annotations': max_annotations},
+            )
+        try:
+            if supports_set_based_rearrange():
+                updated = rearrange_overlap_cohort(self.id, max_annotations, must_tasks)
+                logger.info(f'Overlap of {updated} tasks is changed')
+            else:
+                self._rearrange_overlap_cohort_by_ids(all_project_tasks, max_annotations, must_tasks)
+            # update is labeled after tasks rearrange overlap
+            bulk_update_stats_project_tasks(all_project_tasks, project=self)
+        except Exception as exc:
+            if migration:
+                migration.status = AsyncMigrationStatus.STATUS_ERROR
+                migration.meta['error'] = str(exc)
+                migration.save(update_fields=['status', 'meta', 'updated_at'])
+            raise
+
+        if migration:
+            migration.status = AsyncMigrationStatus.STATUS_FINISHED
+            migration.save(update_fields=['status', 'updated_at'])
+
+    @staticmethod
+    def _rearrange_overlap_cohort_by_ids(all_project_tasks, max_annotations, must_tasks):
+        """Fallback of _rearrange_overlap_cohort for databases without UPDATE ... FROM"""
         tasks_with_max_annotations = all_project_tasks.annotate(
             anno=Count('annotations', filter=Q_task_finished_annotations & Q(annotations__ground_truth=False))
         ).filter(anno__gte=max_annotations)
@@ -487,8 +547,6 @@ class Project(ProjectMixin, models.Model):
             all_project_tasks.filter(id__in=ids).update(overlap=max_annotations)
             ids = list(tasks_with_min_annotations.values_list('id', flat=True))
             all_project_tasks.filter(id__in=ids).update(overlap=1)
-        # update is labeled after tasks rearrange overlap
-        bulk_update_stats_project_tasks(all_project_tasks, project=self)
 
     def remove_tasks_by_file_uploads(self, file_upload_ids):
         self.tasks.filter(file_upload_id__in=file_upload_ids).delete()
@@ -998,7 +1056,7 @@ class Project(ProjectMixin, models.Model):
 
         if storage:
             return {
-                'url': storage.generate_http_url(url),
+                'url': storage.get_http_url(url),
                 'presign_ttl': storage.presign_ttl,
             }
 
@@ -1022,6 +1080,7 @@ class Project(ProjectMixin, models.Model):
                 num_tasks_updated += update_tasks_counters(queryset, from_scratch)
                 bulk_update_stats_project_tasks(queryset, self)
             page_idx += 1
+        schedule_counters_reconcile(self.id)
         return num_tasks_updated
 
     def _update_tasks_counters_and_task_states(
@@ -1155,6 +1214,29 @@ class ProjectSummary(models.Model):
         _('created labels in drafts'), null=True, default=dict, help_text='Unique drafts labels'
     )
 
+    # counters of ProjectManager.COUNTER_FIELDS, maintained with PROJECT_COUNTERS_MATERIALIZED
+    task_number = models.IntegerField(_('task number'), default=0, help_text='Total task number in project')
+    finished_task_number = models.IntegerField(_('finished task number'), default=0, help_text='Finished tasks')
+    total_predictions_number = models.IntegerField(
+        _('total predictions number'), default=0, help_text='Total predictions number in project'
+    )
+    total_annotations_number = models.IntegerField(
+        _('total annotations number'), default=0, help_text='Total annotations number in project, skipped excluded'
+    )
+    num_tasks_with_annotations = models.IntegerField(
+        _('tasks with annotations'), default=0, help_text='Tasks with annotations number in project'
+    )
+    useful_annotation_number = models.IntegerField(
+        _('useful annotation number'), default=0, help_text='Annotations excluding skipped and ground truth'
+    )
+    ground_truth_number = models.IntegerField(_('ground truth number'), default=0, help_text='Ground truth number')
+    skipped_annotations_number = models.IntegerField(
+        _('skipped annotations number'), default=0, help_text='Skipped annotations number'
+    )
+    counters_updated_at = models.DateTimeField(
+        _('counters updated at'), null=True, default=None, help_text='Last reconciliation time of the counters'
+    )
+
     def has_permission(self, user):
         user.project = self.project  # link for activity log
         return self.project.has_permission(user)
@@ -1169,13 +1251,17 @@ class ProjectSummary(models.Model):
         self.save()
 
     def update_data_columns(self, tasks):
+        from data_manager.data_column_indexes import redetect_data_column_types
+
         common_data_columns = set()
         all_data_columns = dict(self.all_data_columns)
+        tasks_data = []
         for task in tasks:
             try:
                 task_data = get_attr_or_item(task, 'data')
             except KeyError:
                 task_data = task
+            tasks_data.append(task_data)
             task_data_keys = task_data.keys()
             for column in task_data_keys:
                 all_data_columns[column] = all_data_columns.get(column, 0) + 1
@@ -1192,6 +1278,7 @@ class ProjectSummary(models.Model):
         logger.debug(f'summary.all_data_columns = {self.all_data_columns}')
         logger.debug(f'summary.common_data_columns = {self.common_data_columns}')
         self.save(update_fields=['all_data_columns', 'common_data_columns'])
+        redetect_data_column_types(self.project, tasks_data)
 
     def remove_data_columns(self, tasks):
         all_data_columns = dict(self.all_data_columns)
@@ -1213,6 +1300,8 @@ class ProjectSummary(models.Model):
                 if key in common_data_columns:
                     common_data_columns.remove(key)
             self.common_data_columns = common_data_columns
+            # indexes of columns without values are dropped
+            self.project.data_column_indexes.filter(key__in=keys_to_remove).delete()
         logger.debug(f'summary.all_data_columns = {self.all_data_columns}')
         logger.debug(f'summary.common_data_columns = {self.common_data_columns}')
         self.save(
@@ -1445,25 +1534,106 @@ class ProjectGroupList(models.Model):
     """Model representing a user's custom list of project groups."""
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='project_group_lists')
     group = models.ForeignKey('projects.ProjectGroup', on_delete=models.CASCADE)
-    prev_group = models.ForeignKey(
-        'self', 
-        null=True, 
-        blank=True, 
-        related_name='next_groups',
-        on_delete=models.SET_NULL, 
-        help_text='Previous project group in the user\'s list'
-    )
-    next_group = models.ForeignKey(
-        'self', 
-        null=True, 
-        blank=True, 
-        related_name='prev_groups',
-        on_delete=models.SET_NULL, 
-        help_text='Next project group in the user\'s list'
+    rank = models.CharField(
+        max_length=255,
+        default='',
+        help_text='Sortable position of the project group in the user\'s list, see projects.functions.group_ranks',
     )
 
     class Meta:
         unique_together = ('user', 'group')
+        ordering = ['rank', 'id']
+        indexes = [models.Index(fields=['user', 'rank'], name='projectgrouplist_user_rank')]
 
     def __str__(self):
-        return f"{self.user.username}'s {self.group.name}"
\ No newline at end of file
+        return f"{self.user.username}'s {self.group.name}"
+
+
+@receiver(post_save, sender=Annotation)
+def remove_labeled_task_from_next_task_queues(sender, instance, **kwargs):
+    if settings.NEXT_TASK_QUEUE_ENABLED and instance.task_id:
+        on_commit_remove_labeled_task(instance.task)
+
+
+@receiver(post_delete, sender=Annotation)
+def invalidate_next_task_queues(sender, instance, **kwargs):
+    # the task may become unlabeled again, so the queues are recomputed
+    if settings.NEXT_TASK_QUEUE_ENABLED and instance.project_id:
+        project_id = instance.project_id
+        transaction.on_commit(lambda: invalidate_queues(project_id))
+
+
+@receiver(post_save, sender=TaskLock)
+def rotate_locked_task_in_next_task_queues(sender, instance, **kwargs):
+    if settings.NEXT_TASK_QUEUE_ENABLED:
+        project_id, task_id = instance.task.project_id, instance.task_id
+        transaction.on_commit(lambda: rotate_task_in_queues(project_id, task_id))
+
+
+# =========== PROJECT COUNTERS UPDATES ===========
+
+
+@receiver(post_save, sender=Task)
+def add_task_to_project_counters(sender, instance, created, **kwargs):
+    if settings.PROJECT_COUNTERS_MATERIALIZED and created:
+        add_counters(instance.project_id, {'task_number': 1})
+
+
+@receiver(post_delete, sender=Task)
+def remove_task_from_project_counters(sender, instance, **kwargs):
+    if settings.PROJECT_COUNTERS_MATERIALIZED:
+        add_counters(instance.project_id, {'task_number': 1, 'finished_task_number': int(instance.is_labeled)}, -1)
+        schedule_counters_reconcile(instance.project_id)
+
+
+@receiver(pre_save, sender=Annotation)
+def keep_previous_annotation_counters(sender, instance, **kwargs):
+    if settings.PROJECT_COUNTERS_MATERIALIZED and instance.id:
+        previous = sender.objects.filter(id=instance.id).only('was_cancelled', 'ground_truth', 'result').first()
+        instance._previous_counters = annotation_counters(previous) if previous else None
+
+
+@receiver(post_save, sender=Annotation)
+def add_annotation_to_project_counters(sender, instance, created, **kwargs):
+    if not settings.PROJECT_COUNTERS_MATERIALIZED:
+        return
+    counters = annotation_counters(instance)
+    previous = getattr(instance, '_previous_counters', None)
+    if not created and previous:
+        counters = {field: value - previous[field] for field, value in counters.items()}
+    add_counters(instance.project_id, counters)
+    # task is_labeled and tasks with annotations are derived, they are recomputed in the reconciliation
+    schedule_counters_reconcile(instance.project_id)
+
+
+@receiver(post_delete, sender=Annotation)
+def remove_annotation_from_project_counters(sender, instance, **kwargs):
+    if settings.PROJECT_COUNTERS_MATERIALIZED:
+        add_counters(instance.project_id, annotation_counters(instance), -1)
+        schedule_counters_reconcile(instance.project_id)
+
+
+@receiver(post_bulk_create, sender=Annotation)
+def add_bulk_annotations_to_project_counters(sender, objs, **kwargs):
+    if not settings.PROJECT_COUNTERS_MATERIALIZED:
+        return
+    counters_by_project = {}
+    for annotation in objs:
+        counters = counters_by_project.setdefault(annotation.project_id, {})
+        for field, value in annotation_counters(annotation).items():
+            counters[field] = counters.get(field, 0) + value
+    for project_id, counters in counters_by_project.items():
+        add_counters(project_id, counters)
+        schedule_counters_reconcile(project_id)
+
+
+@receiver(post_save, sender=Prediction)
+def add_prediction_to_project_counters(sender, instance, created, **kwargs):
+    if settings.PROJECT_COUNTERS_MATERIALIZED and created:
+        add_counters(instance.project_id, {'total_predictions_number': 1})
+
+
+@receiver(post_delete, sender=Prediction)
+def remove_prediction_from_project_counters(sender, instance, **kwargs):
+    if settings.PROJECT_COUNTERS_MATERIALIZED:
+        add_counters(instance.project_id, {'total_predictions_number': 1}, -1)
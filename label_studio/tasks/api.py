@@ -95,6 +95,13 @@ logger = logging.getLogger(__name__)
                 in_=openapi.IN_QUERY,
                 description='Resolve task data URIs using Cloud Storage',
             ),
+            openapi.Parameter(
+                name='cursor',
+                type=openapi.TYPE_STRING,
+                in_=openapi.IN_QUERY,
+                description='Use keyset pagination: pass an empty value for the first page and `next` from the '
+                'previous response for the following pages',
+            ),
             openapi.Parameter(
                 name='fields',
                 type=openapi.TYPE_STRING,
@@ -266,16 +273,11 @@ class TaskAPI(generics.RetrieveUpdateDestroyAPIView):
 
     @staticmethod
     def prefetch(queryset):
-        return queryset.prefetch_related(
+        return queryset.select_related(*Task.get_storage_link_fields()).prefetch_related(
             'annotations',
             'predictions',
             'annotations__completed_by',
             'project',
-            'io_storages_azureblobimportstoragelink',
-            'io_storages_gcsimportstoragelink',
-            'io_storages_localfilesimportstoragelink',
-            'io_storages_redisimportstoragelink',
-            'io_storages_s3importstoragelink',
             'file_upload',
             'project__ml_backends',
         )
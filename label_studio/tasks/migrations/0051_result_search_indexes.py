@@ -0,0 +1,82 @@
+import logging
+
+from django.db import migrations
+from django.db.utils import OperationalError
+from core.utils.common import trigram_migration_operations
+
+logger = logging.getLogger(__name__)
+
+# annotations already have tasks_annotations_result_idx2 with the same expression
+SEARCH_TABLES = {'task_completion': 'task_completion_result_fts', 'prediction': 'prediction_result_fts'}
+
+
+def forwards_postgres(apps, schema_editor):
+    if not schema_editor.connection.vendor.startswith('postgres'):
+        logger.info('Database vendor: {}'.format(schema_editor.connection.vendor))
+        logger.info('Skipping migration without attempting to CREATE INDEX')
+        return
+
+    schema_editor.execute(
+        'create index concurrently if not exists prediction_result_text_idx '
+        'on prediction using gin (cast(result as text) gin_trgm_ops);'
+    )
+
+
+def backwards_postgres(apps, schema_editor):
+    if not schema_editor.connection.vendor.startswith('postgres'):
+        logger.info('Database vendor: {}'.format(schema_editor.connection.vendor))
+        logger.info('Skipping migration without attempting to DROP INDEX')
+        return
+
+    schema_editor.execute('drop index if exists prediction_result_text_idx;')
+
+
+def forwards_sqlite(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    for table, fts in SEARCH_TABLES.items():
+        try:
+            schema_editor.execute(
+                f"create virtual table {fts} using fts5(result, content='{table}', content_rowid='id', "
+                "tokenize='trigram');"
+            )
+        except OperationalError as exc:
+            # trigram tokenizer is available since SQLite 3.34, filters fall back to scanning results
+            logger.info(f'Skipping full-text search table {fts}: {exc}')
+            return
+
+        schema_editor.execute(
+            f'create trigger {fts}_insert after insert on {table} begin '
+            f'insert into {fts}(rowid, result) values (new.id, new.result); end;'
+        )
+        schema_editor.execute(
+            f'create trigger {fts}_delete after delete on {table} begin '
+            f"insert into {fts}({fts}, rowid, result) values ('delete', old.id, old.result); end;"
+        )
+        schema_editor.execute(
+            f'create trigger {fts}_update after update of result on {table} begin '
+            f"insert into {fts}({fts}, rowid, result) values ('delete', old.id, old.result); "
+            f'insert into {fts}(rowid, result) values (new.id, new.result); end;'
+        )
+        schema_editor.execute(f"insert into {fts}({fts}) values ('rebuild');")
+
+
+def backwards_sqlite(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    for fts in SEARCH_TABLES.values():
+        for trigger in ('insert', 'delete', 'update'):
+            schema_editor.execute(f'drop trigger if exists {fts}_{trigger};')
+        schema_editor.execute(f'drop table if exists {fts};')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [('tasks', '0050_populate_id_str')]
+
+    operations = trigram_migration_operations(migrations.RunPython(forwards_postgres, backwards_postgres)) + [
+        migrations.RunPython(forwards_sqlite, backwards_sqlite),
+    ]
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.db import migrations, models
+
+IS_SQLITE = settings.DJANGO_DB == settings.DJANGO_DB_SQLITE
+
+if IS_SQLITE:
+    from django.db.migrations import AddIndex
+else:
+    from django.contrib.postgres.operations import AddIndexConcurrently as AddIndex
+
+
+class Migration(migrations.Migration):
+    atomic = IS_SQLITE
+
+    dependencies = [
+        ('tasks', '0051_result_search_indexes'),
+    ]
+
+    operations = [
+        AddIndex(
+            model_name='task',
+            index=models.Index(fields=['project', 'updated_at'], name='task_project_64438a_idx'),
+        ),
+        AddIndex(
+            model_name='annotation',
+            index=models.Index(fields=['project', 'updated_at'], name='task_comple_project_fb05f0_idx'),
+        ),
+    ]
@@ -10,6 +10,19 @@ class TaskMixin:
     def update_is_labeled(self, *args, **kwargs) -> None:
         self.is_labeled = self._get_is_labeled_value()
 
+    @classmethod
+    def get_is_labeled_expression(cls, project):
+        """Expression of _get_is_labeled_value for set-based updates of the project tasks"""
+        from core.utils.db import SQCount
+        from django.db.models import F, OuterRef
+        from django.db.models.lookups import GreaterThanOrEqual
+        from tasks.models import Annotation, Q_finished_annotations
+
+        annotations = Annotation.objects.filter(task=OuterRef('id'))
+        if project.skip_queue != project.SkipQueue.IGNORE_SKIPPED:
+            annotations = annotations.filter(Q_finished_annotations)
+        return GreaterThanOrEqual(SQCount(annotations.values('id')), F('overlap'))
+
     @classmethod
     def post_process_bulk_update_stats(cls, tasks) -> None:
         pass
@@ -6,12 +6,12 @@ import logging
 import numbers
 import os
 import random
+import re
 import uuid
 from typing import Any, Mapping, Optional, cast
 from urllib.parse import urljoin
 
 import ujson as json
-from core.bulk_update_utils import bulk_update
 from core.current_request import get_current_request
 from core.feature_flags import flag_set
 from core.label_config import SINGLE_VALUED_TAGS
@@ -30,7 +30,7 @@ from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from django.core.files.storage import default_storage
 from django.db import OperationalError, models, transaction
-from django.db.models import JSONField, Q
+from django.db.models import Case, JSONField, Q, Value, When
 from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import Signal, receiver
 from django.urls import reverse
@@ -42,6 +42,9 @@ from tasks.choices import ActionType
 
 logger = logging.getLogger(__name__)
 
+# accessor names of the import storage links, see io_storages.base_models.ImportStorageLink
+STORAGE_LINK_PREFIX = '.*io_storages_'
+
 TaskMixin = load_func(settings.TASK_MIXIN)
 
 
@@ -182,6 +185,7 @@ class Task(TaskMixin, models.Model):
             models.Index(fields=['id', 'overlap']),
             models.Index(fields=['overlap']),
             models.Index(fields=['project', 'id']),
+            models.Index(fields=['project', 'updated_at']),
         ]
 
     @property
@@ -380,7 +384,16 @@ class Task(TaskMixin, models.Model):
 
     def get_storage_link(self):
         # TODO: how to get neatly any storage class here?
-        return find_first_one_to_one_related_field_by_prefix(self, '.*io_storages_')
+        return find_first_one_to_one_related_field_by_prefix(self, STORAGE_LINK_PREFIX)
+
+    @classmethod
+    def get_storage_link_fields(cls):
+        """Accessors of the storage links, select_related on them resolves get_storage_link without queries"""
+        return [
+            field.get_accessor_name()
+            for field in cls._meta.related_objects
+            if field.one_to_one and re.match(STORAGE_LINK_PREFIX, field.get_accessor_name())
+        ]
 
     @staticmethod
     def is_upload_file(filename):
@@ -406,7 +419,7 @@ class Task(TaskMixin, models.Model):
 
         if storage:
             return {
-                'url': storage.generate_http_url(url),
+                'url': storage.get_http_url(url),
                 'presign_ttl': storage.presign_ttl,
             }
 
@@ -427,6 +440,7 @@ class Task(TaskMixin, models.Model):
             return protected_data
         else:
             storage_objects = project.get_all_storage_objects(type_='import')
+            task_storage = self.get_storage(storage_objects)
 
             # try resolve URLs via storage associated with that task
             for field in task_data:
@@ -454,7 +468,7 @@ class Task(TaskMixin, models.Model):
                 # TODO: problem with current approach: it can be used only the first storage that get_storage_by_url
                 # TODO: returns. However, maybe the second storage will resolve uris properly.
                 # TODO: resolve_uri() already supports them
-                storage = self.storage or get_storage_by_url(task_data[field], storage_objects)
+                storage = task_storage or get_storage_by_url(task_data[field], storage_objects)
                 if storage:
                     try:
                         proxy_task = None
@@ -472,6 +486,16 @@ class Task(TaskMixin, models.Model):
                         task_data[field] = resolved_uri
             return task_data
 
+    def get_storage(self, storage_objects):
+        """Storage of the task, taken from the project storages if possible, so it isn't fetched for each task"""
+        storage_link = self.get_storage_link()
+        if storage_link:
+            storage_class = storage_link._meta.get_field('storage').related_model
+            for storage in storage_objects:
+                if isinstance(storage, storage_class) and storage.id == storage_link.storage_id:
+                    return storage
+        return self.storage
+
     @property
     def storage(self):
         # maybe task has storage link
@@ -689,6 +713,7 @@ class Annotation(AnnotationMixin, models.Model):
             models.Index(fields=['last_action']),
             models.Index(fields=['project', 'ground_truth']),
             models.Index(fields=['project', 'id']),
+            models.Index(fields=['project', 'updated_at']),
             models.Index(fields=['project', 'was_cancelled']),
             models.Index(fields=['task', 'completed_by']),
             models.Index(fields=['task', 'ground_truth']),
@@ -862,9 +887,19 @@ class AnnotationDraft(models.Model):
             super().delete(*args, **kwargs)
 
 
+class PredictionManager(models.Manager):
+    def bulk_create(self, objs, batch_size=None):
+        pre_bulk_create.send(sender=self.model, objs=objs, batch_size=batch_size)
+        res = super(PredictionManager, self).bulk_create(objs, batch_size)
+        post_bulk_create.send(sender=self.model, objs=objs, batch_size=batch_size)
+        return res
+
+
 class Prediction(models.Model):
     """ML backend / Prompts predictions"""
 
+    objects = PredictionManager()
+
     result = JSONField('result', null=True, default=dict, help_text='Prediction result')
     score = models.FloatField(_('score'), default=None, help_text='Prediction score', null=True)
     model_version = models.TextField(
@@ -1224,51 +1259,64 @@ def update_task_stats(task, stats=('is_labeled',), save=True):
         task.save()
 
 
+def get_is_labeled_expression(project):
+    """Expression of task.is_labeled for set-based updates of the project tasks"""
+    if project._can_use_overlap():
+        maximum_annotations = project.maximum_annotations
+        return Q(total_annotations__gte=maximum_annotations) | Q(total_annotations__gte=1, overlap=1)
+    return Task.get_is_labeled_expression(project)
+
+
+def update_is_labeled_batch(task_ids, project_id):
+    """Recompute is_labeled of the tasks with one UPDATE"""
+    from projects.models import Project
+
+    project = Project.objects.get(id=project_id)
+    is_labeled = Case(When(get_is_labeled_expression(project), then=Value(True)), default=Value(False))
+    return Task.objects.filter(id__in=task_ids).update(is_labeled=is_labeled)
+
+
 def bulk_update_stats_project_tasks(tasks, project=None):
     """bulk Task update accuracy
        ex: after change settings
-       apply several update queries size of batch
-       on updated Task objects
-       in single transaction as execute sql
+       apply one aggregate update query per batch of tasks
+       in single transaction, so the number of queries doesn't depend on annotations
     :param tasks:
     :return:
     """
     # recalc accuracy
-    if not tasks:
-        # break if tasks is empty
-        return
-    # get project if it's not in params
-    if project is None:
-        project = tasks[0].project
-
+    if isinstance(tasks, (list, tuple, set)):
+        if not tasks:
+            # break if tasks is empty
+            return
+        # get project if it's not in params
+        project = project or next(iter(tasks)).project
+        tasks = Task.objects.filter(id__in=[task.id for task in tasks])
+    elif project is None:
+        first_task = tasks.first()
+        if first_task is None:
+            return
+        project = first_task.project
+
+    is_labeled = Case(When(get_is_labeled_expression(project), then=Value(True)), default=Value(False))
+    task_ids = tasks.order_by('id').values_list('id', flat=True).distinct()
+    last_id = None
     with transaction.atomic():
-        use_overlap = project._can_use_overlap()
-        maximum_annotations = project.maximum_annotations
-        # update filters if we can use overlap
-        if use_overlap:
-            # finished tasks
-            finished_tasks = tasks.filter(
-                Q(total_annotations__gte=maximum_annotations) | Q(total_annotations__gte=1, overlap=1)
-            )
-            finished_tasks_ids = finished_tasks.values_list('id', flat=True)
-            tasks.update(is_labeled=Q(id__in=finished_tasks_ids))
-
-        else:
-            # update objects without saving if we can't use overlap
-            for task in tasks:
-                update_task_stats(task, save=False)
+        while True:
+            # keyset batches keep the IN lists short
+            batch = task_ids if last_id is None else task_ids.filter(id__gt=last_id)
+            batch = list(batch[: settings.BATCH_SIZE])
+            if not batch:
+                break
+            last_id = batch[-1]
             try:
-                # start update query batches
-                bulk_update(tasks, update_fields=['is_labeled'], batch_size=settings.BATCH_SIZE)
+                with transaction.atomic():
+                    Task.objects.filter(id__in=batch).update(is_labeled=is_labeled)
             except OperationalError:
-                logger.error('Operational error while updating tasks: {exc}', exc_info=True)
-                # try to update query batches one more time
+                logger.error('Operational error while updating tasks', exc_info=True)
+                # try to update the batch one more time
                 start_job_async_or_sync(
-                    bulk_update,
-                    tasks,
-                    in_seconds=settings.BATCH_JOB_RETRY_TIMEOUT,
-                    update_fields=['is_labeled'],
-                    batch_size=settings.BATCH_SIZE,
+                    update_is_labeled_batch, batch, project.id, in_seconds=settings.BATCH_JOB_RETRY_TIMEOUT
                 )
 
 
@@ -128,3 +128,104 @@ def test_views_total_counters(tasks_count, annotations_count, predictions_count,
     assert response_data['total'] == tasks_count, response_data
     assert response_data['total_annotations'] == tasks_count * annotations_count, response_data
     assert response_data['total_predictions'] == tasks_count * predictions_count, response_data
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('ordering', [[], ['-tasks:id'], ['tasks:data.text'], ['-tasks:total_annotations']])
+def test_views_tasks_api_keyset_pagination(business_client, project_id, ordering):
+    project = Project.objects.get(pk=project_id)
+    texts = ['c', 'a', None, 'b', 'a']
+    task_ids = [make_task({'data': {'text': text}}, project).id for text in texts]
+    make_annotation({'result': [{'r': 1}]}, task_ids[3])
+    make_prediction({'result': [{'r': 1}]}, task_ids[0])
+
+    response = business_client.post(
+        '/api/dm/views/',
+        data=json.dumps(dict(project=project_id, data={'ordering': ordering})),
+        content_type='application/json',
+    )
+    assert response.status_code == 201, response.content
+    view_id = response.json()['id']
+
+    expected = business_client.get(f'/api/tasks?view={view_id}&page_size=100').json()
+    expected_ids = [task['id'] for task in expected['tasks']]
+    # ties are broken by id in the keyset mode
+    if ordering == ['tasks:data.text']:
+        expected_ids = [task_ids[1], task_ids[4], task_ids[3], task_ids[0], task_ids[2]]
+    elif ordering == ['-tasks:total_annotations']:
+        expected_ids = [task_ids[3], task_ids[0], task_ids[1], task_ids[2], task_ids[4]]
+
+    ids, cursor = [], ''
+    while cursor is not None:
+        response = business_client.get(f'/api/tasks?view={view_id}&page_size=2&cursor={cursor}')
+        assert response.status_code == 200, response.content
+        data = response.json()
+        assert (data['total'], data['total_annotations'], data['total_predictions']) == (5, 1, 1)
+        assert len(data['tasks']) <= 2
+        ids += [task['id'] for task in data['tasks']]
+        cursor = data['next']
+    assert ids == expected_ids
+
+    response = business_client.get(f'/api/tasks?view={view_id}&cursor=broken')
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_views_tasks_api_query_count(business_client, project_id):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    project = Project.objects.get(pk=project_id)
+    response = business_client.post(
+        '/api/dm/views/',
+        data=json.dumps(dict(project=project_id, data={'ordering': ['-tasks:predictions_score']})),
+        content_type='application/json',
+    )
+    assert response.status_code == 201, response.content
+    view_id = response.json()['id']
+
+    def list_queries():
+        with CaptureQueriesContext(connection) as context:
+            response = business_client.get(f'/api/tasks?view={view_id}&page_size=2')
+        assert response.status_code == 200, response.content
+        return [query['sql'] for query in context.captured_queries]
+
+    def add_tasks(count):
+        for i in range(count):
+            task_id = make_task({'data': {'text': str(i)}}, project).id
+            make_prediction({'result': [{'r': i}], 'score': i / 10}, task_id)
+
+    add_tasks(2)
+    few = list_queries()
+    add_tasks(10)
+    many = list_queries()
+
+    assert len(many) == len(few), '\n'.join(many)
+    # annotate_queryset and the predictions score get the project from the params instead of probing the first task
+    assert [sql for sql in many if 'FROM "task"' in sql and sql.rstrip().endswith('LIMIT 1')] == []
+    # ML backend model versions are read once per request
+    assert sum('FROM "ml_mlbackend"' in sql for sql in many) <= 1
+
+
+@pytest.mark.django_db
+def test_task_list_resolves_storage_links_in_page_query(business_client, project_id, django_assert_num_queries):
+    from data_manager.api import TaskListAPI
+    from io_storages.localfiles.models import LocalFilesImportStorage, LocalFilesImportStorageLink
+    from io_storages.s3.models import S3ImportStorage, S3ImportStorageLink
+    from tasks.models import Task
+
+    project = Project.objects.get(pk=project_id)
+    s3_storage = S3ImportStorage.objects.create(project=project, bucket='bucket')
+    local_storage = LocalFilesImportStorage.objects.create(project=project, path='/tmp')
+    s3_task = make_task({'data': {'image': 's3://bucket/1.jpg'}}, project)
+    local_task = make_task({'data': {'image': '/data/local-files/?d=1.jpg'}}, project)
+    plain_task = make_task({'data': {'image': 'https://example.com/1.jpg'}}, project)
+    S3ImportStorageLink.objects.create(task=s3_task, key='1.jpg', storage=s3_storage)
+    LocalFilesImportStorageLink.objects.create(task=local_task, key='1.jpg', storage=local_storage)
+
+    assert 'io_storages_s3importstoragelink' in Task.get_storage_link_fields()
+    tasks = {task.id: task for task in TaskListAPI.prefetch(Task.objects.filter(project=project))}
+    with django_assert_num_queries(0):
+        assert tasks[s3_task.id].get_storage_link().storage_id == s3_storage.id
+        assert tasks[local_task.id].get_storage_link().storage_id == local_storage.id
+        assert tasks[plain_task.id].get_storage_link() is None
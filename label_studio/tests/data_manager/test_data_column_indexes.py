@@ -0,0 +1,90 @@
+"""This file and its contents are licensed under the Apache License 2.0. Please see the included NOTICE for copyright information and LICENSE for a copy of the license.
+"""
+import json
+
+import pytest
+from data_manager.models import DataColumnIndex
+from projects.models import Project
+
+from ..utils import make_task, project_id  # noqa
+
+pytestmark = pytest.mark.django_db
+
+
+def test_indexed_data_column_ordering_and_filters(business_client, project_id, django_capture_on_commit_callbacks):
+    project = Project.objects.get(pk=project_id)
+    # a string value makes the plain numeric cast fail on postgres
+    values = [3, 'n/a', 1.5, 2]
+    tasks = [make_task({'data': {'score': value}}, project) for value in values]
+    project.summary.update_data_columns(tasks)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        r = business_client.post(
+            '/api/dm/indexed-columns/',
+            data=json.dumps({'project': project_id, 'key': 'score'}),
+            content_type='application/json',
+        )
+    assert r.status_code == 201, r.content
+
+    r = business_client.get(f'/api/dm/indexed-columns/?project={project_id}')
+    assert r.status_code == 200, r.content
+    assert [(column['key'], column['type'], column['status']) for column in r.json()] == [
+        ('score', DataColumnIndex.Type.STRING, DataColumnIndex.Status.COMPLETED)
+    ]
+
+    r = business_client.post(
+        '/api/dm/indexed-columns/',
+        data=json.dumps({'project': project_id, 'key': 'missing'}),
+        content_type='application/json',
+    )
+    assert r.status_code == 400, r.content
+
+    # only numbers: the column is typed as Number and non numeric values are treated as empty
+    tasks[1].data = {'score': None}
+    tasks[1].save()
+    DataColumnIndex.objects.filter(project=project).update(status=DataColumnIndex.Status.FAILED)
+    with django_capture_on_commit_callbacks(execute=True):
+        business_client.post(
+            '/api/dm/indexed-columns/',
+            data=json.dumps({'project': project_id, 'key': 'score'}),
+            content_type='application/json',
+        )
+    column = DataColumnIndex.objects.get(project=project, key='score')
+    assert (column.type, column.status) == (DataColumnIndex.Type.NUMBER, DataColumnIndex.Status.COMPLETED)
+
+    r = business_client.post(
+        '/api/dm/views/',
+        data=json.dumps(
+            {
+                'project': project_id,
+                'data': {
+                    'ordering': ['tasks:data.score'],
+                    'columnsDisplayType': {'tasks:data.score': 'Number'},
+                    'filters': {
+                        'conjunction': 'and',
+                        'items': [
+                            {'filter': 'filter:tasks:data.score', 'operator': 'greater', 'value': 1, 'type': 'Number'}
+                        ],
+                    },
+                },
+            }
+        ),
+        content_type='application/json',
+    )
+    assert r.status_code == 201, r.content
+    view_id = r.json()['id']
+    r = business_client.get(f'/api/tasks/?view={view_id}')
+    assert [task['id'] for task in r.json()['tasks']] == [tasks[2].id, tasks[3].id, tasks[0].id]
+
+    # an imported string value changes the detected type
+    with django_capture_on_commit_callbacks(execute=True):
+        new_task = make_task({'data': {'score': '10'}}, project)
+    column = DataColumnIndex.objects.get(project=project, key='score')
+    assert (column.type, column.status) == (DataColumnIndex.Type.STRING, DataColumnIndex.Status.COMPLETED)
+    r = business_client.get(f'/api/tasks/?view={view_id}')
+    assert [task['id'] for task in r.json()['tasks']] == [tasks[2].id, tasks[3].id, tasks[0].id, new_task.id]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        r = business_client.delete(f'/api/dm/indexed-columns/?project={project_id}&key=score')
+    assert r.status_code == 204
+    assert not DataColumnIndex.objects.filter(project=project).exists()
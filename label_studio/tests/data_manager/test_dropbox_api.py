@@ -0,0 +1,106 @@
+"""This file and its contents are licensed under the Apache License 2.0. Please see the included NOTICE for copyright information and LICENSE for a copy of the license.
+"""
+import io
+import os
+import zipfile
+from unittest import mock
+
+import pytest
+from data_manager.thumbnails import Thumbnail, evict_thumbnails
+from django.http import FileResponse, StreamingHttpResponse
+from PIL import Image
+
+from ..utils import project_id  # noqa
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def dropbox_dir(settings, tmp_path):
+    settings.DROPBOX_THUMBNAIL_CACHE_DIR = str(tmp_path / 'thumbnails')
+    with mock.patch('data_manager.api.BASE_DROPBOX_DIR', str(tmp_path / 'dropbox')):
+        yield tmp_path / 'dropbox'
+
+
+def _png(size=(640, 480), color='red'):
+    f = io.BytesIO()
+    Image.new('RGB', size, color).save(f, 'PNG')
+    f.seek(0)
+    f.name = 'image.png'
+    return f
+
+
+def test_dropbox_upload_pregenerates_thumbnails(business_client, project_id, dropbox_dir):
+    r = business_client.post('/api/dm/dropbox/', data={'pk': project_id, 'files': [_png(), _png(color='blue')]})
+    assert r.status_code == 201, r.content
+
+    files = os.listdir(dropbox_dir / str(project_id))
+    assert len(files) == 2
+    for name in files:
+        assert Thumbnail(str(dropbox_dir / str(project_id) / name)).exists()
+
+    with mock.patch('data_manager.thumbnails.Image.open') as image_open:
+        r = business_client.get('/api/dm/thumbnail/', {'pk': project_id, 'image': files[0]})
+        assert r.status_code == 200
+        assert image_open.call_count == 0
+    with Image.open(io.BytesIO(b''.join(r.streaming_content))) as thumbnail:
+        assert thumbnail.size == (100, 75)
+    etag = r['ETag']
+
+    r = business_client.get('/api/dm/thumbnail/', {'pk': project_id, 'image': files[0]}, HTTP_IF_NONE_MATCH=etag)
+    assert r.status_code == 304
+
+    r = business_client.delete(f'/api/dm/dropbox/?pk={project_id}&image={files[0]}')
+    assert r.status_code == 204
+    assert len(os.listdir(dropbox_dir / str(project_id))) == 1
+
+
+def test_thumbnail_cache_evicts_least_recently_used(settings, tmp_path):
+    settings.DROPBOX_THUMBNAIL_CACHE_DIR = str(tmp_path / 'thumbnails')
+    thumbnails = []
+    for i in range(3):
+        path = tmp_path / f'{i}.png'
+        Image.new('RGB', (300, 300), (i * 80, 0, 0)).save(path)
+        thumbnail = Thumbnail(str(path))
+        thumbnail.generate()
+        os.utime(thumbnail.path, (1000 + i, 1000 + i))
+        thumbnails.append(thumbnail)
+    # the oldest thumbnail was used recently
+    thumbnails[0].touch()
+    # a thumbnail being rendered meanwhile
+    tmp_path = f'{thumbnails[2].path}.0.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(b'x' * 1000)
+    os.utime(tmp_path, (0, 0))
+
+    size = os.path.getsize(thumbnails[1].path)
+    assert evict_thumbnails(max_size=size * 2) >= 1
+    assert thumbnails[0].exists()
+    assert not thumbnails[1].exists()
+    assert os.path.exists(tmp_path)
+
+
+def test_dropbox_download_streams_stored_zip_and_reuses_it(business_client, project_id, dropbox_dir):
+    business_client.post('/api/dm/dropbox/', data={'pk': project_id, 'files': [_png(), _png(color='blue')]})
+
+    def download():
+        r = business_client.get('/api/dm/dropbox/', {'pk': project_id, 'download': True})
+        assert r.status_code == 200
+        return r, zipfile.ZipFile(io.BytesIO(b''.join(r.streaming_content)))
+
+    r, archive = download()
+    assert isinstance(r, StreamingHttpResponse) and not isinstance(r, FileResponse)
+    assert archive.testzip() is None
+    assert len(archive.infolist()) == 2
+    assert {info.compress_type for info in archive.infolist()} == {zipfile.ZIP_STORED}
+
+    # the saved archive is served until the dropbox changes
+    r, _ = download()
+    assert isinstance(r, FileResponse)
+
+    business_client.post('/api/dm/dropbox/', data={'pk': project_id, 'files': [_png(color='green')]})
+    r, archive = download()
+    assert not isinstance(r, FileResponse)
+    assert sorted(archive.namelist()) == sorted(
+        name for name in os.listdir(dropbox_dir / str(project_id)) if name.endswith('.png')
+    )
@@ -294,6 +294,48 @@ def test_views_ordering(ordering, element_index, undefined, business_client, pro
             },
             [2, 3, 4],
         ],
+        [
+            {
+                'conjunction': 'or',
+                'items': [
+                    {
+                        'filter': 'filter:tasks:predictions_results',
+                        'operator': 'contains',
+                        'type': 'String',
+                        'value': 'second',
+                    }
+                ],
+            },
+            [2],
+        ],
+        [
+            {
+                'conjunction': 'or',
+                'items': [
+                    {
+                        'filter': 'filter:tasks:predictions_results',
+                        'operator': 'not_contains',
+                        'type': 'String',
+                        'value': 'second',
+                    }
+                ],
+            },
+            [1, 3, 4],
+        ],
+        [
+            {
+                'conjunction': 'or',
+                'items': [
+                    {
+                        'filter': 'filter:tasks:annotations_results',
+                        'operator': 'contains',
+                        'type': 'String',
+                        'value': '2_',  # shorter than a trigram
+                    }
+                ],
+            },
+            [2],
+        ],
         [
             {
                 'conjunction': 'and',
@@ -0,0 +1,65 @@
+"""Compare visualization SQL engines on a synthetic project frame
+
+Usage (from label_studio directory):
+    python tests/loadtests/benchmark_visualization_sql.py [rows] [repeats]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from data_export.sql_engines import SQL_ENGINES, duckdb_loaded  # noqa: E402
+
+ROWS = 1000000 if len(sys.argv) <= 1 else int(sys.argv[1])
+REPEATS = 3 if len(sys.argv) <= 2 else int(sys.argv[2])
+
+QUERIES = [
+    'SELECT model_selected, COUNT(*) FROM df GROUP BY model_selected',
+    'SELECT "meta.source", AVG(score), MAX(score) FROM df GROUP BY "meta.source"',
+    'SELECT model_selected, "meta.source", COUNT(*) FROM df WHERE score > 0.5 GROUP BY 1, 2',
+]
+
+
+def make_project_frame(rows):
+    """Frame shaped like get_project_dataframe output: ids, JSON predictions, data.* keys and choices"""
+    rng = np.random.default_rng(42)
+    predictions = [[[{'from_name': 'model_selected', 'value': {'choices': ['0/2']}}]]] * rows
+    return pd.DataFrame(
+        {
+            'id': np.arange(1, rows + 1),
+            'predictions': predictions,
+            'image': [f's3://bucket/images/{i}.png' for i in range(rows)],
+            'meta.source': rng.choice(['camera', 'phone', 'scan', 'render'], rows),
+            'score': rng.random(rows),
+            'model_selected': rng.choice(['0/2', '1/2', '2/2'], rows),
+        }
+    )
+
+
+def run(engine_name, df):
+    engine = SQL_ENGINES[engine_name]()
+    timings = []
+    for _ in range(REPEATS):
+        for query in QUERIES:
+            start = time.perf_counter()
+            engine.execute(df, query, table_key='benchmark')
+            timings.append(time.perf_counter() - start)
+    engine.clear()
+    return timings
+
+
+if __name__ == '__main__':
+    df = make_project_frame(ROWS)
+    print(f'{ROWS} rows, {len(QUERIES)} queries x {REPEATS} repeats')
+
+    engines = ['pandasql', 'sqlite'] + (['duckdb'] if duckdb_loaded else [])
+    for name in engines:
+        timings = run(name, df)
+        print(
+            f'{name:>10}: first query {timings[0]:.3f}s, '
+            f'next queries avg {sum(timings[1:]) / max(len(timings) - 1, 1):.3f}s, total {sum(timings):.3f}s'
+        )
@@ -2,7 +2,7 @@ import json
 
 import pytest
 
-from label_studio.tests.utils import make_project, make_task
+from label_studio.tests.utils import make_project, make_task, register_ml_backend_mock
 
 
 @pytest.mark.django_db
@@ -89,3 +89,68 @@ def test_get_multiple_predictions_on_task(business_client, ml_backend_for_test_p
     assert payload['predictions'][0]['model_version'] == 'ModelA'
     assert payload['predictions'][1]['result'][0]['value']['choices'][0] == 'label_B'
     assert payload['predictions'][1]['model_version'] == 'ModelB'
+
+
+@pytest.mark.django_db
+def test_predict_tasks_in_chunks(business_client, ml_backend, settings):
+    from ml.models import MLBackend, MLBackendPredictionJob
+    from tasks.models import Prediction
+
+    settings.ML_PREDICTION_CHUNK_SIZE = 2
+    settings.ML_PREDICTION_CONCURRENCY = 2
+    url = 'http://test.ml.backend.for.chunks.com:9094'
+    register_ml_backend_mock(ml_backend, url=url, setup_model_version='ModelChunks')
+    requests_per_chunk = []
+
+    def predict(request, context):
+        tasks = request.json()['tasks']
+        requests_per_chunk.append(len(tasks))
+        return {
+            'results': [
+                {
+                    'model_version': 'ModelChunks',
+                    'score': 0.5,
+                    'result': [
+                        {'from_name': 'label', 'to_name': 'text', 'type': 'choices', 'value': {'choices': ['label_A']}}
+                    ],
+                }
+                for _ in tasks
+            ]
+        }
+
+    ml_backend.post(f'{url}/predict', json=predict)
+
+    project = make_project(
+        config=dict(
+            is_published=True,
+            label_config="""
+                <View>
+                  <Text name="text" value="$text"></Text>
+                  <Choices name="label" choice="single">
+                    <Choice value="label_A"></Choice>
+                    <Choice value="label_B"></Choice>
+                  </Choices>
+                </View>""",
+            title='test_predict_tasks_in_chunks',
+        ),
+        user=business_client.user,
+        use_ml_backend=False,
+    )
+    for i in range(5):
+        make_task({'data': {'text': f'test {i}'}}, project)
+    backend = MLBackend.objects.create(project=project, url=url, title='ModelChunks')
+
+    instances = backend.predict_tasks(project.tasks.all())
+    assert len(instances) == 5
+    assert sorted(requests_per_chunk) == [1, 2, 2]
+    assert Prediction.objects.filter(project=project, model_version='ModelChunks').count() == 5
+    job = MLBackendPredictionJob.objects.get(ml_backend=backend)
+    assert (job.status, job.total_tasks, job.processed_tasks, job.predicted_tasks) == (
+        MLBackendPredictionJob.Status.COMPLETED,
+        5,
+        5,
+        5,
+    )
+
+    # tasks with predictions of the current model version are skipped
+    assert backend.predict_tasks(project.tasks.all()) == 'ModelChunks'
@@ -185,3 +185,30 @@ def test_core_validate_upload_url(url, block_local_urls, raises_exc):
 
     with pytest.raises(raises_exc):
         validate_upload_url(url, block_local_urls=block_local_urls)
+
+
+@pytest.mark.django_db
+def test_flag_set_memoization(mocker, settings, business_client):
+    from core.current_request import _thread_locals
+    from core.feature_flags import base, flag_set
+    from django.test import RequestFactory
+
+    variation = mocker.patch.object(base.client, 'variation', return_value=True)
+    settings.FEATURE_FLAGS_CACHE_TTL = 5
+    base._anonymous_values.clear()
+
+    # the anonymous user is cached for the process
+    assert flag_set('fflag_test_memoization_short') and flag_set('fflag_test_memoization_short')
+    assert variation.call_count == 1
+
+    # users are cached for the request
+    _thread_locals.request = request = RequestFactory().get('/')
+    try:
+        for _ in range(3):
+            assert flag_set('fflag_test_memoization_short', business_client.user)
+        scope = base.get_flag_scope()
+        assert (scope.owner, scope.calls, scope.evaluations) == (request, 3, 1)
+    finally:
+        del _thread_locals.request
+        base.drop_flag_scope(None)
+    assert variation.call_count == 2
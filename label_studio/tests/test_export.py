@@ -1,6 +1,8 @@
 """This file and its contents are licensed under the Apache License 2.0. Please see the included NOTICE for copyright information and LICENSE for a copy of the license.
 """
 import json
+import time
+from datetime import timedelta
 
 import pytest
 from django.apps import apps
@@ -318,3 +320,157 @@ def test_export_with_predictions(
             assert task['predictions'][0]['score'] == predictions['score']
         else:
             assert task['predictions'] == []
+
+
+@pytest.mark.django_db
+def test_sharded_export_resume(business_client, configured_project, settings, monkeypatch):
+    from data_export.models import Export
+
+    settings.EXPORT_SHARD_SIZE = 1
+    task_ids = set(Task.objects.filter(project=configured_project).values_list('id', flat=True))
+    assert len(task_ids) > 1
+
+    # the first shard fails, the others are exported
+    serialize_tasks = Export.serialize_tasks
+    first_id = min(task_ids)
+
+    def failing_serialize_tasks(self, ids, *args):
+        if first_id in ids:
+            raise ValueError('Storage is not available')
+        return serialize_tasks(self, ids, *args)
+
+    monkeypatch.setattr(Export, 'serialize_tasks', failing_serialize_tasks)
+    r = business_client.post(
+        f'/api/projects/{configured_project.id}/exports/', data=json.dumps({}), content_type='application/json'
+    )
+    assert r.status_code == 201, r.content
+    export = Export.objects.get(id=r.json()['id'])
+    assert export.status == Export.Status.FAILED
+    statuses = [shard['status'] for shard in export.progress['shards']]
+    assert statuses == [Export.Status.FAILED] + [Export.Status.COMPLETED] * (len(task_ids) - 1)
+
+    # a shard is still exported by a job of the failed run
+    running = export.progress['shards'][1]
+    running.update(status=Export.Status.IN_PROGRESS, started_at=time.time())
+    export.save(update_fields=['progress'])
+    export.export_shard(1)
+    export.refresh_from_db()
+    assert export.progress['shards'][1]['status'] == Export.Status.IN_PROGRESS
+
+    monkeypatch.setattr(Export, 'serialize_tasks', serialize_tasks)
+    r = business_client.post(f'/api/projects/{configured_project.id}/exports/{export.id}/resume')
+    assert r.status_code == 200, r.content
+    # the resumed run doesn't export the running shard again, the running job finishes the export
+    assert r.json()['status'] == Export.Status.IN_PROGRESS
+    export.refresh_from_db()
+    export.complete_shard(1, running['file'], running['task_number'])
+    r = business_client.get(f'/api/projects/{configured_project.id}/exports/{export.id}')
+    assert r.json()['status'] == Export.Status.COMPLETED
+    assert r.json()['counters'] == {'task_number': len(task_ids)}
+    export.refresh_from_db()
+    assert {task['id'] for task in json.loads(export.file.read())} == task_ids
+
+    r = business_client.post(f'/api/projects/{configured_project.id}/exports/{export.id}/resume')
+    assert r.status_code == 400
+
+
+@pytest.mark.django_db
+def test_delta_export(business_client, configured_project, django_capture_on_commit_callbacks, settings):
+    from data_export.models import Export
+
+    settings.EXPORT_DELTA_WATERMARK_MARGIN = 0
+
+    def export(task_filter_options):
+        r = business_client.post(
+            f'/api/projects/{configured_project.id}/exports/',
+            data=json.dumps({'task_filter_options': task_filter_options}),
+            content_type='application/json',
+        )
+        assert r.status_code == 201, r.content
+        snapshot = Export.objects.get(id=r.json()['id'])
+        assert snapshot.status == Export.Status.COMPLETED
+        return snapshot, json.loads(snapshot.file.read())
+
+    base, tasks = export({})
+    assert base.watermark and base.since is None
+    assert len(tasks) > 2
+
+    changed, deleted = Task.objects.filter(project=configured_project).order_by('id')[:2]
+    Annotation.objects.create(task=changed, project=configured_project, result=[], completed_by=business_client.admin)
+    # tombstones are written when the deletion is committed
+    with django_capture_on_commit_callbacks(execute=True):
+        r = business_client.delete(f'/api/tasks/{deleted.id}/')
+    assert r.status_code == 204, r.content
+
+    delta, tasks = export({'base_export': base.id})
+    assert delta.since == base.watermark
+    assert [(task['id'], task.get('deleted', False)) for task in tasks] == [(changed.id, False), (deleted.id, True)]
+    assert delta.counters == {'task_number': 1, 'deleted_task_number': 1}
+
+    # changes made shortly before the watermark are exported again
+    settings.EXPORT_DELTA_WATERMARK_MARGIN = 3600
+    delta, tasks = export({'base_export': base.id})
+    assert delta.since == base.watermark - timedelta(hours=1)
+    assert {task['id'] for task in tasks} == set(
+        Task.objects.filter(project=configured_project).values_list('id', flat=True)
+    ) | {deleted.id}
+
+    r = business_client.post(
+        f'/api/projects/{configured_project.id}/exports/',
+        data=json.dumps({'task_filter_options': {'base_export': delta.id + 1}}),
+        content_type='application/json',
+    )
+    assert r.status_code == 400, r.content
+
+
+@pytest.mark.django_db
+def test_export_tombstones_are_written_in_bulk(
+    business_client, configured_project, django_capture_on_commit_callbacks, django_assert_num_queries
+):
+    from data_export.models import ExportTombstone, TombstoneBatch
+
+    Task.objects.create(data={'meta_info': 'meta info C', 'text': 'text C'}, project=configured_project)
+    tasks = list(Task.objects.filter(project=configured_project).order_by('id'))
+    for task in tasks:
+        Annotation.objects.create(task=task, project=configured_project, result=[], completed_by=business_client.admin)
+
+    # annotations of deleted tasks are covered by the task tombstones
+    with django_capture_on_commit_callbacks(execute=True):
+        Task.objects.filter(id__in=[tasks[0].id, tasks[1].id]).delete()
+    assert set(ExportTombstone.objects.values_list('task_id', 'annotation_id')) == {
+        (tasks[0].id, None),
+        (tasks[1].id, None),
+    }
+
+    Annotation.objects.create(task=tasks[2], project=configured_project, result=[], completed_by=business_client.admin)
+    with django_capture_on_commit_callbacks() as callbacks:
+        Annotation.objects.filter(task_id=tasks[2].id).delete()
+    batches = [callback for callback in callbacks if isinstance(callback, TombstoneBatch)]
+    assert len(batches) == 1
+    # task lookup and one INSERT
+    with django_assert_num_queries(2):
+        batches[0]()
+    assert ExportTombstone.objects.filter(task_id=tasks[2].id, annotation_id__isnull=False).count() == 2
+
+    # rows of a deleted project get no tombstones
+    with django_capture_on_commit_callbacks(execute=True):
+        configured_project.delete()
+    assert not ExportTombstone.objects.filter(project_id=configured_project.id).exists()
+
+
+@pytest.mark.django_db
+def test_project_delete_api_drops_export_data(business_client, configured_project, settings, tmp_path):
+    from data_export.dataframes import ProjectDataFrameCache
+    from data_export.models import ExportTombstone
+
+    settings.VISUALIZATION_CACHE_ENABLED = True
+    settings.VISUALIZATION_CACHE_DIR = str(tmp_path)
+    cache = ProjectDataFrameCache(configured_project.id)
+    cache.get()
+    ExportTombstone.objects.create(project_id=configured_project.id, task_id=0)
+
+    # the project is deleted with signals disconnected
+    r = business_client.delete(f'/api/projects/{configured_project.id}/')
+    assert r.status_code == 204, r.content
+    assert not ExportTombstone.objects.filter(project_id=configured_project.id).exists()
+    assert not cache.exists()
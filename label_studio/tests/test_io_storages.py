@@ -30,3 +30,191 @@ def test_gcs_storage_credentials_validation(business_client):
         'Google Application Credentials must be valid JSON string.'
         in r.json()['validation_errors']['non_field_errors'][0]
     )
+
+
+@pytest.mark.django_db
+def test_batched_import_storage_sync(business_client, settings, tmp_path):
+    from io_storages.localfiles.models import LocalFilesImportStorage
+    from tasks.models import Annotation, Prediction
+
+    settings.STORAGE_IMPORT_BATCH_SIZE = 2
+    settings.LOCAL_FILES_DOCUMENT_ROOT = str(tmp_path)
+    project = make_project({}, business_client.user, use_ml_backend=False)
+    result = [{'from_name': 'label', 'to_name': 'text', 'type': 'choices', 'value': {'choices': ['pos']}}]
+    for i in range(5):
+        task = {'data': {'text': f'text {i}'}}
+        if i == 0:
+            task['predictions'] = [{'result': result, 'score': 0.5, 'model_version': 'v1'}]
+            task['annotations'] = [{'result': result, 'completed_by': business_client.user.id}]
+        if i == 1:
+            task['annotations'] = [{'result': [], 'completed_by': business_client.user.id, 'was_cancelled': True}]
+        (tmp_path / f'{i}.json').write_text(json.dumps(task))
+
+    storage = LocalFilesImportStorage.objects.create(project=project, path=str(tmp_path), title='batched')
+    storage.scan_and_create_links()
+
+    tasks = project.tasks.order_by('inner_id')
+    assert [task.data['text'] for task in tasks] == [f'text {i}' for i in range(5)]
+    assert [task.inner_id for task in tasks] == [1, 2, 3, 4, 5]
+    assert storage.links.count() == 5
+    assert Prediction.objects.filter(task=tasks[0], model_version='v1').count() == 1
+    assert Annotation.objects.filter(task=tasks[0], completed_by=business_client.user).count() == 1
+    assert tasks[0].total_annotations == 1
+    # skipped annotations don't label tasks in the default project settings
+    assert tasks[1].cancelled_annotations == 1
+    assert [task.is_labeled for task in tasks] == [True, False, False, False, False]
+
+    # known keys are skipped on the next sync
+    (tmp_path / '5.json').write_text(json.dumps({'data': {'text': 'text 5'}}))
+    storage.scan_and_create_links()
+    storage.refresh_from_db()
+    assert project.tasks.count() == 6
+    assert storage.last_sync_count == 1
+    assert storage.meta['tasks_existed'] == 5
+
+
+@pytest.mark.django_db
+def test_batched_import_storage_sync_from_s3(business_client, settings, s3):
+    from io_storages.s3.models import S3ImportStorage
+
+    # objects are read from several threads at once
+    settings.STORAGE_IMPORT_BATCH_SIZE = 4
+    settings.STORAGE_IMPORT_CONCURRENCY = 4
+    bucket = 'pytest-s3-batched'
+    s3.create_bucket(Bucket=bucket)
+    for i in range(10):
+        s3.put_object(Bucket=bucket, Key=f'tasks/{i}.json', Body=json.dumps({'data': {'text': f'text {i}'}}))
+
+    project = make_project({}, business_client.user, use_ml_backend=False)
+    storage = S3ImportStorage.objects.create(project=project, bucket=bucket, prefix='tasks', use_blob_urls=False)
+    storage.scan_and_create_links()
+
+    assert sorted(task.data['text'] for task in project.tasks.all()) == sorted(f'text {i}' for i in range(10))
+    assert storage.links.count() == 10
+
+
+@pytest.mark.django_db
+def test_batched_import_storage_sync_skips_invalid_annotations(business_client, settings, tmp_path, mocker):
+    from io_storages.localfiles.models import LocalFilesImportStorage
+
+    settings.LOCAL_FILES_DOCUMENT_ROOT = str(tmp_path)
+    # ff_fix_back_dev_3342_storage_scan_with_invalid_annotations skips invalid annotations instead of failing
+    mocker.patch('io_storages.base_models.flag_set', return_value=True)
+    project = make_project({}, business_client.user, use_ml_backend=False)
+    result = [{'from_name': 'label', 'to_name': 'text', 'type': 'choices', 'value': {'choices': ['pos']}}]
+    task = {'data': {'text': 'text'}, 'annotations': [{'result': result, 'completed_by': 100500}]}
+    (tmp_path / 'invalid.json').write_text(json.dumps(task))
+
+    storage = LocalFilesImportStorage.objects.create(project=project, path=str(tmp_path), title='invalid')
+    storage.scan_and_create_links()
+
+    task = project.tasks.get()
+    assert task.annotations.count() == 0
+    assert task.total_annotations == 0
+    assert not task.is_labeled
+
+
+@pytest.mark.django_db
+def test_presign_cache(business_client, mocker):
+    from io_storages.presign_cache import presign_cache
+    from io_storages.s3.models import S3ImportStorage
+
+    project = make_project({}, business_client.user, use_ml_backend=False)
+    storage = S3ImportStorage.objects.create(project=project, bucket='bucket', presign_ttl=10)
+    generate = mocker.patch.object(
+        S3ImportStorage, 'generate_http_url', autospec=True, side_effect=lambda self, url: f'{url}?signature'
+    )
+    presign_cache.clear()
+
+    assert storage.get_http_url('s3://bucket/1.jpg') == 's3://bucket/1.jpg?signature'
+    assert storage.get_http_url('s3://bucket/1.jpg') == 's3://bucket/1.jpg?signature'
+    assert storage.get_http_url('s3://bucket/2.jpg') == 's3://bucket/2.jpg?signature'
+    assert generate.call_count == 2
+    assert presign_cache.get_stats()['hits'] == 1
+
+    # another TTL generates new signatures
+    storage.presign_ttl = 20
+    storage.get_http_url('s3://bucket/1.jpg')
+    assert generate.call_count == 3
+
+    # without presign the objects are inlined as data urls, they are never cached
+    storage.presign = False
+    storage.get_http_url('s3://bucket/1.jpg')
+    storage.get_http_url('s3://bucket/1.jpg')
+    assert generate.call_count == 5
+    assert presign_cache.get_stats()['size'] == 3
+
+
+@pytest.mark.django_db
+def test_storage_proxy(business_client, mocker, settings, tmp_path):
+    import base64
+
+    from io_storages.proxy_cache import MediaCache
+    from io_storages.s3.models import S3ImportStorage
+    from tasks.models import Task
+
+    settings.STORAGE_PROXY_CACHE_DIR = str(tmp_path)
+    project = make_project({}, business_client.user, use_ml_backend=False)
+    storage = S3ImportStorage.objects.create(project=project, bucket='bucket', presign=False)
+    task = Task.objects.create(project=project, data={'image': 's3://bucket/1.jpg'})
+    content = bytes(range(256)) * 4
+
+    def iter_object(self, uri, start=None, end=None):
+        yield content[start or 0 : (len(content) if end is None else end + 1)]
+
+    meta_mock = mocker.patch.object(
+        S3ImportStorage,
+        'get_object_meta',
+        return_value={'size': len(content), 'content_type': 'image/jpeg', 'version': 'v1'},
+    )
+    iter_mock = mocker.patch.object(S3ImportStorage, 'iter_object', autospec=True, side_effect=iter_object)
+    # the cache is filled in the request thread
+    executor = mocker.patch('io_storages.proxy_cache.get_fill_executor').return_value
+    executor.submit.side_effect = lambda fn: fn()
+
+    url = storage.resolve_uri('s3://bucket/1.jpg', task)
+    assert '/proxy/?fileuri=' in url
+    fileuri = base64.urlsafe_b64encode(b's3://bucket/1.jpg').decode()
+    path = f'/tasks/{task.id}/proxy/?fileuri={fileuri}'
+
+    # a range of the first request is read from the storage while the object is cached in the background
+    r = business_client.get(path, HTTP_RANGE='bytes=10-19')
+    assert r.status_code == 206
+    assert b''.join(r.streaming_content) == content[10:20]
+    assert r['Cache-Control'].startswith('private')
+    assert iter_mock.call_count == 2
+    r = business_client.get(path)
+    assert r.status_code == 200
+    assert b''.join(r.streaming_content) == content
+    assert iter_mock.call_count == 2
+    etag = r['ETag']
+    assert business_client.get(path, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+    # a replaced object gets a new ETag and is cached again while it's streamed
+    meta_mock.return_value = dict(meta_mock.return_value, version='v2')
+    r = business_client.get(path, HTTP_IF_NONE_MATCH=etag)
+    assert r.status_code == 200
+    assert r['ETag'] != etag
+    assert b''.join(r.streaming_content) == content
+    assert iter_mock.call_count == 3
+    business_client.get(path, HTTP_RANGE='bytes=0-')
+    assert iter_mock.call_count == 3
+
+    # objects over the cache limit are streamed by range from the storage
+    settings.STORAGE_PROXY_CACHE_MAX_OBJECT_SIZE = 100
+    fileuri = base64.urlsafe_b64encode(b's3://bucket/2.jpg').decode()
+    path = f'/tasks/{task.id}/proxy/?fileuri={fileuri}'
+    r = business_client.get(path, HTTP_RANGE='bytes=-24')
+    assert r.status_code == 206
+    assert r['Content-Range'] == f'bytes 1000-1023/{len(content)}'
+    assert b''.join(r.streaming_content) == content[-24:]
+    r = business_client.get(path, HTTP_RANGE='bytes=5000-')
+    assert r.status_code == 416
+    assert r['Content-Range'] == f'bytes */{len(content)}'
+
+    # the least recently used objects are evicted
+    cache = MediaCache(directory=str(tmp_path / 'lru'), max_bytes=20, max_object_bytes=10)
+    for key in ('a1', 'b2', 'c3'):
+        cache.put(key, [b'x' * 10], {})
+    assert cache.get('a1') == (None, None)
+    assert cache.get('c3')[0] is not None
@@ -1327,3 +1327,43 @@ def test_overlap_first(business_client, setup_before_upload, show_overlap_first)
     else:
         assert not all_tasks_with_overlap_are_labeled
         assert not all_tasks_without_overlap_are_not_labeled
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize('sampling', [Project.SEQUENCE, Project.UNIFORM, Project.UNCERTAINTY])
+def test_next_task_from_precomputed_queue(business_client, settings, sampling):
+    from fakeredis import FakeRedis
+    from projects.functions.next_task_queue import queue_key
+
+    settings.NEXT_TASK_QUEUE_ENABLED = True
+    settings.NEXT_TASK_QUEUE_WINDOW = 2
+    fake_redis = FakeRedis()
+    config = dict(_project_for_text_choices_onto_A_B_classes, sampling=sampling)
+    project = make_project(config, business_client.user, use_ml_backend=False)
+    tasks = [make_task({'data': {'meta_info': str(i), 'text': str(i)}}, project) for i in range(4)]
+    for task in tasks:
+        Prediction.objects.create(task=task, project=project, result=[], score=task.id / 10)
+
+    # refill jobs run synchronously
+    with mock.patch('core.redis._redis', fake_redis), mock.patch('core.redis.redis_connected', return_value=False):
+        key = queue_key(project.id, sampling)
+        served = []
+        for _ in range(4):
+            r = business_client.get(f'/api/projects/{project.id}/next')
+            assert r.status_code == 200, r.content
+            assert r.json()['queue'].startswith('Pre-computed')
+            task_id = r.json()['id']
+            served.append(task_id)
+            # the locked task is moved to the tail of the queue
+            assert int(fake_redis.lrange(key, -1, -1)[0].decode().split(':')[0]) == task_id
+
+            make_annotation({'completed_by': business_client.user, 'result': [{'r': 1}]}, task_id)
+            # labeled tasks leave the queue
+            assert task_id not in [int(e.decode().split(':')[0]) for e in fake_redis.lrange(key, 0, -1)]
+
+        assert sorted(served) == [task.id for task in tasks]
+        if sampling != Project.UNIFORM:
+            assert served == [task.id for task in tasks]
+
+        r = business_client.get(f'/api/projects/{project.id}/next')
+        assert r.status_code == 404
@@ -2,7 +2,8 @@ import json
 
 import pytest
 from django.db.models.query import QuerySet
-from tests.utils import make_project
+from projects.models import ProjectSummary
+from tests.utils import make_annotation, make_prediction, make_project, make_task
 from users.models import User
 
 
@@ -40,3 +41,88 @@ def test_project_all_members(business_client):
 
     assert isinstance(members, QuerySet)
     assert isinstance(members.first(), User)
+
+
+@pytest.mark.django_db
+def test_materialized_project_counters(business_client, settings):
+    settings.PROJECT_COUNTERS_MATERIALIZED = True
+    project = make_project({}, business_client.user, use_ml_backend=False)
+    tasks = [make_task({'data': {'text': f'text {i}'}}, project) for i in range(3)]
+    make_annotation({'result': [], 'completed_by': business_client.user}, tasks[0].id)
+
+    def get_counters():
+        r = business_client.get('/api/projects/')
+        assert r.status_code == 200
+        return next(item for item in r.json()['results'] if item['id'] == project.id)
+
+    # the first read reconciles the counters
+    counters = get_counters()
+    assert counters['task_number'] == 3
+    assert counters['total_annotations_number'] == 1
+    assert ProjectSummary.objects.get(project=project).counters_updated_at is not None
+
+    # signals maintain them afterwards
+    make_annotation({'result': [], 'completed_by': business_client.user, 'was_cancelled': True}, tasks[1].id)
+    make_prediction({'result': [], 'score': 0.5}, tasks[2].id)
+    tasks[2].delete()
+    counters = get_counters()
+    assert counters['task_number'] == 2
+    assert counters['total_annotations_number'] == 1
+    assert counters['skipped_annotations_number'] == 1
+    assert counters['total_predictions_number'] == 0
+
+
+@pytest.mark.django_db
+def test_rearrange_overlap_cohort(business_client, settings):
+    from core.models import AsyncMigrationStatus
+
+    settings.OVERLAP_REARRANGE_TRACKED_MIN_TASKS = 1
+    project = make_project(
+        {'maximum_annotations': 2, 'overlap_cohort_percentage': 100}, business_client.user, use_ml_backend=False
+    )
+    tasks = [make_task({'data': {'text': f'text {i}'}}, project) for i in range(10)]
+    annotation = {'result': [{'value': {'choices': ['pos']}}], 'completed_by': business_client.user}
+    for task in tasks[7:9]:
+        make_annotation(annotation, task.id)
+        make_annotation(annotation, task.id)
+    make_annotation(annotation, tasks[9].id)
+
+    project.overlap_cohort_percentage = 50
+    project._rearrange_overlap_cohort()
+
+    overlaps = dict(project.tasks.values_list('id', 'overlap'))
+    # finished tasks first, then the tasks with the most annotations, then by id
+    expected = {tasks[7].id, tasks[8].id, tasks[9].id, tasks[0].id, tasks[1].id}
+    assert {task_id for task_id, overlap in overlaps.items() if overlap == 2} == expected
+    assert set(project.tasks.filter(is_labeled=True).values_list('id', flat=True)) == {tasks[7].id, tasks[8].id}
+    assert AsyncMigrationStatus.objects.get(project=project, name='rearrange_overlap_cohort').status == (
+        AsyncMigrationStatus.STATUS_FINISHED
+    )
+
+
+@pytest.mark.django_db
+def test_bulk_is_labeled_query_count(business_client, monkeypatch):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from projects.models import Project
+    from tasks.models import Task, bulk_update_stats_project_tasks
+
+    monkeypatch.setattr(Project, '_can_use_overlap', lambda self: False)
+    project = make_project({'maximum_annotations': 1}, business_client.user, use_ml_backend=False)
+    annotation = {'result': [{'value': {'choices': ['pos']}}], 'completed_by': business_client.user}
+
+    def recompute(count):
+        for i in range(count):
+            task = make_task({'data': {'text': f'text {i}'}}, project)
+            make_annotation(annotation, task.id)
+            make_annotation(dict(annotation, was_cancelled=True), make_task({'data': {'text': 'skip'}}, project).id)
+        project.tasks.update(is_labeled=False)
+        with CaptureQueriesContext(connection) as context:
+            bulk_update_stats_project_tasks(project.tasks.all(), project=project)
+        return len(context.captured_queries)
+
+    few = recompute(2)
+    assert recompute(20) == few
+    # skipped annotations don't label tasks
+    assert Task.objects.filter(project=project, is_labeled=True).count() == 22
+    assert Task.objects.filter(project=project, is_labeled=False).count() == 22
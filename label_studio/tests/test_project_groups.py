@@ -0,0 +1,134 @@
+import json
+import random
+
+import pytest
+from projects.api import ProjectGroupListAPI
+from projects.functions.group_ranks import MAX_RANK_LENGTH, initial_ranks, rank_between, ranks_after
+from projects.models import ProjectGroup, ProjectGroupList
+from users.models import User
+
+pytestmark = pytest.mark.django_db
+
+
+def _make_groups(count):
+    return [ProjectGroup.objects.create(name=f'group {i}') for i in range(count)]
+
+
+def _ops(client, **data):
+    r = client.post('/api/project-groups/ops/', data=json.dumps(data), content_type='application/json')
+    assert r.status_code == 200, r.content
+    return [group['id'] for group in r.json()]
+
+
+def test_rank_between_keeps_order():
+    ranks = initial_ranks(5)
+    assert ranks == sorted(ranks)
+    rng = random.Random(42)
+    for _ in range(500):
+        i = rng.randrange(len(ranks) + 1)
+        before = ranks[i - 1] if i > 0 else None
+        after = ranks[i] if i < len(ranks) else None
+        rank = rank_between(before, after)
+        assert (before is None or before < rank) and (after is None or rank < after)
+        ranks.insert(i, rank)
+    assert ranks == sorted(ranks)
+    assert len(set(ranks)) == len(ranks)
+
+    appended = ranks_after(ranks[-1], 100)
+    assert appended == sorted(appended) and appended[0] > ranks[-1]
+
+    with pytest.raises(ValueError):
+        rank_between('b', 'a')
+
+
+def test_project_group_list_ordering(business_client):
+    groups = _make_groups(4)
+    ids = [group.id for group in groups]
+
+    r = business_client.get('/api/project-groups/')
+    assert r.status_code == 200
+    assert [group['id'] for group in r.json()] == ids
+
+    # move the last group in front of the first one, then back after the second one
+    assert _ops(business_client, op='move', id=ids[3], next=ids[0]) == [ids[3], ids[0], ids[1], ids[2]]
+    assert _ops(business_client, op='move', id=ids[3], prev=ids[1]) == [ids[0], ids[1], ids[3], ids[2]]
+    assert _ops(business_client, op='swap', a=ids[0], b=ids[2]) == [ids[2], ids[1], ids[3], ids[0]]
+
+    # groups created later appear on top for existing users
+    r = business_client.post('/api/project-groups/', data={'name': 'new group'})
+    assert r.status_code == 201
+    new_id = r.json()['id']
+    r = business_client.get('/api/project-groups/')
+    assert [group['id'] for group in r.json()] == [new_id, ids[2], ids[1], ids[3], ids[0]]
+
+    assert _ops(business_client, op='reset') == sorted([new_id] + ids)
+
+
+def test_project_group_list_query_count(business_client, django_assert_num_queries):
+    groups = _make_groups(20)
+    ProjectGroupListAPI().initialize_user_group_list(business_client.user)
+    user = business_client.user
+
+    with django_assert_num_queries(1):
+        ordered = ProjectGroupListAPI().get_ordered_groups(user)
+    assert [group.id for group in ordered] == [group.id for group in groups]
+
+    # a move rewrites the rank of the moved node only
+    nodes_before = dict(ProjectGroupList.objects.filter(user=user).values_list('group_id', 'rank'))
+    _ops(business_client, op='move', id=groups[0].id, prev=groups[10].id)
+    nodes_after = dict(ProjectGroupList.objects.filter(user=user).values_list('group_id', 'rank'))
+    assert {k for k in nodes_before if nodes_before[k] != nodes_after[k]} == {groups[0].id}
+
+
+def test_project_group_fan_out_query_count(business_client, django_assert_num_queries):
+    users = [User.objects.create(email=f'user{i}@pytest.net', username=f'user{i}') for i in range(30)]
+    groups = _make_groups(30)
+    api = ProjectGroupListAPI()
+
+    # last rank, missing groups and one INSERT however many groups exist
+    with django_assert_num_queries(3):
+        api.initialize_user_group_list(users[0])
+    with django_assert_num_queries(2):
+        api.initialize_user_group_list(users[0])
+    for user in users[1:10]:
+        api.initialize_user_group_list(user)
+
+    # first rank of every materialized list and one INSERT however many users exist
+    new_group = ProjectGroup.objects.create(name='new group')
+    with django_assert_num_queries(2):
+        api.add_group_to_all_users(new_group)
+
+    assert ProjectGroupList.objects.filter(group=new_group).count() == 10
+    for user in users[:10]:
+        assert [group.id for group in api.get_ordered_groups(user)] == [new_group.id] + [g.id for g in groups]
+    # lists of the other users are created on the first read
+    assert [group.id for group in api.get_ordered_groups(users[20])] == []
+    api.initialize_user_group_list(users[20])
+    assert [group.id for group in api.get_ordered_groups(users[20])] == [g.id for g in groups] + [new_group.id]
+
+
+def test_project_group_ranks_stay_short(business_client):
+    user = business_client.user
+    api = ProjectGroupListAPI()
+    groups = _make_groups(2)
+    api.initialize_user_group_list(user)
+
+    # every new group is prepended to the list, the ranks are renumbered on the next read
+    for i in range(MAX_RANK_LENGTH * 8):
+        group = ProjectGroup.objects.create(name=f'new group {i}')
+        api.add_group_to_all_users(group)
+        groups.insert(0, group)
+    ranks = list(ProjectGroupList.objects.filter(user=user).values_list('rank', flat=True))
+    assert max(len(rank) for rank in ranks) > MAX_RANK_LENGTH
+    api.initialize_user_group_list(user)
+    ranks = list(ProjectGroupList.objects.filter(user=user).values_list('rank', flat=True))
+    assert max(len(rank) for rank in ranks) <= MAX_RANK_LENGTH + 1
+    assert [group.id for group in api.get_ordered_groups(user)] == [group.id for group in groups]
+
+    # moving a group back and forth between the same neighbours
+    for _ in range(MAX_RANK_LENGTH * 8):
+        _ops(business_client, op='move', id=groups[0].id, prev=groups[1].id)
+        _ops(business_client, op='move', id=groups[1].id, prev=groups[0].id)
+    ranks = list(ProjectGroupList.objects.filter(user=user).values_list('rank', flat=True))
+    assert max(len(rank) for rank in ranks) <= MAX_RANK_LENGTH + 1
+    assert [group.id for group in api.get_ordered_groups(user)] == [group.id for group in groups]
@@ -0,0 +1,259 @@
+import json
+from unittest import mock
+
+import pandas as pd
+import pytest
+from data_export.api import iter_categorical_distributions
+from data_export.dataframes import (
+    ProjectDataFrameCache,
+    build_dataframe,
+    get_categorical_columns,
+    mark_project_dirty,
+    profile_columns,
+)
+from data_export.sql_engines import SQL_ENGINES
+from tasks.models import Prediction, Task
+from tests.conftest import project_choices
+from tests.utils import make_annotation, make_prediction, make_project, make_task
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+@pytest.fixture
+def visualization_cache_dir(settings, tmp_path):
+    settings.VISUALIZATION_CACHE_ENABLED = True
+    settings.VISUALIZATION_CACHE_DIR = str(tmp_path)
+    return tmp_path
+
+
+def _choice_result(choice):
+    return [{'from_name': 'animals', 'to_name': 'xxx', 'type': 'choices', 'value': {'choices': [choice]}}]
+
+
+def test_visualization_snapshot_is_patched_by_signals(business_client, visualization_cache_dir):
+    project = make_project(project_choices(), business_client.user, use_ml_backend=False)
+    task_a = make_task({'data': {'text': 'A', 'score': 1}}, project)
+    task_b = make_task({'data': {'text': 'B', 'score': 2}}, project)
+    make_annotation({'result': _choice_result('pos'), 'completed_by': business_client.user}, task_a.id)
+
+    cache = ProjectDataFrameCache(project.id)
+    df = cache.get(only_finished=False)
+    assert cache.exists()
+    assert list(df['id']) == [task_a.id, task_b.id]
+    assert list(cache.get(only_finished=True)['id']) == [task_a.id]
+
+    # annotation signal patches only the changed task
+    make_annotation({'result': _choice_result('neg'), 'completed_by': business_client.user}, task_b.id)
+    task_a.data = {'text': 'A', 'score': 10}
+    task_a.save()
+    df = cache.get(only_finished=True)
+    assert list(df['id']) == [task_a.id, task_b.id]
+    assert list(df['animals']) == ['pos', 'neg']
+    assert list(df['score']) == [10, 2]
+
+    # tasks created and deleted bypassing signals are picked up too
+    Task.objects.bulk_create([Task(data={'text': 'C', 'score': 3}, project=project)])
+    df = cache.get(only_finished=False)
+    assert list(df['text']) == ['A', 'B', 'C']
+
+    Task.objects.filter(id=task_b.id).delete()
+    df = cache.get(only_finished=False)
+    assert list(df['text']) == ['A', 'C']
+
+
+def test_visualization_snapshot_sees_bulk_changes(business_client, visualization_cache_dir, settings):
+    settings.VISUALIZATION_CACHE_LOADED_PROJECTS = 1
+    project = make_project(project_choices(), business_client.user, use_ml_backend=False)
+    task = make_task({'data': {'text': 'A', 'score': 1}}, project)
+    cache = ProjectDataFrameCache(project.id)
+    assert list(cache.get(only_finished=False)['predictions'].apply(len)) == [0]
+    version = cache.version()
+
+    # bulk created predictions are logged by post_bulk_create
+    Prediction.objects.bulk_create([Prediction(task=task, project=project, result=_choice_result('neg'))])
+    assert list(cache.get(only_finished=False)['predictions'].apply(len)) == [1]
+    assert cache.version() == version + 1
+
+    # bulk updates of task data mark the whole project
+    Task.objects.filter(id=task.id).update(data={'text': 'A', 'score': 2})
+    mark_project_dirty(project.id)
+    assert list(cache.get(only_finished=False)['score']) == [2]
+    assert cache.version() == version + 2
+
+    # only the most recently used frames stay in memory
+    other_project = make_project(project_choices(), business_client.user, use_ml_backend=False)
+    make_task({'data': {'text': 'B', 'score': 3}}, other_project)
+    ProjectDataFrameCache(other_project.id).get(only_finished=False)
+    assert list(ProjectDataFrameCache._loaded) == [other_project.id]
+
+
+def test_visualization_snapshot_keeps_changes_made_during_first_build(business_client, visualization_cache_dir):
+    from data_export import dataframes
+
+    project = make_project(project_choices(), business_client.user, use_ml_backend=False)
+    task = make_task({'data': {'text': 'A', 'score': 1}}, project)
+    cache = ProjectDataFrameCache(project.id)
+    build_dataframe = dataframes.build_dataframe
+
+    def build_and_edit(queryset, batch_size=None):
+        # the task is changed after the full build has read it
+        df = build_dataframe(queryset, batch_size)
+        Task.objects.filter(id=task.id).update(data={'text': 'A', 'score': 2})
+        cache.mark_dirty([task.id])
+        return df
+
+    with mock.patch('data_export.dataframes.build_dataframe', side_effect=build_and_edit):
+        assert list(cache.get(only_finished=False)['score']) == [1]
+    assert list(cache.get(only_finished=False)['score']) == [2]
+    assert not list(visualization_cache_dir.glob('*.tmp'))
+
+
+def test_visualization_api_uses_snapshot(business_client, visualization_cache_dir):
+    project = make_project(project_choices(), business_client.user, use_ml_backend=False)
+    for i in range(4):
+        task = make_task({'data': {'text': f'text {i}', 'group': 'x' if i % 2 else 'y'}}, project)
+        make_annotation({'result': _choice_result('pos'), 'completed_by': business_client.user}, task.id)
+
+    r = business_client.post(
+        f'/api/projects/{project.id}/visualize/',
+        data=json.dumps({'sql_query': 'SELECT "group", COUNT(*) FROM df GROUP BY "group" ORDER BY "group"'}),
+        content_type='application/json',
+    )
+    assert r.status_code == 200, r.content
+    assert r.json()['data'] == [{'X': 'x', 'Y': 2}, {'X': 'y', 'Y': 2}]
+    assert ProjectDataFrameCache(project.id).exists()
+
+
+@pytest.mark.parametrize('engine_name', ['sqlite', 'duckdb', 'pandasql'])
+def test_sql_engines_keep_xyz_contract(engine_name):
+    if engine_name == 'duckdb':
+        pytest.importorskip('duckdb')
+    if engine_name == 'pandasql':
+        pytest.importorskip('pandasql')
+    engine = SQL_ENGINES[engine_name]()
+    df = pd.DataFrame(
+        {
+            'id': [1, 2, 3],
+            'group': ['a', 'b', 'a'],
+            'score': [1.0, 2.0, 3.0],
+            'predictions': [[{'score': 1}], [], [{'score': 2}]],
+        }
+    )
+
+    for _ in range(2):
+        result = engine.execute(df, 'SELECT "group", SUM(score), COUNT(*) FROM df GROUP BY 1 ORDER BY 1', table_key=1)
+        assert result.to_dict(orient='records') == [{'X': 'a', 'Y': 4.0, 'Z': 2}, {'X': 'b', 'Y': 2.0, 'Z': 1}]
+
+    result = engine.execute(df, 'SELECT id AS Y, "group" AS X FROM df WHERE predictions = \'[]\'')
+    assert result.to_dict(orient='records') == [{'Y': 2, 'X': 'b'}]
+    engine.clear()
+
+
+@pytest.mark.parametrize('engine_name', ['sqlite', 'duckdb'])
+def test_sql_engines_are_read_only(engine_name):
+    if engine_name == 'duckdb':
+        pytest.importorskip('duckdb')
+    engine = SQL_ENGINES[engine_name]()
+    df = pd.DataFrame({'id': [1, 2, 3]})
+
+    for query in ('DELETE FROM df', 'DROP TABLE df', 'SELECT 1; DELETE FROM df', 'PRAGMA query_only=OFF'):
+        with pytest.raises(Exception):
+            engine.execute(df, query, table_key=1)
+
+    result = engine.execute(df, 'SELECT COUNT(*) FROM df', table_key=1)
+    assert result.to_dict(orient='records') == [{'X': 3}]
+    engine.clear()
+
+
+def test_build_dataframe_query_count_does_not_depend_on_tasks(business_client, django_assert_num_queries):
+    project = make_project(project_choices(), business_client.user, use_ml_backend=False)
+    for i in range(10):
+        task = make_task({'data': {'text': f'text {i}'}}, project)
+        make_annotation({'result': _choice_result('pos'), 'completed_by': business_client.user}, task.id)
+        make_prediction({'result': _choice_result('neg')}, task.id)
+
+    # 3 queries per batch: tasks, annotations, predictions, and one more to detect the end
+    with django_assert_num_queries(3 * 2 + 1):
+        df = build_dataframe(Task.objects.filter(project=project), batch_size=5)
+
+    assert len(df) == 10
+    assert list(df['animals']) == ['pos'] * 10
+    assert list(df['predictions'].apply(len)) == [1] * 10
+
+
+def test_categorical_columns_profile_is_cached_until_tasks_change(business_client, visualization_cache_dir):
+    project = make_project(project_choices(), business_client.user, use_ml_backend=False)
+    for i in range(10):
+        make_task({'data': {'text': f'text {i}', 'group': 'x' if i % 2 else 'y', 'tags': [i]}}, project)
+
+    with mock.patch('data_export.api.profile_columns', wraps=profile_columns) as profiler:
+        for _ in range(2):
+            r = business_client.get(f'/api/projects/{project.id}/visualize/')
+            assert r.status_code == 200
+            assert r.json() == {'categorical_columns': ['group']}
+        assert profiler.call_count == 1
+
+        make_task({'data': {'text': 'text 10', 'group': 'x', 'tags': [10]}}, project)
+        r = business_client.get(f'/api/projects/{project.id}/visualize/')
+        assert r.json() == {'categorical_columns': ['group']}
+        assert profiler.call_count == 2
+
+
+def test_profile_columns():
+    df = pd.DataFrame({'a': [1, 1, 2, 2], 'b': ['x', 'x', 'x', 'y'], 'c': [[1], [2], [3], [4]]})
+    profile = profile_columns(df)
+    assert profile == {
+        'rows': 4,
+        'columns': {
+            'a': {'hashable': True, 'cardinality': 2, 'min_count': 2},
+            'b': {'hashable': True, 'cardinality': 2, 'min_count': 1},
+            'c': {'hashable': False, 'cardinality': None, 'min_count': None},
+        },
+    }
+    assert get_categorical_columns(profile) == []
+
+
+def test_visualization_report_is_rendered_and_downloaded(business_client, visualization_cache_dir):
+    project = make_project(project_choices(), business_client.user, use_ml_backend=False)
+    for i in range(6):
+        task = make_task({'data': {'text': f'text {i}', 'group': 'xyz'[i % 3]}}, project)
+        make_annotation(
+            {'result': _choice_result('pos' if i % 2 else 'neg'), 'completed_by': business_client.user}, task.id
+        )
+
+    r = business_client.post(
+        f'/api/projects/{project.id}/visualize/reports/',
+        data=json.dumps({'column_key': 'animals', 'category': 'missing'}),
+        content_type='application/json',
+    )
+    assert r.status_code == 400
+
+    r = business_client.post(
+        f'/api/projects/{project.id}/visualize/reports/',
+        data=json.dumps({'column_key': 'animals', 'category': 'group'}),
+        content_type='application/json',
+    )
+    assert r.status_code == 201, r.content
+    report_id = r.json()['id']
+
+    r = business_client.get(f'/api/projects/{project.id}/visualize/reports/{report_id}')
+    assert r.status_code == 200
+    assert r.json()['status'] == 'completed'
+    assert r.json()['counters'] == {'pages': 3, 'total': 3}
+
+    r = business_client.get(f'/api/projects/{project.id}/visualize/reports/{report_id}/download')
+    assert r.status_code == 200
+    content = b''.join(r.streaming_content)
+    assert content.startswith(b'%PDF')
+    assert content.count(b'/Type /Page\n') + content.count(b'/Type /Page ') == 3
+
+
+def test_categorical_distributions_match_per_category_counts():
+    df = pd.DataFrame({'label': ['a', 'b', 'a', 'a', 'b', 'c'], 'group': [1, 1, 2, 2, 2, 1]})
+    pages = list(iter_categorical_distributions(df, 'label', 'group'))
+    assert [title for title, _ in pages] == [
+        'Distribution of label for group = 1',
+        'Distribution of label for group = 2',
+    ]
+    for (_, counts), group in zip(pages, [1, 2]):
+        assert counts.to_dict() == df[df['group'] == group]['label'].value_counts().to_dict()
@@ -98,6 +98,25 @@ def test_exception_catch(organization_webhook):
     assert result is None
 
 
+@pytest.mark.django_db
+def test_emit_webhooks_concurrently_with_retries(settings, organization_webhook, project_webhook):
+    settings.WEBHOOK_RETRY_BACKOFF = 0
+    with requests_mock.Mocker(real_http=True) as m:
+        m.register_uri('POST', organization_webhook.url, [{'status_code': 502}, {'status_code': 200}])
+        m.register_uri('POST', project_webhook.url, status_code=503)
+        emit_webhooks(
+            organization_webhook.organization,
+            project_webhook.project,
+            WebhookAction.PROJECT_UPDATED,
+            {'data': 'test'},
+        )
+
+    urls = [request.url for request in m.request_history]
+    assert urls.count(organization_webhook.url) == 2
+    # the last response is repeated, so every retry fails
+    assert urls.count(project_webhook.url) == settings.WEBHOOK_RETRIES + 1
+
+
 # PROJECT CREATE/UPDATE/DELETE API
 @pytest.mark.django_db
 def test_webhooks_for_projects(configured_project, business_client, organization_webhook):
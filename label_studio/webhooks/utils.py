@@ -1,15 +1,32 @@
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
+from urllib.parse import urlsplit
 
 import requests
 from core.feature_flags import flag_set
-from core.redis import start_job_async_or_sync
+from core.redis import (
+    redis_connected,
+    redis_delete,
+    redis_hgetall,
+    redis_hincrby,
+    redis_pop_all,
+    redis_rpush,
+    redis_set,
+    start_job_async_or_sync,
+)
 from core.utils.common import load_func
 from django.conf import settings
 from django.db.models import Q
+from requests.adapters import HTTPAdapter
 
 from .models import Webhook, WebhookAction
 
+_sessions = {}
+_sessions_lock = threading.Lock()
+
 
 def get_active_webhooks(organization, project, action):
     """Return all active webhooks for organization or project by action.
@@ -37,9 +54,47 @@ def get_active_webhooks(organization, project, action):
     ).distinct()
 
 
+def get_session(url):
+    """Session shared by all webhooks of the host, so deliveries reuse pooled keep-alive connections"""
+    parts = urlsplit(url)
+    host = (parts.scheme, parts.netloc)
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(settings.WEBHOOK_CONCURRENCY, 1))
+            session.mount(f'{parts.scheme}://', adapter)
+            _sessions[host] = session
+    return session
+
+
+def stats_key(webhook_id):
+    return f'webhook_stats:{webhook_id}'
+
+
+def record_webhook_delivery(webhook, latency, failed, retries):
+    counters = {'sent': 1, 'failed': int(failed), 'retries': retries, 'latency_ms': int(latency * 1000)}
+    try:
+        redis_hincrby(stats_key(webhook.id), counters)
+    except Exception as exc:
+        logging.debug(f'Failed to record stats of webhook {webhook.id}: {exc}')
+
+
+def get_webhook_stats(webhook_id):
+    """Delivery counters of the webhook: sent requests, failed ones, retries and average latency in ms"""
+    stats = {
+        field.decode() if isinstance(field, bytes) else field: int(value)
+        for field, value in redis_hgetall(stats_key(webhook_id)).items()
+    }
+    stats['avg_latency_ms'] = stats.get('latency_ms', 0) / stats['sent'] if stats.get('sent') else None
+    return stats
+
+
 def run_webhook_sync(webhook, action, payload=None):
     """Run one webhook for action.
 
+    Connection errors, timeouts and 5xx responses are retried WEBHOOK_RETRIES times with exponential backoff.
+
     This function must not raise any exceptions.
     """
     data = {
@@ -47,17 +102,45 @@ def run_webhook_sync(webhook, action, payload=None):
     }
     if webhook.send_payload and payload:
         data.update(payload)
-    try:
-        logging.debug('Run webhook %s for action %s', webhook.id, action)
-        return requests.post(
-            webhook.url,
-            headers=webhook.headers,
-            json=data,
-            timeout=settings.WEBHOOK_TIMEOUT,
-        )
-    except requests.RequestException as exc:
-        logging.error(exc, exc_info=True)
-        return
+
+    logging.debug('Run webhook %s for action %s', webhook.id, action)
+    session = get_session(webhook.url)
+    response = None
+    attempt = 0
+    start = time.perf_counter()
+    while True:
+        try:
+            response = session.post(
+                webhook.url,
+                headers=webhook.headers,
+                json=data,
+                timeout=settings.WEBHOOK_TIMEOUT,
+            )
+            error = None if response.status_code < 500 else f'status code {response.status_code}'
+        except requests.RequestException as exc:
+            response, error = None, exc
+            # only the failures of the transport are worth retrying
+            if not isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+                break
+        if error is None or attempt >= settings.WEBHOOK_RETRIES:
+            break
+        time.sleep(settings.WEBHOOK_RETRY_BACKOFF * 2**attempt)
+        attempt += 1
+
+    failed = response is None or response.status_code >= 400
+    if error is not None:
+        logging.error(f'Webhook {webhook.id} failed after {attempt + 1} attempts: {error}')
+    record_webhook_delivery(webhook, time.perf_counter() - start, failed, attempt)
+    return response
+
+
+def run_webhooks_sync(webhooks, action, payload=None):
+    """Run the webhooks for action in parallel, so a slow endpoint doesn't delay the others"""
+    webhooks = list(webhooks)
+    if len(webhooks) <= 1 or settings.WEBHOOK_CONCURRENCY <= 1:
+        return [run_webhook_sync(webhook, action, payload) for webhook in webhooks]
+    with ThreadPoolExecutor(max_workers=min(settings.WEBHOOK_CONCURRENCY, len(webhooks))) as executor:
+        return list(executor.map(lambda webhook: run_webhook_sync(webhook, action, payload), webhooks))
 
 
 def emit_webhooks_sync(organization, project, action, payload):
@@ -67,8 +150,7 @@ def emit_webhooks_sync(organization, project, action, payload):
     webhooks = get_active_webhooks(organization, project, action)
     if project and payload and webhooks.filter(send_payload=True).exists():
         payload['project'] = load_func(settings.WEBHOOK_SERIALIZERS['project'])(instance=project).data
-    for wh in webhooks:
-        run_webhook_sync(wh, action, payload)
+    run_webhooks_sync(webhooks, action, payload)
 
 
 def emit_webhooks_for_instance_sync(organization, project, action, instance=None):
@@ -79,6 +161,10 @@ def emit_webhooks_for_instance_sync(organization, project, action, instance=None
     webhooks = get_active_webhooks(organization, project, action)
     if not webhooks.exists():
         return
+    run_webhooks_sync(webhooks, action, get_instance_payload(webhooks, project, action, instance))
+
+
+def get_instance_payload(webhooks, project, action, instance=None):
     payload = {}
     # if instances and there is a webhook that sends payload
     # get serialized payload
@@ -94,8 +180,58 @@ def emit_webhooks_for_instance_sync(organization, project, action, instance=None
                 payload[key] = value['serializer'](
                     instance=get_nested_field(instance, value['field']), many=value['many']
                 ).data
-    for wh in webhooks:
-        run_webhook_sync(wh, action, payload)
+    return payload
+
+
+def coalesced_annotations_key(project_id):
+    return f'webhook_coalesced_annotations:{project_id}'
+
+
+def coalesce_annotation_created(organization, project, instance):
+    """Collect ANNOTATION_CREATED events of the project for WEBHOOK_COALESCE_WINDOW seconds.
+
+    The first event of a window schedules flush_coalesced_annotations.
+    :return: True if the event is collected and must not be sent now
+    """
+    if settings.WEBHOOK_COALESCE_WINDOW <= 0 or project is None or instance is None or not redis_connected():
+        return False
+    if not get_active_webhooks(organization, project, WebhookAction.ANNOTATION_CREATED).exists():
+        return True
+    key = coalesced_annotations_key(project.id)
+    redis_rpush(key, instance.id)
+    window = settings.WEBHOOK_COALESCE_WINDOW
+    # the flag expires if the scheduled job is lost, so the next event schedules a new one
+    if redis_set(f'{key}:scheduled', 1, ttl=int(window * 2) + 60, nx=True):
+        start_job_async_or_sync(
+            flush_coalesced_annotations, organization.id, project.id, in_seconds=window, queue_name='high'
+        )
+    return True
+
+
+def flush_coalesced_annotations(organization_id, project_id):
+    """Send ANNOTATION_CREATED events collected in the window as one ANNOTATIONS_CREATED payload"""
+    from organizations.models import Organization
+    from projects.models import Project
+    from tasks.models import Annotation
+
+    key = coalesced_annotations_key(project_id)
+    # events pushed from now on schedule the next flush
+    redis_delete(f'{key}:scheduled')
+    annotation_ids = {int(annotation_id) for annotation_id in redis_pop_all(key)}
+    organization = Organization.objects.filter(id=organization_id).first()
+    project = Project.objects.filter(id=project_id).first()
+    if not annotation_ids or organization is None or project is None:
+        return
+
+    # annotations deleted during the window are not sent
+    annotations = list(
+        Annotation.objects.filter(id__in=annotation_ids).select_related('task', 'project').order_by('id')
+    )
+    webhooks = get_active_webhooks(organization, project, WebhookAction.ANNOTATION_CREATED)
+    if not annotations or not webhooks.exists():
+        return
+    payload = get_instance_payload(webhooks, project, WebhookAction.ANNOTATIONS_CREATED, annotations)
+    run_webhooks_sync(webhooks, WebhookAction.ANNOTATIONS_CREATED, payload)
 
 
 def run_webhook(webhook, action, payload=None):
@@ -124,6 +260,8 @@ def emit_webhooks_for_instance(organization, project, action, instance=None):
 
     Will run all selected webhooks in an RQ worker.
     """
+    if action == WebhookAction.ANNOTATION_CREATED and coalesce_annotation_created(organization, project, instance):
+        return
     if flag_set('fflag_fix_back_lsdv_4604_excess_sql_queries_in_api_short'):
         start_job_async_or_sync(emit_webhooks_for_instance_sync, organization, project, action, instance)
     else: